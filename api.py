@@ -1,28 +1,105 @@
 import os
 import re
-import smtplib
+import json
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from calculators.europe_calculator import FreightCalculator
-from calculators.multimodal_calculator import MultimodalFreightCalculator
+from calculators.multimodal_calculator import MultimodalFreightCalculator, NEAREST_PORTS_DEFAULT, SCENARIO_OVERRIDES, SCENARIO_TOP_CHANGES, MONTE_CARLO_SAMPLES
 from calculators.asian_calculator import AsianFreightCalculator
 
 from email.message import EmailMessage
 from disposable_email_domains import blocklist
-from core.email_verifiers import verify_email, is_disposable, validate_email
+from core.email_verifiers import verify_email, is_disposable, validate_email, verify_emails_bulk, mx_cache
+from core.capture import capture_log, init_capture
+from core.deadline import Deadline
+from core.mailer import MailDispatcher, flush_on_exit
+from core.metrics import register_collector, register_stats, format_labels, request_timings
+from core.profiling import init_request_diagnostics, server_timing
+from core.quote_log import QuoteLog, collect_request_timings
+from core.tariffs import data_version
+from core.diagnostics import start_tracing, data_attributes, memory_report, DEFAULT_TOP
+from core.geocoding import geocoding_dispatcher
+from core.routing import distance_cache
+from core.suggest import build_port_index, build_city_index, build_postal_indexes, DEFAULT_LIMIT, MAX_LIMIT
 
 api_bp = Blueprint('api', __name__)
+# ?debug=timing breakdowns and the sampling profiler for /calculate_rate_* routes
+init_request_diagnostics(api_bp)
+# CAPTURE=1: record request bodies and upstream answers for python -m core.replay
+init_capture(api_bp)
+register_stats('freight_capture', capture_log.stats, 'Traffic capture counter')
 
+start_tracing()  # MEMORY_TRACE=1: tracemalloc baseline before the data is loaded
 europe_freight_calculator = FreightCalculator()
 asian_freight_calculator = AsianFreightCalculator()
 multimodal_freight_calculator = MultimodalFreightCalculator()
 
+# Prefix indexes for /suggest, built once from the data the calculators already hold
+port_suggestions = build_port_index(multimodal_freight_calculator.ports)
+city_suggestions = build_city_index(asian_freight_calculator.asia_df)
+postal_suggestions = build_postal_indexes(asian_freight_calculator.postal_db)
+
 DEFAULT_SENDER = 'requests@tspgrupp.ee'
 EMAIL_PASSWORD = 'TsTr25Req'
+# Outbound mail is sent by a background thread over a persistent SMTP connection
+mail_dispatcher = MailDispatcher(username=os.environ.get('SMTP_USER', DEFAULT_SENDER), password=EMAIL_PASSWORD)
+flush_on_exit(mail_dispatcher)
+register_stats('freight_mail', mail_dispatcher.stats, 'Outbound mail queue counter')
+# Audit log of issued quotes (QUOTE_LOG=1), written by a background thread
+quote_log = QuoteLog()
+register_stats('freight_quote_log', quote_log.stats, 'Quote audit log counter')
+if quote_log.enabled:
+    api_bp.before_request(collect_request_timings)
+# Total time budget (seconds) for geocoding + routing of one Europe quote
+EUROPE_QUOTE_BUDGET = float(os.environ.get('EUROPE_QUOTE_BUDGET', '2.0'))
+NEAREST_PORTS_MAX = 20
+SCENARIO_TOP_CHANGES_MAX = 1000
+RANGE_SAMPLES_MAX = 100000
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+BULK_EMAIL_LIMIT = 100000
+
+def collect_app_metrics():
+    """Cache sizes and tariff data version, read when /metrics is scraped."""
+    version = data_version()
+    return [
+        ('freight_geocode_cache_entries', 'gauge', 'Cached Europe geocodes', len(europe_freight_calculator.geocode_cache)),
+        ('freight_multimodal_quote_cache_entries', 'gauge', 'Cached multimodal quotes', len(multimodal_freight_calculator.quote_cache)),
+        ('freight_tariff_data_info', 'gauge', 'Version of the loaded tariff data', (format_labels(['version'], [version['version']]), 1)),
+        ('freight_tariff_data_updated_seconds', 'gauge', 'Modification time of the newest tariff file', version['updated_at']),
+    ]
+
+register_collector(collect_app_metrics)
+data_version()  # hashed once, right after the calculators have loaded the same files
 
 def validate_postal_code(code: str) -> bool:
     return bool(re.fullmatch(r"[A-Za-z0-9\- ]{3,10}", code))
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def log_quote(endpoint: str, body: dict, result: dict) -> dict:
+    quote_log.record(endpoint, body, result, request_timings.get())
+    return result
+
+def stream_quote(estimate: dict, refine, endpoint: str) -> Response:
+    """Server-Sent Events: the instant estimate first, then the refined quote from `refine()`."""
+    body = request.get_json()
+
+    def generate():
+        yield sse_event('quote', dict(estimate, precision='estimate'))
+        try:
+            refined = refine()
+        except Exception as e:
+            refined = {'error': str(e)}
+        log_quote(endpoint, body, refined)
+        final = dict(refined, precision='final')
+        timing = server_timing()
+        if timing is not None:
+            final['server_timing'] = timing
+        yield sse_event('quote', final)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
 @api_bp.route('/validate_email', methods=['POST'])
 def validate_email_route():
     data = request.get_json()
@@ -36,6 +113,21 @@ def validate_email_route():
 
     return jsonify({'message': 'Valid email'}), 200
 
+@api_bp.route('/validate_emails_bulk', methods=['POST'])
+def validate_emails_bulk():
+    data = request.get_json()
+    emails = data.get('emails') if isinstance(data, dict) else None
+
+    if not isinstance(emails, list):
+        return jsonify({'error': 'emails must be a list of addresses'}), 400
+
+    if len(emails) > BULK_EMAIL_LIMIT:
+        return jsonify({'error': f'At most {BULK_EMAIL_LIMIT} addresses per request'}), 400
+
+    # NDJSON: one {"index", "email", "valid", "reason"} object per line, streamed as domains resolve
+    lines = (json.dumps(result) + '\n' for result in verify_emails_bulk(emails))
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson', headers=SSE_HEADERS)
+
 @api_bp.route('/calculate_rate_asia', methods=['POST'])
 def calculate_rate_asia():
     data = request.get_json()
@@ -53,11 +145,35 @@ def calculate_rate_asia():
             ldm=float(data['ldm']),
             weight=float(data['weight'])
         )
-        return jsonify(result)
+        return jsonify(log_quote('calculate_rate_asia', data, result))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
 
+@api_bp.route('/calculate_rate_asia/stream', methods=['POST'])
+def calculate_rate_asia_stream():
+    data = request.get_json()
+    required_fields = ['fromCountry', 'fromZip', 'ldm', 'weight', 'asiaCity', 'asiaCountry', 'email']
+
+    if not all(field in data for field in required_fields):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    try:
+        params = dict(
+            eu_postal=data['fromZip'].strip(),
+            eu_country=data['fromCountry'].strip().upper(),
+            asia_country=data['asiaCountry'].strip().upper(),
+            asia_city=data['asiaCity'].strip(),
+            ldm=float(data['ldm']),
+            weight=float(data['weight'])
+        )
+        # Validation errors surface here, before the stream starts
+        estimate = asian_freight_calculator.estimate(**params)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return stream_quote(estimate, lambda: asian_freight_calculator.calculate(**params), 'calculate_rate_asia')
+
 @api_bp.route('/calculate_rate_europe', methods=['POST'])
 def calculate_rate_europe():
     data = request.get_json()
@@ -68,6 +184,8 @@ def calculate_rate_europe():
     if not validate_postal_code(data['fromZip']) or not validate_postal_code(data['toZip']):
         return jsonify({'error': 'Invalid postal code format'}), 400
 
+    deadline = Deadline(EUROPE_QUOTE_BUDGET)
+
     try:
         calculated_data = europe_freight_calculator.get_rate_of_transportation(
             from_country_code=data['fromCountry'],
@@ -76,12 +194,63 @@ def calculate_rate_europe():
             to_postal_code=data['toZip'],
             ldm=float(data['ldm']),
             weight=float(data['weight']),
+            deadline=deadline,
+            fast=data.get('mode') == 'fast',
         )
-        return jsonify(calculated_data)
+        return jsonify(log_quote('calculate_rate_europe', data, calculated_data))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     return calculate_rate_europe()
 
+@api_bp.route('/calculate_rate_europe/stream', methods=['POST'])
+def calculate_rate_europe_stream():
+    data = request.get_json()
+    required_fields = ['fromCountry', 'toCountry', 'fromZip', 'toZip', 'ldm', 'weight']
+    if not all(field in data for field in required_fields):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    if not validate_postal_code(data['fromZip']) or not validate_postal_code(data['toZip']):
+        return jsonify({'error': 'Invalid postal code format'}), 400
+
+    deadline = Deadline(EUROPE_QUOTE_BUDGET)
+
+    try:
+        params = dict(
+            from_country_code=data['fromCountry'],
+            to_country_code=data['toCountry'],
+            from_postal_code=data['fromZip'],
+            to_postal_code=data['toZip'],
+            ldm=float(data['ldm']),
+            weight=float(data['weight'])
+        )
+        estimate = europe_freight_calculator.estimate_rate_of_transportation(**params)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    refine = lambda: europe_freight_calculator.get_rate_of_transportation(
+        **params, deadline=deadline, fast=data.get('mode') == 'fast')
+
+    # The estimate never waits for geocoding, so an unknown postal code gets the full quote instead
+    if 'error' in estimate:
+        return jsonify(log_quote('calculate_rate_europe', data, refine()))
+
+    return stream_quote(estimate, refine, 'calculate_rate_europe')
+
+@api_bp.route('/prepare_location', methods=['POST'])
+def prepare_location():
+    data = request.get_json()
+    country = data.get('country', '').strip().upper()
+    postal_code = data.get('zip', '').strip()
+
+    if not country or not validate_postal_code(postal_code):
+        return jsonify({'valid': False, 'error': 'Invalid postal code format'}), 400
+
+    # Called on blur: resolve the region now and let geocoding finish in the background
+    result = europe_freight_calculator.prepare_location(postal_code, country, Deadline(EUROPE_QUOTE_BUDGET))
+    if not result['valid']:
+        return jsonify({'valid': False, 'error': f'Postal code not found: {country}, {postal_code}'}), 404
+    return jsonify(result)
+
 @api_bp.route('/calculate_rate_multimodal', methods=['POST'])
 def calculate_rate_multimodal():
     data = request.get_json()
@@ -90,9 +259,19 @@ def calculate_rate_multimodal():
     if data['originPort'] == data['destinationPort']:
         return jsonify({'error': 'Origin and destination ports cannot be the same'}), 400
 
+    if data.get('range'):
+        try:
+            samples = range_samples(data.get('samples'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'samples must be an integer'}), 400
+
     try:
         calculated_data = multimodal_freight_calculator.calculate_freight_rate(origin=data['originPort'], destination=data['destinationPort'], container_type=data['containerType'])
-        return jsonify(calculated_data)
+        if data.get('range') and 'error' not in calculated_data:
+            # Optional P10/P50/P90 of the total under surcharge, index, seasonal and crisis uncertainty
+            calculated_data['range'] = multimodal_freight_calculator.freight_rate_range(
+                data['originPort'], data['destinationPort'], data['containerType'], samples)
+        return jsonify(log_quote('calculate_rate_multimodal', data, calculated_data))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -112,6 +291,105 @@ def calculate_rate_multimodal():
 
     return build('gmail', 'v1', credentials=creds)
 
+def range_samples(value):
+    """Monte Carlo sample count from a request, clamped to 100..RANGE_SAMPLES_MAX."""
+    return min(max(int(value or MONTE_CARLO_SAMPLES), 100), RANGE_SAMPLES_MAX)
+
+@api_bp.route('/multimodal_ranges', methods=['GET'])
+def multimodal_ranges():
+    """P10/P50/P90 range quotes from one origin port to every other port."""
+    origin = request.args.get('origin', '').strip().upper()
+    container_type = request.args.get('containerType', '40hc').strip().lower()
+    try:
+        samples = range_samples(request.args.get('samples'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'samples must be an integer'}), 400
+
+    result = multimodal_freight_calculator.freight_rate_ranges(origin, container_type, samples)
+    if isinstance(result, dict):
+        return jsonify(result), 400
+    return jsonify({'origin': origin, 'container_type': container_type, 'samples': samples, 'ranges': result})
+
+@api_bp.route('/multimodal_scenario', methods=['POST'])
+def multimodal_scenario():
+    """Re-price every port pair x container under index, crisis, fuel and seasonal overrides; diff vs today."""
+    data = request.get_json(silent=True) or {}
+    overrides = {key: data[key] for key in SCENARIO_OVERRIDES if data.get(key)}
+    try:
+        limit = min(max(int(data.get('limit', SCENARIO_TOP_CHANGES)), 0), SCENARIO_TOP_CHANGES_MAX)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    try:
+        return jsonify(multimodal_freight_calculator.price_scenario(overrides, limit))
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        return jsonify({'error': f'Invalid scenario: {e}'}), 400
+
+@api_bp.route('/nearest_ports', methods=['GET'])
+def nearest_ports():
+    country = request.args.get('country', '').strip().upper()
+    postal_code = request.args.get('zip', '').strip()
+
+    if not country or not validate_postal_code(postal_code):
+        return jsonify({'error': 'Invalid postal code format'}), 400
+
+    try:
+        k = min(max(int(request.args.get('k', NEAREST_PORTS_DEFAULT)), 1), NEAREST_PORTS_MAX)
+    except ValueError:
+        return jsonify({'error': 'k must be an integer'}), 400
+
+    # Only in-memory data: the endpoint feeds live suggestions and must not wait for geocoding
+    coords = europe_freight_calculator.get_postal_coordinates(postal_code, country)
+    if coords is None:
+        return jsonify({'error': f'Postal code not found: {country}, {postal_code}'}), 404
+
+    return jsonify({
+        'latitude': coords[0],
+        'longitude': coords[1],
+        'ports': multimodal_freight_calculator.nearest_ports(coords[0], coords[1], k)
+    })
+
+@api_bp.route('/diagnostics/memory', methods=['GET'])
+def memory_diagnostics():
+    structures = {
+        **data_attributes('europe', europe_freight_calculator),
+        **data_attributes('asia', asian_freight_calculator),
+        **data_attributes('multimodal', multimodal_freight_calculator),
+        'distance_cache': distance_cache.distances,
+        'geocoder_results': geocoding_dispatcher.results,
+        'mx_cache': mx_cache,
+        'suggest.ports': port_suggestions,
+        'suggest.cities': city_suggestions,
+        'suggest.postal': postal_suggestions,
+    }
+    return jsonify(memory_report(structures, request.args.get('top', DEFAULT_TOP, type=int)))
+
+@api_bp.route('/suggest', methods=['GET'])
+def suggest():
+    kind = request.args.get('type', '')
+    query = request.args.get('q', '')
+    country = request.args.get('country', '').strip().upper()
+
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    if kind == 'port':
+        results = port_suggestions.search(query, limit)
+    elif kind == 'city':
+        predicate = (lambda city: city['country_code'] == country) if country else None
+        results = city_suggestions.search(query, limit, predicate)
+    elif kind == 'postal':
+        if not country:
+            return jsonify({'error': 'country is required for postal code suggestions'}), 400
+        index = postal_suggestions.get(country)
+        results = index.search(query, limit) if index else []
+    else:
+        return jsonify({'error': 'type must be one of: port, city, postal'}), 400
+
+    return jsonify({'results': results})
+
 @api_bp.route('/send_email', methods=['POST'])
 def send_email():
     data = request.get_json()
@@ -144,13 +422,9 @@ def send_email():
     message['From'] = DEFAULT_SENDER
     message['Subject'] = subject
 
-    try:
-        with smtplib.SMTP_SSL('mail.tspgrupp.ee', 465) as smtp:
-            smtp.login(DEFAULT_SENDER, EMAIL_PASSWORD)
-            smtp.send_message(message)
-        return jsonify({'message': 'Email sent successfully'})
-    except Exception as e:
-        return jsonify({'error': f'Failed to send email: {str(e)}'}), 500
+    if not mail_dispatcher.send(message):
+        return jsonify({'error': 'Mail queue is full, please try again later'}), 503
+    return jsonify({'message': 'Email queued'}), 202
 
 @api_bp.route('/send_contact_form', methods=['POST'])
 def send_contact_form():
@@ -188,11 +462,7 @@ def send_contact_form():
     message['From'] = DEFAULT_SENDER
     message['Subject'] = f'Contact Form Submission from {name}'
 
-    try:
-        with smtplib.SMTP_SSL('mail.tspgrupp.ee', 465) as smtp:
-            smtp.login(DEFAULT_SENDER, EMAIL_PASSWORD)
-            smtp.send_message(message)
-        return jsonify({'message': 'Thank you! Your message has been sent.'})
-    except Exception as e:
-        return jsonify({'error': f'Failed to send email: {str(e)}'}), 500
+    if not mail_dispatcher.send(message):
+        return jsonify({'error': 'Mail queue is full, please try again later'}), 503
+    return jsonify({'message': 'Thank you! Your message has been sent.'}), 202
     
\ No newline at end of file
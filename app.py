@@ -1,29 +1,26 @@
-from flask import Flask, render_template
+from flask import Flask, Response, render_template
 import json
 import os
-import csv
 
-from api import api_bp
+from api import api_bp, europe_freight_calculator, multimodal_freight_calculator
+from core.metrics import render as render_metrics
+from core.warmup import start_background_warmup
 
 app = Flask(__name__)
 app.register_blueprint(api_bp, url_prefix='/api')
 
+# Prefetch geocodes, road distances and multimodal quotes for popular lanes
+if os.environ.get('WARMUP_ON_BOOT') == '1':
+    start_background_warmup(europe_freight_calculator, multimodal_freight_calculator)
+
 def load_countries(filename):
     filepath = os.path.join(app.root_path, 'data', filename)
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def load_expanded_ports_csv(filename):
-    filepath = os.path.join(app.root_path, 'data', filename)
-    with open(filepath, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        return list(reader)
-    
-def load_asian_cities(filename):
-    filepath = os.path.join(app.root_path, 'data', filename)
-    with open(filepath, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -45,12 +42,10 @@ def multimodal_calculator():
         ('40dv', '40\' Dry Van (40DV)'),
         ('40hc', '40\' High Cube (40HC)')
     ]
-    expanded_ports = load_expanded_ports_csv('ports.csv')
-
+    # Ports are suggested by /api/suggest instead of being rendered into the page
     return render_template('multimodal_calculator.html',
                          title="Multimodal Transportation",
                          description="Calculate multimodal shipping costs",
-                         expanded_ports=expanded_ports,
                          container_types=container_types)
 
 @app.route('/europe_calculator')
@@ -65,12 +60,10 @@ def europe_calculator():
 def asia_calculator():
     european_countries = load_countries('european_countries.json')
     asian_countries = load_countries('asian_countries.json')
-    asian_cities = load_asian_cities('central_asia_cities.csv')
 
     return render_template('asia_calculator.html',
                          title="Europe to Asia Transportation",
                          description="Calculate shipping costs from Europe to Central Asia",
-                         asian_cities=asian_cities,
                          origin_countries=european_countries,
                          destination_countries=asian_countries)
 
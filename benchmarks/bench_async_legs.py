@@ -0,0 +1,83 @@
+"""Sequential vs concurrent network legs against a local stub with artificial latency.
+
+    python -m benchmarks.bench_async_legs --osrm-latency 0.3 --nominatim-latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.stub_upstreams import StubUpstreams
+
+
+def timed(func, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--osrm-latency', type=float, default=0.3)
+    parser.add_argument('--nominatim-latency', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with StubUpstreams(osrm_latency=args.osrm_latency, nominatim_latency=args.nominatim_latency) as stub:
+        os.environ.update(stub.environ())
+        os.environ['NOMINATIM_RPS'] = '1000'  # the stub has no usage policy
+        # Imported only now so the calculators pick up the stub endpoints
+        from calculators.asian_calculator import AsianFreightCalculator
+        from calculators.europe_calculator import FreightCalculator
+        from core.geocoding import geocoding_dispatcher
+        from core.routing import distance_cache
+
+        asian = AsianFreightCalculator()
+        europe = FreightCalculator()
+        europe.save_geocode_cache = lambda: None  # keep the on-disk caches free of stub data
+        distance_cache.save = lambda: None
+        geocoding_dispatcher.workers = 4  # let concurrent geocodes overlap against the stub
+        origin = (52.52, 13.40)
+
+        # Every call uses fresh addresses and coordinates so no cache short-circuits the legs
+        def asian_sequential(i):
+            gebze = geocoding_dispatcher.geocode(f"41400 Gebze Türkiye {i}")
+            city = geocoding_dispatcher.geocode(f"Almaty {i}, KZ")
+            asian.get_route_distance((origin[0], origin[1] + i / 100), gebze)
+            asian.get_route_distance(gebze, city)
+
+        def asian_concurrent(i):
+            geocoding_dispatcher.results.clear()
+            asian.get_total_route_distance((origin[0], origin[1] - i / 100), f"Tashkent {i}, UZ")
+
+        def europe_sequential(i):
+            europe.get_coordinates(f"10115, Berlin seq {i}, DE")
+            europe.get_coordinates(f"75001, Paris seq {i}, FR")
+
+        def europe_concurrent(i):
+            async def both():
+                await asyncio.gather(
+                    asyncio.to_thread(europe.get_coordinates, f"10115, Berlin {i}, DE"),
+                    asyncio.to_thread(europe.get_coordinates, f"75001, Paris {i}, FR"),
+                )
+            asyncio.run(both())
+
+        results = {
+            'asia_route_sequential': timed(asian_sequential, args.repeat),
+            'asia_route_concurrent': timed(asian_concurrent, args.repeat),
+            'europe_geocode_sequential': timed(europe_sequential, args.repeat),
+            'europe_geocode_concurrent': timed(europe_concurrent, args.repeat),
+        }
+
+    print(f"Stub latency: OSRM {args.osrm_latency}s, Nominatim {args.nominatim_latency}s (median of {args.repeat})")
+    for name, seconds in results.items():
+        print(f"{name:<28} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""p50/p99 latency of the multimodal quote endpoint with the quote log off and on.
+
+    python -m benchmarks.bench_quote_log --threads 8 --requests 2000 --rounds 3
+
+Rounds alternate between the two modes so drift affects both alike. Records go
+to a temporary directory.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+def run_round(client_factory, bodies, threads, requests_per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        client = client_factory()
+        rng = random.Random(seed)
+        local = []
+        for _ in range(requests_per_thread):
+            body = rng.choice(bodies)
+            start = time.perf_counter()
+            client.post('/api/calculate_rate_multimodal', json=body)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per thread and round')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--lanes', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        os.environ['QUOTE_LOG'] = '1'
+        os.environ['QUOTE_LOG_DIR'] = log_dir
+        from flask import Flask
+        import api
+
+        app = Flask(__name__)
+        app.register_blueprint(api.api_bp, url_prefix='/api')
+        ports = list(api.multimodal_freight_calculator.ports)
+        rng = random.Random(42)
+        bodies = []
+        while len(bodies) < args.lanes:
+            origin, destination = rng.sample(ports, 2)
+            bodies.append({'originPort': origin, 'destinationPort': destination, 'containerType': '40hc'})
+
+        results = {False: [], True: []}
+        run_round(app.test_client, bodies, args.threads, args.requests // 10)  # warm the quote cache
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                api.quote_log.enabled = enabled
+                results[enabled] += run_round(app.test_client, bodies, args.threads, args.requests)
+        api.quote_log.flush()
+        stats = api.quote_log.stats()
+
+    print(f"{args.threads} threads x {args.requests} requests x {args.rounds} rounds per mode")
+    for enabled, latencies in results.items():
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f"quote log {'on ' if enabled else 'off'}  p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+    print(f"written {stats['written']} records in {stats['batches']} fsynced batches, dropped {stats['dropped']}")
+
+
+if __name__ == '__main__':
+    main()
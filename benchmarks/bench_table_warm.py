@@ -0,0 +1,59 @@
+"""Warm the distance cache for N lanes via OSRM /table vs one /route call per lane.
+
+    python -m benchmarks.bench_table_warm --lanes 10000 --osrm-latency 0.05
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.stub_upstreams import StubUpstreams
+
+
+def random_points(count, rng):
+    return [(round(rng.uniform(40, 60), 5), round(rng.uniform(-5, 30), 5)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lanes', type=int, default=10000)
+    parser.add_argument('--origins', type=int, default=200)
+    parser.add_argument('--destinations', type=int, default=200)
+    parser.add_argument('--osrm-latency', type=float, default=0.05)
+    parser.add_argument('--route-sample', type=int, default=20,
+                        help='per-lane /route calls actually made; the rest is extrapolated')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    origins = random_points(args.origins, rng)
+    destinations = random_points(args.destinations, rng)
+    lanes = list({(rng.choice(origins), rng.choice(destinations)) for _ in range(args.lanes)})
+
+    with StubUpstreams(osrm_latency=args.osrm_latency) as stub:
+        os.environ.update(stub.environ())
+        import requests
+        from core.routing import DistanceCache, OSRMTableClient
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = DistanceCache(os.path.join(tmp, 'distance_cache.pkl'))
+            client = OSRMTableClient(base_url=stub.url, cache=cache)
+
+            start = time.perf_counter()
+            added = client.warm_lanes(lanes, save=False)  # measures the fetch only; nothing to persist
+            table_seconds = time.perf_counter() - start
+            table_requests = stub.requests.get('table', 0)
+
+            start = time.perf_counter()
+            for (lat1, lon1), (lat2, lon2) in lanes[:args.route_sample]:
+                requests.get(f"{stub.url}/route/v1/car/{lon1},{lat1};{lon2},{lat2}", timeout=10).json()
+            route_seconds = (time.perf_counter() - start) / args.route_sample * len(lanes)
+
+    print(f"{len(lanes)} unique lanes, stub OSRM latency {args.osrm_latency}s")
+    print(f"/table: {table_requests} requests, {added} distances cached, {table_seconds:.2f} s")
+    print(f"/route: {len(lanes)} requests, ~{route_seconds:.0f} s (extrapolated from {args.route_sample})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Compare two benchmarks.suite result files and flag regressions.
+
+    python -m benchmarks.compare base.json head.json --threshold 0.10
+
+Exits with status 1 when any benchmark's median (or --metric) got slower than
+base by more than the threshold, so it can gate CI.
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.suite import format_seconds
+
+
+def compare(base, head, threshold, metric='median'):
+    """[(name, base seconds | None, head seconds | None, relative change | None, verdict)]"""
+    rows = []
+    for name in sorted(set(base) | set(head)):
+        if name not in head:
+            rows.append((name, base[name][metric], None, None, 'removed'))
+            continue
+        if name not in base:
+            rows.append((name, None, head[name][metric], None, 'new'))
+            continue
+        before, after = base[name][metric], head[name][metric]
+        change = after / before - 1 if before else 0.0
+        if change > threshold:
+            verdict = 'REGRESSION'
+        elif change < -threshold:
+            verdict = 'faster'
+        else:
+            verdict = ''
+        rows.append((name, before, after, change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown counted as a regression')
+    parser.add_argument('--metric', default='median', choices=['min', 'median', 'mean', 'p95'])
+    args = parser.parse_args()
+
+    reports = []
+    for path in (args.base, args.head):
+        with open(path) as f:
+            reports.append(json.load(f))
+    base, head = reports
+
+    print(f"base {base['meta'].get('commit')} vs head {head['meta'].get('commit')}, "
+          f"{args.metric}, threshold {args.threshold:.0%}")
+    rows = compare(base['results'], head['results'], args.threshold, args.metric)
+    for name, before, after, change, verdict in rows:
+        before_text = format_seconds(before) if before is not None else '-'
+        after_text = format_seconds(after) if after is not None else '-'
+        change_text = f'{change:+.1%}' if change is not None else ''
+        print(f"{name:<45} {before_text:>10} {after_text:>10} {change_text:>8}  {verdict}")
+
+    regressions = [row for row in rows if row[4] == 'REGRESSION']
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""End-to-end HTTP load test of the quote endpoints with a Zipf-distributed lane mix.
+
+    python -m benchmarks.loadtest --configs 1x8,2x8,4x4 --concurrency 8,32,64 --duration 20
+    python -m benchmarks.loadtest --mix europe=0.6,multimodal=0.3,asia=0.1 --zipf 1.1 --output load.json
+
+For every WORKERSxTHREADS configuration the app is started in WORKERS processes,
+each serving requests from a pool of THREADS threads on its own port; the
+client spreads requests over them round-robin, as a load balancer would. With
+--server gunicorn a single `gunicorn -w WORKERS --threads THREADS` is used instead.
+OSRM, Nominatim and DNS are local stubs, and the servers never write the on-disk
+caches.
+
+Lanes are drawn with Zipf weights (rank^-s) over shuffled ports from ports.csv,
+regions from region_details.json with a postal code of the region, and Central
+Asian cities, so a few lanes are hot and the tail is long. Each run reports
+throughput, p50/p95/p99 latency and the error rate per endpoint.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+from benchmarks.stub_dns import StubDNS
+from benchmarks.stub_upstreams import StubUpstreams
+
+PORTS_FILE = os.path.join("data", "ports.csv")
+REGION_DETAILS_FILE = os.path.join("data", "region_details.json")
+REGIONS_FILE = os.path.join("data", "europe_regions.csv")
+ASIA_CITIES_FILE = os.path.join("data", "central_asia_cities.csv")
+ENDPOINTS = {
+    'europe': '/api/calculate_rate_europe',
+    'asia': '/api/calculate_rate_asia',
+    'multimodal': '/api/calculate_rate_multimodal',
+}
+CONTAINER_TYPES = ['20dv', '40dv', '40hc']
+STARTUP_TIMEOUT = 120  # seconds for a worker to load its data
+REQUEST_TIMEOUT = 30
+# Module gunicorn loads: the app with cache persistence disabled
+GUNICORN_APP_MODULE = '''import api
+from app import app
+from core.routing import distance_cache
+api.europe_freight_calculator.save_geocode_cache = lambda: None
+distance_cache.save = lambda: None
+'''
+
+
+class ZipfSampler:
+    """Draws items with probability proportional to rank^-s after a seeded shuffle."""
+
+    def __init__(self, items, s, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        weights = 1.0 / np.arange(1, len(self.items) + 1) ** s
+        self.cumulative = np.cumsum(weights / weights.sum())
+
+    def draw(self, rng):
+        index = int(np.searchsorted(self.cumulative, rng.random(), side='right'))
+        return self.items[min(index, len(self.items) - 1)]
+
+
+def load_lane_sources():
+    ports = pd.read_csv(PORTS_FILE)['id'].tolist()
+    with open(REGION_DETAILS_FILE, 'r', encoding='utf-8') as f:
+        regions = list(json.load(f))
+    postal = pd.read_csv(REGIONS_FILE, dtype={'postal_code': 'str'})
+    postal_by_region = {region: list(zip(group['country_code'], group['postal_code']))
+                        for region, group in postal.groupby('region')}
+    regions = [region for region in regions if region in postal_by_region]
+    cities = pd.read_csv(ASIA_CITIES_FILE)[['country_code', 'city']].itertuples(index=False, name=None)
+    return ports, regions, postal_by_region, list(cities)
+
+
+def generate_requests(count, mix, s, seed):
+    """[(endpoint kind, JSON body)] following `mix` ({'europe': share, ...})."""
+    rng = random.Random(seed)
+    ports, regions, postal_by_region, cities = load_lane_sources()
+    port_sampler = ZipfSampler(ports, s, rng)
+    region_sampler = ZipfSampler(regions, s, rng)
+    city_sampler = ZipfSampler(cities, s, rng)
+
+    def postal_code():
+        return rng.choice(postal_by_region[region_sampler.draw(rng)])
+
+    kinds, shares = zip(*mix.items())
+    generated = []
+    for kind in rng.choices(kinds, weights=shares, k=count):
+        ldm = rng.choice([1, 2, 3, 5, 8, 10])
+        weight = rng.randint(500, ldm * 1850)
+        if kind == 'europe':
+            origin, destination = postal_code(), postal_code()
+            while destination == origin:
+                destination = postal_code()
+            (from_country, from_zip), (to_country, to_zip) = origin, destination
+            body = {'fromCountry': from_country, 'fromZip': from_zip, 'toCountry': to_country, 'toZip': to_zip,
+                    'ldm': ldm, 'weight': weight}
+        elif kind == 'asia':
+            (country, zip_code), (asia_country, city) = postal_code(), city_sampler.draw(rng)
+            body = {'fromCountry': country, 'fromZip': zip_code, 'asiaCountry': asia_country, 'asiaCity': city,
+                    'ldm': ldm, 'weight': weight, 'email': 'loadtest@example.com'}
+        else:
+            origin = port_sampler.draw(rng)
+            destination = port_sampler.draw(rng)
+            while destination == origin:
+                destination = port_sampler.draw(rng)
+            body = {'originPort': origin, 'destinationPort': destination,
+                    'containerType': rng.choice(CONTAINER_TYPES)}
+        generated.append((kind, body))
+    return generated
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(port, threads):
+    """Worker entry point: the Flask app behind a werkzeug server with a fixed thread pool."""
+    import logging
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import make_server
+
+    import api
+    from app import app
+    from core.routing import distance_cache
+    api.europe_freight_calculator.save_geocode_cache = lambda: None  # keep the on-disk caches free of stub data
+    distance_cache.save = lambda: None
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log line per request
+    server = make_server('127.0.0.1', port, app, threaded=False)
+    pool = ThreadPoolExecutor(max_workers=threads)
+
+    def handle(request, client_address):
+        try:
+            server.finish_request(request, client_address)
+        except Exception:
+            server.handle_error(request, client_address)
+        finally:
+            server.shutdown_request(request)
+
+    server.process_request = lambda request, client_address: pool.submit(handle, request, client_address)
+    server.serve_forever()
+
+
+def start_servers(workers, threads, server, environ, tmp_dir):
+    """Start the app; returns (processes, base URLs)."""
+    if server == 'gunicorn':
+        port = free_port()
+        module_path = os.path.join(tmp_dir, 'loadtest_app.py')
+        with open(module_path, 'w') as f:
+            f.write(GUNICORN_APP_MODULE)
+        env = dict(environ, PYTHONPATH=os.pathsep.join([os.getcwd(), tmp_dir]))
+        process = subprocess.Popen(
+            ['gunicorn', '-w', str(workers), '--threads', str(threads), '-b', f'127.0.0.1:{port}',
+             '--log-level', 'warning', 'loadtest_app:app'],
+            env=env, stdout=subprocess.DEVNULL)
+        return [process], [f'http://127.0.0.1:{port}']
+
+    processes, urls = [], []
+    for _ in range(workers):
+        port = free_port()
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.loadtest', '--serve', str(port), '--threads', str(threads)],
+            env=environ, stdout=subprocess.DEVNULL))
+        urls.append(f'http://127.0.0.1:{port}')
+    return processes, urls
+
+
+def wait_until_ready(urls, processes):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    for url in urls:
+        while True:
+            if any(process.poll() is not None for process in processes):
+                raise RuntimeError('A server process exited during startup')
+            try:
+                if requests.get(f'{url}/metrics', timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'{url} did not start within {STARTUP_TIMEOUT}s')
+            time.sleep(0.5)
+
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_load(urls, lanes, concurrency, duration, warmup):
+    """Closed-loop load: `concurrency` clients send back to back for warmup + duration seconds."""
+    sequence = itertools.count()
+    samples = []  # (kind, seconds, ok) during the measured window
+    lock = threading.Lock()
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def client():
+        session = requests.Session()
+        local = []
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            i = next(sequence)
+            kind, body = lanes[i % len(lanes)]
+            url = urls[i % len(urls)] + ENDPOINTS[kind]
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json=body, timeout=REQUEST_TIMEOUT)
+                ok = response.status_code == 200 and 'error' not in response.json()
+            except (requests.RequestException, ValueError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            if now >= measure_from:
+                local.append((kind, elapsed, ok))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def summarize(samples, duration):
+    groups = {'all': samples}
+    for kind in ENDPOINTS:
+        groups[kind] = [sample for sample in samples if sample[0] == kind]
+
+    summary = {}
+    for name, group in groups.items():
+        if not group:
+            continue
+        latencies = np.array([seconds for _, seconds, _ in group])
+        errors = sum(1 for _, _, ok in group if not ok)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary[name] = {
+            'requests': len(group),
+            'throughput': len(group) / duration,
+            'p50_ms': p50 * 1000, 'p95_ms': p95 * 1000, 'p99_ms': p99 * 1000,
+            'error_rate': errors / len(group),
+        }
+    return summary
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, share = part.split('=')
+        if kind not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f'unknown endpoint {kind!r}, expected one of {", ".join(ENDPOINTS)}')
+        mix[kind] = float(share)
+    return mix
+
+
+def parse_configs(text):
+    return [tuple(int(n) for n in config.split('x')) for config in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--configs', type=parse_configs, default=parse_configs('1x8'), help='WORKERSxTHREADS,...')
+    parser.add_argument('--concurrency', default='8,32', help='client connections, comma-separated')
+    parser.add_argument('--duration', type=float, default=15, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds before each run')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('europe=0.5,multimodal=0.35,asia=0.15'))
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of the lane popularity')
+    parser.add_argument('--lanes', type=int, default=20000, help='requests generated before cycling')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--server', choices=['pool', 'gunicorn'], default='pool')
+    parser.add_argument('--osrm-latency', type=float, default=0.02)
+    parser.add_argument('--nominatim-latency', type=float, default=0.01)
+    parser.add_argument('--dns-latency', type=float, default=0.005)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--threads', type=int, default=8, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.threads)
+    if args.server == 'gunicorn' and shutil.which('gunicorn') is None:
+        parser.error('gunicorn is not installed')
+
+    lanes = generate_requests(args.lanes, args.mix, args.zipf, args.seed)
+    concurrencies = [int(n) for n in args.concurrency.split(',')]
+    results = []
+
+    with StubUpstreams(osrm_latency=args.osrm_latency, nominatim_latency=args.nominatim_latency) as stub, \
+            StubDNS(latency=args.dns_latency) as dns_stub, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        environ = dict(os.environ, **stub.environ(), **dns_stub.environ(), NOMINATIM_RPS='1000')
+        for workers, threads in args.configs:
+            processes, urls = start_servers(workers, threads, args.server, environ, tmp_dir)
+            try:
+                wait_until_ready(urls, processes)
+                for concurrency in concurrencies:
+                    samples = run_load(urls, lanes, concurrency, args.duration, args.warmup)
+                    summary = summarize(samples, args.duration)
+                    results.append({'workers': workers, 'threads': threads, 'concurrency': concurrency,
+                                    'endpoints': summary})
+                    print(f"\n{workers} worker(s) x {threads} thread(s), {concurrency} clients")
+                    for name, row in summary.items():
+                        print(f"  {name:<11} {row['throughput']:8.1f} req/s  p50 {row['p50_ms']:7.1f} ms"
+                              f"  p95 {row['p95_ms']:7.1f} ms  p99 {row['p99_ms']:7.1f} ms"
+                              f"  errors {row['error_rate']:6.2%}  ({row['requests']})", flush=True)
+            finally:
+                stop_servers(processes)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'mix': args.mix, 'zipf': args.zipf, 'duration': args.duration, 'server': args.server,
+                       'runs': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Local stand-in DNS server answering MX queries over UDP after a configurable delay.
+
+Every name gets an MX record except names starting with `nx-`, which get NXDOMAIN
+with an SOA in the authority section. Point the email verifiers at the stub by
+exporting, before core.email_verifiers is imported:
+
+    DNS_NAMESERVERS=127.0.0.1
+    DNS_PORT=<port>
+"""
+
+import socket
+import threading
+import time
+
+import dns.exception
+import dns.message
+import dns.rcode
+import dns.rrset
+
+MX_TTL = 3600
+NEGATIVE_PREFIX = 'nx-'
+
+
+class StubDNS:
+    """UDP DNS server; each query is answered from its own thread so latencies overlap."""
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.queries = 0
+        self.lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)  # lets serve() notice stop()
+        self.running = False
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.sock.getsockname()[0]
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def environ(self):
+        """Environment variables that route the email verifiers to this stub."""
+        return {'DNS_NAMESERVERS': self.host, 'DNS_PORT': str(self.port)}
+
+    def response(self, wire):
+        query = dns.message.from_wire(wire)
+        response = dns.message.make_response(query)
+        name = query.question[0].name
+        if name.to_text().startswith(NEGATIVE_PREFIX):
+            response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(dns.rrset.from_text(
+                name.parent(), MX_TTL, 'IN', 'SOA', 'ns.stub. hostmaster.stub. 1 3600 600 86400 300'))
+        else:
+            response.answer.append(dns.rrset.from_text(name, MX_TTL, 'IN', 'MX', f'10 mx.{name}'))
+        return response.to_wire()
+
+    def answer(self, wire, address):
+        time.sleep(self.latency)
+        try:
+            self.sock.sendto(self.response(wire), address)
+        except (dns.exception.DNSException, OSError):
+            pass
+
+    def serve(self):
+        while self.running:
+            try:
+                wire, address = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with self.lock:
+                self.queries += 1
+            threading.Thread(target=self.answer, args=(wire, address), daemon=True).start()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,143 @@
+"""Local stand-ins for the OSRM (/route, /table) and Nominatim HTTP APIs with configurable latency.
+
+Point the calculators at the stub by exporting, before they are imported:
+
+    OSRM_URL=http://127.0.0.1:<port>
+    NOMINATIM_DOMAIN=127.0.0.1:<port>
+    NOMINATIM_SCHEME=http
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+ROAD_FACTOR = 1.25  # stub routes are haversine x ROAD_FACTOR
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def fake_coordinates(query):
+    """Deterministic point inside Europe for any address string."""
+    digest = hashlib.sha1(query.encode('utf-8')).digest()
+    lat = 40 + digest[0] / 255 * 20
+    lon = -5 + digest[1] / 255 * 35
+    return lat, lon
+
+
+def parse_coordinates(path_tail):
+    """`lon,lat;lon,lat;...` -> [(lat, lon), ...]"""
+    points = []
+    for pair in path_tail.split(';'):
+        lon, lat = pair.split(',')
+        points.append((float(lat), float(lon)))
+    return points
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = 'StubUpstreams/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        stub = self.server.stub
+
+        if url.path.startswith('/route/v1/'):
+            time.sleep(stub.osrm_latency)
+            stub.count('route')
+            points = parse_coordinates(url.path.split('/', 4)[4])
+            distance = haversine_km(*points[0], *points[-1]) * ROAD_FACTOR * 1000
+            return self.send_json({'code': 'Ok', 'routes': [{'distance': distance, 'duration': distance / 20}]})
+
+        if url.path.startswith('/table/v1/'):
+            time.sleep(stub.osrm_latency)
+            stub.count('table')
+            points = parse_coordinates(url.path.split('/', 4)[4])
+            query = parse_qs(url.query)
+            sources = [int(i) for i in query['sources'][0].split(';')] if 'sources' in query else range(len(points))
+            destinations = ([int(i) for i in query['destinations'][0].split(';')]
+                            if 'destinations' in query else range(len(points)))
+            distances = [
+                [haversine_km(*points[s], *points[d]) * ROAD_FACTOR * 1000 for d in destinations]
+                for s in sources
+            ]
+            return self.send_json({'code': 'Ok', 'distances': distances})
+
+        if url.path == '/search':
+            time.sleep(stub.nominatim_latency)
+            stub.count('search')
+            query = parse_qs(url.query).get('q', [''])[0]
+            lat, lon = fake_coordinates(query)
+            return self.send_json([{
+                'lat': str(lat), 'lon': str(lon), 'display_name': query,
+                'place_id': 1, 'osm_type': 'node', 'osm_id': 1,
+            }])
+
+        self.send_json({'code': 'NotFound'}, status=404)
+
+
+class StubUpstreams:
+    """Threaded HTTP server answering OSRM and Nominatim requests after a fixed delay."""
+
+    def __init__(self, osrm_latency=0.0, nominatim_latency=0.0, host='127.0.0.1', port=0):
+        self.osrm_latency = osrm_latency
+        self.nominatim_latency = nominatim_latency
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self):
+        return f"http://{self.address}"
+
+    def environ(self):
+        """Environment variables that route the calculators to this stub."""
+        return {
+            'OSRM_URL': self.url,
+            'NOMINATIM_DOMAIN': self.address,
+            'NOMINATIM_SCHEME': 'http',
+        }
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
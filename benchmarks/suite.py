@@ -0,0 +1,200 @@
+"""Microbenchmarks for the calculators, loaders and email verification against local stubs.
+
+    python -m benchmarks.suite --output base.json
+    python -m benchmarks.suite --filter europe --quick
+    python -m benchmarks.compare base.json head.json --threshold 0.10
+
+OSRM, Nominatim and DNS are served in-process by benchmarks.stub_upstreams and
+benchmarks.stub_dns with the configured latencies, so runs are reproducible
+offline. The on-disk geocode and distance caches are read but never written.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.stub_dns import StubDNS
+from benchmarks.stub_upstreams import StubUpstreams
+
+
+class Benchmark:
+    def __init__(self, name, func, iterations, setup=None):
+        self.name = name
+        self.func = func  # func(i); only this call is timed
+        self.iterations = iterations
+        self.setup = setup  # setup(i), run before every call, e.g. to empty caches
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'iterations': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1],
+    }
+
+
+def run_benchmark(benchmark, iterations, warmup=1):
+    """Seconds per call of benchmark.func, summarized."""
+    samples = []
+    for i in range(-warmup, iterations):
+        if benchmark.setup:
+            benchmark.setup(i)
+        start = time.perf_counter()
+        benchmark.func(i)
+        if i >= 0:
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:.1f} us'
+    if seconds < 1:
+        return f'{seconds * 1e3:.2f} ms'
+    return f'{seconds:.2f} s'
+
+
+def build_benchmarks():
+    """Constructs the calculators; call only once the stub endpoints are in the environment."""
+    from calculators.asian_calculator import AsianFreightCalculator
+    from calculators.europe_calculator import FreightCalculator
+    from calculators.multimodal_calculator import MultimodalFreightCalculator
+    from core import email_verifiers
+    from core.geocoding import geocoding_dispatcher
+    from core.routing import distance_cache
+
+    distance_cache.save = lambda: None  # keep the on-disk caches free of stub data
+    europe = FreightCalculator()
+    europe.save_geocode_cache = lambda: None
+    asian = AsianFreightCalculator()
+    multimodal = MultimodalFreightCalculator()
+
+    def forget_network_results(i=None):
+        europe.geocode_cache.clear()
+        with geocoding_dispatcher.condition:
+            geocoding_dispatcher.results.clear()
+        distance_cache.distances.clear()
+
+    def forget_mx(i=None):
+        with email_verifiers.mx_cache_lock:
+            email_verifiers.mx_cache.clear()
+
+    exact = [key.split('_', 1) for key in europe.regions_dict][:1000]
+    geonames = [key.split('_', 1) for key in europe.postal_coords if key not in europe.regions_dict][:1000]
+    pairs = [(europe.region_codes[a], europe.region_codes[b]) for a, b in list(europe.rates_dict)[:1000]]
+    ports = list(multimodal.ports)
+    port_pairs = [(a, b) for a in ports[:40] for b in ports[-40:] if a != b]
+    asia_cities = list(zip(asian.asia_df['country_code'], asian.asia_df['city']))
+    asia_origins = list(zip(asian.postal_db['postal_code'].astype(str), asian.postal_db['country_code']))[:500]
+    emails = [f'user{i}@domain{i % 200}.example' for i in range(900)] + [f'user{i}@nx-{i}.example' for i in range(100)]
+
+    def region(cases):
+        return lambda i: europe.get_region_by_postal(cases[i % len(cases)][1], cases[i % len(cases)][0])
+
+    def asia_quote(i):
+        postal, country = asia_origins[i % len(asia_origins)]
+        asia_country, city = asia_cities[i % len(asia_cities)]
+        return asian.calculate(postal, country, asia_country, city, 5, 1000)
+
+    def asia_estimate(i):
+        postal, country = asia_origins[i % len(asia_origins)]
+        asia_country, city = asia_cities[i % len(asia_cities)]
+        return asian.estimate(postal, country, asia_country, city, 5, 1000)
+
+    europe_lane = ('DE', '10115', 'FR', '75001', 5, 1000)
+    benchmarks = [
+        Benchmark('europe.get_region_by_postal.exact', region(exact), 5000),
+        Benchmark('europe.get_region_by_postal.geonames', region(geonames or exact), 2000),
+        Benchmark('europe.get_region_by_postal.prefix',
+                  lambda i: europe.get_region_by_postal(exact[i % len(exact)][1] + 'X', exact[i % len(exact)][0]), 200),
+        Benchmark('europe.calculate_rate', lambda i: europe.calculate_rate(
+            500 + i % 1500, 1 + i % 13, 500 + i % 20000, *pairs[i % len(pairs)], 1 + i % 12), 5000),
+        Benchmark('europe.estimate', lambda i: europe.estimate_rate_of_transportation(*europe_lane), 2000),
+        Benchmark('europe.quote.cold', lambda i: europe.get_rate_of_transportation(*europe_lane), 20,
+                  setup=forget_network_results),
+        Benchmark('europe.quote.cached', lambda i: europe.get_rate_of_transportation(*europe_lane), 200),
+        Benchmark('multimodal.calculate_freight_rate.cached',
+                  lambda i: multimodal.calculate_freight_rate(*port_pairs[i % 10], '40hc'), 5000),
+        Benchmark('multimodal.compute_freight_rate',
+                  lambda i: multimodal.compute_freight_rate(*port_pairs[i % len(port_pairs)], '40hc'), 1000),
+        Benchmark('asia.estimate', asia_estimate, 500),
+        Benchmark('asia.calculate.cold', asia_quote, 20, setup=forget_network_results),
+        Benchmark('asia.calculate.cached', lambda i: asia_quote(0), 200),
+        Benchmark('load.europe', lambda i: FreightCalculator(), 3),
+        Benchmark('load.asia', lambda i: AsianFreightCalculator(), 3),
+        Benchmark('load.multimodal', lambda i: MultimodalFreightCalculator(), 3),
+        Benchmark('email.verify_email.cold', lambda i: email_verifiers.verify_email(emails[i % len(emails)]), 100,
+                  setup=forget_mx),
+        Benchmark('email.verify_email.cached', lambda i: email_verifiers.verify_email(emails[0]), 5000),
+        Benchmark('email.verify_emails_bulk.1000', lambda i: list(email_verifiers.verify_emails_bulk(emails)), 5,
+                  setup=forget_mx),
+    ]
+    # Each cached variant runs after its cold counterpart and repeats one lane, so it always hits
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='JSON results file (default: benchmark-<commit>.json)')
+    parser.add_argument('--filter', default='', help='run only benchmarks whose name contains this text')
+    parser.add_argument('--quick', action='store_true', help='a tenth of the iterations')
+    parser.add_argument('--osrm-latency', type=float, default=0.02)
+    parser.add_argument('--nominatim-latency', type=float, default=0.01)
+    parser.add_argument('--dns-latency', type=float, default=0.005)
+    args = parser.parse_args()
+
+    commit = git_commit()
+    with StubUpstreams(osrm_latency=args.osrm_latency, nominatim_latency=args.nominatim_latency) as stub, \
+            StubDNS(latency=args.dns_latency) as dns_stub:
+        os.environ.update(stub.environ())
+        os.environ.update(dns_stub.environ())
+        os.environ['NOMINATIM_RPS'] = '1000'  # the stub has no usage policy
+        benchmarks = [b for b in build_benchmarks() if args.filter in b.name]
+
+        results = {}
+        for benchmark in benchmarks:
+            iterations = max(3, benchmark.iterations // 10) if args.quick else benchmark.iterations
+            results[benchmark.name] = run_benchmark(benchmark, iterations)
+            stats = results[benchmark.name]
+            print(f"{benchmark.name:<45} median {format_seconds(stats['median']):>10}"
+                  f"  p95 {format_seconds(stats['p95']):>10}  ({stats['iterations']} runs)", flush=True)
+
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'osrm_latency': args.osrm_latency,
+            'nominatim_latency': args.nominatim_latency,
+            'dns_latency': args.dns_latency,
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+    output = args.output or f"benchmark-{commit or 'local'}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
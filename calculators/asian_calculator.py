@@ -1,9 +1,16 @@
 # calculators/asian_calculator.py
 
 import sys
+import asyncio
 import pandas as pd
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import requests
-from geopy.geocoders import Nominatim
+
+from core.upstreams import OSRM_URL
+from core.geocoding import geocoding_dispatcher
+from core.routing import distance_cache
+from core.distance_estimator import RoadDistanceEstimator
+from core.metrics import timed, cache_lookup, UPSTREAM_ERRORS
 
 EU_POSTAL_FILE = "data/eu_only.txt"
 EU_RATES_FILE = "data/eu_tr_base_rates_v2.csv"
@@ -11,6 +18,9 @@ BACKHAUL_FILE = "data/backhaul_params.csv"
 ASIA_RATES_FILE = "data/central_asia_cities.csv"
 TERMINAL_COST = 50
 MAX_LDM = 10
+GEBZE_ADDRESS = "41400 Gebze Türkiye"
+GEBZE_COORDS = (40.8027, 29.4307)  # used by estimates until the geocode is cached
+GEOCODE_WAIT = 60  # seconds to wait for a queued geocode before giving up on it
 
 class AsianFreightCalculator:
     def __init__(self):
@@ -18,7 +28,8 @@ class AsianFreightCalculator:
         self.rates = self.load_base_rates()
         self.backhaul = self.load_backhaul_params()
         self.asia_df = self.load_asia_rates()
-        self.geolocator = Nominatim(user_agent="freight_calc_pro")
+        self.distance_estimator = RoadDistanceEstimator()
+        self.fit_distance_estimator()
 
     def load_eu_postal_codes(self):
         return pd.read_csv(EU_POSTAL_FILE, sep='\t', header=None,
@@ -37,30 +48,72 @@ class AsianFreightCalculator:
     def load_asia_rates(self):
         return pd.read_csv(ASIA_RATES_FILE)
 
+    def fit_distance_estimator(self):
+        # Calibrated on every cached OSRM route; used for the instant estimate of the EU leg
+        samples = list(distance_cache.distances.items())
+        if samples:
+            self.distance_estimator.fit(
+                [o[0] for (o, _), _ in samples], [o[1] for (o, _), _ in samples],
+                [d[0] for (_, d), _ in samples], [d[1] for (_, d), _ in samples],
+                [km for _, km in samples]
+            )
+
     def get_route_distance(self, origin, destination):
+        cached = distance_cache.get(origin, destination)
+        cache_lookup('distance', cached is not None)
+        if cached is not None:
+            return cached
+
         lon1, lat1 = origin[1], origin[0]
         lon2, lat2 = destination[1], destination[0]
-        url = f"http://router.project-osrm.org/route/v1/car/{lon1},{lat1};{lon2},{lat2}"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-        return data['routes'][0]['distance'] / 1000 if data.get('routes') else None
+        url = f"{OSRM_URL}/route/v1/car/{lon1},{lat1};{lon2},{lat2}"
+        try:
+            response = requests.get(url, timeout=10)
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            UPSTREAM_ERRORS.inc('osrm')
+            raise
+        if not data.get('routes'):
+            return None
+
+        distance = data['routes'][0]['distance'] / 1000
+        distance_cache.put(origin, destination, distance)
+        distance_cache.save()
+        return distance
 
     def get_total_route_distance(self, origin_coords, asia_city_name):
-        # Gebze coordinates
-        gebze = self.geolocator.geocode("41400 Gebze Türkiye")
-        if not gebze:
-            raise ValueError("Gebze location not found!")
-        gebze_coords = (gebze.latitude, gebze.longitude)
-
-        # Geocode the Asian city
-        asia_city = self.geolocator.geocode(asia_city_name)
-        if not asia_city:
+        # Sync wrapper for the Flask routes
+        return asyncio.run(self.get_total_route_distance_async(origin_coords, asia_city_name))
+
+    async def geocode(self, address):
+        # A backed-up queue, a 429 pause or a dead worker must not hang the request: a timeout is "not found".
+        # The wait runs in a thread because the dispatcher's Future is shared and must not be cancelled.
+        future = geocoding_dispatcher.submit(address)
+        try:
+            return await asyncio.to_thread(future.result, GEOCODE_WAIT)
+        except FutureTimeoutError:
+            print(f"Geocode not finished in {GEOCODE_WAIT} s: {address}")
+            return None
+
+    async def get_total_route_distance_async(self, origin_coords, asia_city_name):
+        # Gebze and the Asian city are geocoded concurrently through the shared dispatcher
+        with timed('asia', 'geocode'):
+            gebze_coords, asia_coords = await asyncio.gather(
+                self.geocode(GEBZE_ADDRESS),
+                self.geocode(asia_city_name),
+            )
+        # Gebze is a fixed terminal, so its known coordinates stand in as the estimate path does
+        gebze_coords = gebze_coords or GEBZE_COORDS
+
+        if not asia_coords:
             raise ValueError("Asian city location not found!")
-        asia_coords = (asia_city.latitude, asia_city.longitude)
 
-        # Calculate both legs
-        dist_eu_to_gebze = self.get_route_distance(origin_coords, gebze_coords)
-        dist_gebze_to_asia = self.get_route_distance(gebze_coords, asia_coords)
+        # Both legs only depend on the geocodes, so they are routed concurrently too
+        with timed('asia', 'routing'):
+            dist_eu_to_gebze, dist_gebze_to_asia = await asyncio.gather(
+                asyncio.to_thread(self.get_route_distance, origin_coords, gebze_coords),
+                asyncio.to_thread(self.get_route_distance, gebze_coords, asia_coords),
+            )
 
         if not dist_eu_to_gebze or not dist_gebze_to_asia:
             raise ValueError("Route distance calculation error!")
@@ -99,12 +152,13 @@ class AsianFreightCalculator:
             tons += 1
         return tons * TERMINAL_COST
 
-    def calculate(self, eu_postal, eu_country, asia_country, asia_city, ldm, weight):
+    def validate_load(self, ldm, weight):
         if ldm < 1 or ldm > MAX_LDM:
             raise ValueError(f"LDM must be between 1 and {MAX_LDM}")
         if weight > ldm * 1850 or weight <= 0:
             raise ValueError(f"Max weight for {ldm} LDM: {ldm*1850} kg")
 
+    def get_origin_coords(self, eu_postal, eu_country):
         location_data = self.postal_db[
             (self.postal_db['postal_code'] == eu_postal) &
             (self.postal_db['country_code'] == eu_country)
@@ -112,9 +166,24 @@ class AsianFreightCalculator:
         if location_data.empty:
             raise ValueError("Origin location not found!")
 
-        origin = (float(location_data.iloc[0]['latitude']), float(location_data.iloc[0]['longitude']))
-        full_distance = self.get_total_route_distance(origin, f"{asia_city}, {asia_country}")
+        return (float(location_data.iloc[0]['latitude']), float(location_data.iloc[0]['longitude']))
+
+    def estimate_route_distance(self, origin, asia_country, asia_city):
+        # No network: EU leg from the distance cache or the estimator, Asian leg from base_distance_km
+        gebze = geocoding_dispatcher.cached(GEBZE_ADDRESS) or GEBZE_COORDS
+        eu_leg = distance_cache.get(origin, gebze)
+        if eu_leg is None:
+            eu_leg = self.distance_estimator.estimate_one(origin[0], origin[1], gebze[0], gebze[1])
+
+        row = self.asia_df[
+            (self.asia_df['country_code'] == asia_country) &
+            (self.asia_df['city'] == asia_city)
+        ]
+        if row.empty:
+            raise ValueError("Asia city not found!")
+        return eu_leg + float(row.iloc[0]['base_distance_km'])
 
+    def build_quote(self, full_distance, eu_country, asia_country, asia_city, ldm, weight):
         eu_cost = self.calculate_eu_leg(full_distance, ldm, weight, eu_country)
         asia_cost = self.calculate_asia_leg(asia_country, asia_city, ldm, weight)
         terminal_cost = self.calculate_terminal_cost(weight)
@@ -125,3 +194,18 @@ class AsianFreightCalculator:
             'distance': round(full_distance, 2),
             'chargeable_ldm': max(ldm, round(weight / 1850, 2))
         }
+
+    def calculate(self, eu_postal, eu_country, asia_country, asia_city, ldm, weight):
+        self.validate_load(ldm, weight)
+        with timed('asia', 'region_lookup'):
+            origin = self.get_origin_coords(eu_postal, eu_country)
+        full_distance = self.get_total_route_distance(origin, f"{asia_city}, {asia_country}")
+        with timed('asia', 'rate'):
+            return self.build_quote(full_distance, eu_country, asia_country, asia_city, ldm, weight)
+
+    def estimate(self, eu_postal, eu_country, asia_country, asia_city, ldm, weight):
+        # Instant first phase of the streamed quote, priced on an estimated distance
+        self.validate_load(ldm, weight)
+        origin = self.get_origin_coords(eu_postal, eu_country)
+        full_distance = self.estimate_route_distance(origin, asia_country, asia_city)
+        return self.build_quote(full_distance, eu_country, asia_country, asia_city, ldm, weight)
@@ -1,31 +1,71 @@
 import pandas as pd
+import asyncio
 import json
 import os
-from geopy.geocoders import Nominatim
+import threading
 import requests
 import datetime
 import time
 import pickle
-import math
+import numpy as np
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from cachetools import TTLCache
+
+from core.deadline import Deadline
+from core.upstreams import OSRM_URL
+from core.geocoding import geocoding_dispatcher, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, PRIORITY_BATCH
+from core.routing import distance_cache
+from core.distance_estimator import RoadDistanceEstimator, haversine_km
+from core.spatial import KDTree
+from core.metrics import timed, cache_lookup, UPSTREAM_ERRORS, UPSTREAM_RETRIES
 
 # Константы
 REGIONS_FILE = os.path.join("data", "europe_regions.csv")
 RATES_FILE = os.path.join("data", "europe_regional_rates.csv")
 REGION_DETAILS_FILE = os.path.join("data", "region_details.json")
 CORRECTION_FACTORS_FILE = os.path.join("data", "correction_factors.json")
+POSTAL_POINTS_FILE = os.path.join("data", "eu_only.txt")  # выгрузка GeoNames с координатами индексов
 DENSITY_FACTOR = 1850  # кг/м для расчета тарифицируемого объема
 CACHE_FILE = os.path.join("data", "geocode_cache.pkl")
+GEOCODE_WAIT = 60  # секунды ожидания геокода, если у запроса нет deadline
+ROUTING_TIMEOUT = 15  # секунды на одну попытку запроса к OSRM
+MIN_ATTEMPT_TIMEOUT = 0.2  # меньше этого бюджета запрос к сервису не имеет смысла
+DEFAULT_DISTANCE_KM = 1000  # если для пары регионов расстояние нельзя ни найти, ни оценить
+POSTAL_FALLBACK_CACHE_SIZE = 10000
+POSTAL_FALLBACK_TTL = 24 * 3600  # секунды; в том числе для индексов, которые не удалось найти
+MISSING = object()  # отличает промах кэша от закэшированного (None, None)
+DEFAULT_RATE_PER_LDM = 350  # Базовая ставка за 1 LDM в евро, если для пары регионов нет прямой ставки
+DEFAULT_RATE_PER_KM = 0.45  # Базовая ставка за 1 км за 1 LDM в евро, если нет прямой ставки
+DEFAULT_SEASONAL_FACTORS = {
+    "1": 0.9, "2": 0.9, "3": 0.95, "4": 1.0, "5": 1.0, "6": 1.05,
+    "7": 0.9, "8": 0.85, "9": 1.1, "10": 1.15, "11": 1.1, "12": 1.0
+}
+LDM_POWER = 0.9  # Показатель степени для LDM (меньше 1 для эффекта масштаба)
+DISTANCE_POWER = 0.95  # Показатель степени для расстояния (меньше 1 для эффекта масштаба)
 
 class FreightCalculator:
     def __init__(self):
         """Инициализация калькулятора ставок"""
         self.regions_dict = {}
-        self.rates_dict = {}
+        self.rates_dict = {}  # ключ: (id региона отправления, id региона назначения)
         self.region_details = {}
+        self.region_ids = {}  # код региона -> целочисленный id (индекс в матрице расстояний)
+        self.region_codes = []
+        self.distance_matrix = None
         self.correction_factors = {}
         self.geocode_cache = {}
+        self.cache_lock = threading.Lock()  # геокоды могут запрашиваться параллельно
+        self.distance_estimator = RoadDistanceEstimator()
+        self.postal_coords = {}  # "DE_10115" -> (lat, lon) по данным GeoNames
+        self.postal_indexes = {}  # код страны -> (KDTree, [ключ regions_dict, ...]) по почтовым точкам
+        self.region_center_indexes = {}  # код страны -> (KDTree, [код региона, ...]) по центрам регионов
+        self.postal_fallback_cache = TTLCache(maxsize=POSTAL_FALLBACK_CACHE_SIZE, ttl=POSTAL_FALLBACK_TTL)
+        self.postal_fallback_lock = threading.Lock()  # TTLCache не потокобезопасен
         self.load_data()
+        self.build_spatial_index()
         self.load_geocode_cache()
+        self.fit_distance_estimator()
+        self.build_distance_matrix()
         
     def load_data(self):
         """Загрузка данных о регионах и ставках"""
@@ -42,6 +82,10 @@ class FreightCalculator:
                     'country_code': row['country_code']
                 }
             
+            # Загружаем детали регионов
+            with open(REGION_DETAILS_FILE, 'r', encoding='utf-8') as f:
+                self.region_details = json.load(f)
+            
             # Загружаем базовые ставки между регионами
             rates_df = pd.read_csv(RATES_FILE)
             
@@ -49,9 +93,15 @@ class FreightCalculator:
             rates_df['seasonal_factors'] = rates_df['seasonal_factors'].apply(json.loads)
             rates_df['urgency_factors'] = rates_df['urgency_factors'].apply(json.loads)
             
+            # Нумеруем все известные регионы: эти id используются и в матрице расстояний, и в rates_dict
+            self.region_codes = sorted(
+                set(self.region_details) | set(rates_df['from_region']) | set(rates_df['to_region'])
+            )
+            self.region_ids = {code: i for i, code in enumerate(self.region_codes)}
+            
             # Создаем словарь для быстрого поиска ставки по паре регионов
             for _, row in rates_df.iterrows():
-                key = (row['from_region'], row['to_region'])
+                key = (self.region_ids[row['from_region']], self.region_ids[row['to_region']])
                 self.rates_dict[key] = {
                     'distance_km': row['distance_km'],
                     'base_rate_per_ldm': row['base_rate_per_ldm'],
@@ -61,10 +111,6 @@ class FreightCalculator:
                     'urgency_factors': row['urgency_factors']
                 }
             
-            # Загружаем детали регионов
-            with open(REGION_DETAILS_FILE, 'r', encoding='utf-8') as f:
-                self.region_details = json.load(f)
-            
             # Загружаем коэффициенты корректировки
             with open(CORRECTION_FACTORS_FILE, 'r', encoding='utf-8') as f:
                 self.correction_factors = json.load(f)
@@ -90,66 +136,101 @@ class FreightCalculator:
         """Сохранение кэша геокодирования"""
         try:
             os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
-            with open(CACHE_FILE, 'wb') as f:
+            with self.cache_lock, open(CACHE_FILE, 'wb') as f:
                 pickle.dump(self.geocode_cache, f)
         except Exception as e:
             print(f"Ошибка сохранения кэша: {str(e)}")
     
-    def get_coordinates(self, address):
-        """Получение координат через OpenStreetMap с кэшированием и повторными попытками"""
+    def get_coordinates(self, address, deadline=None, priority=PRIORITY_INTERACTIVE):
+        """Получение координат через общий диспетчер геокодирования с кэшированием
+
+        Диспетчер ограничивает частоту запросов к Nominatim, обслуживает интерактивные
+        запросы раньше фоновых и сам выполняет повторные попытки. Если передан deadline,
+        ждем только оставшееся время; запрос при этом не отменяется и заполнит кэш позже.
+        """
         # Проверяем кэш
-        if address in self.geocode_cache:
-            return self.geocode_cache[address]
+        cached = self.geocode_cache.get(address)
+        cache_lookup('geocode', cached is not None)
+        if cached is not None:
+            return cached
         
-        # Если адрес не в кэше, делаем запрос с повторными попытками
-        max_retries = 3
-        retry_delay = 2  # секунды
+        future = self.request_coordinates(address, priority)
+        timeout = deadline.timeout(GEOCODE_WAIT) if deadline else GEOCODE_WAIT
+        try:
+            coords = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            print(f"Бюджет запроса исчерпан, геокодирование не завершено: {address}")
+            return (None, None)
         
-        for attempt in range(max_retries):
-            try:
-                geolocator = Nominatim(user_agent="europe_freight_calculator_v3")
-                location = geolocator.geocode(address, timeout=10)  # Увеличенный таймаут
-                
-                if location:
-                    coords = (location.latitude, location.longitude)
-                    # Сохраняем в кэш
-                    self.geocode_cache[address] = coords
-                    self.save_geocode_cache()
-                    return coords
-                
-                # Если локация не найдена, но запрос выполнен успешно
-                if attempt == max_retries - 1:
-                    print(f"Адрес не найден: {address}")
-                    return (None, None)
-                
-            except Exception as e:
-                print(f"Ошибка геокодирования (попытка {attempt+1}/{max_retries}): {str(e)}")
-                if attempt == max_retries - 1:
-                    return (None, None)
-                
-                # Ждем перед следующей попыткой
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Экспоненциальная задержка
+        if coords is None:
+            print(f"Адрес не найден: {address}")
+            return (None, None)
+        return coords
+    
+    def request_coordinates(self, address, priority=PRIORITY_BATCH):
+        """Постановка адреса в очередь геокодирования без ожидания; результат попадет в кэш"""
+        future = geocoding_dispatcher.submit(address, priority)
+        future.add_done_callback(lambda f: self.store_coordinates(address, f.result()))
+        return future
+    
+    def store_coordinates(self, address, coords):
+        """Сохранение найденных координат в кэш"""
+        if coords is None or address in self.geocode_cache:
+            return
+        with self.cache_lock:
+            self.geocode_cache[address] = coords
+        self.save_geocode_cache()
+    
+    def prepare_location(self, postal_code, country_code, deadline=None):
+        """Предварительная подготовка адреса до отправки формы
+
+        Определяет регион и ставит геокодирование адреса в очередь с приоритетом
+        prefetch, не дожидаясь результата: к моменту расчета координаты уже будут в кэше.
+        """
+        region, place = self.get_region_by_postal(postal_code, country_code, deadline)
+        if not region:
+            return {'valid': False}
         
-        return (None, None)
+        address = f"{postal_code}, {place}, {country_code}"
+        if address in self.geocode_cache:
+            status = 'ready'
+        else:
+            self.request_coordinates(address, PRIORITY_PREFETCH)
+            status = 'pending'
+        return {'valid': True, 'region': region, 'place_name': place, 'status': status}
     
-    def get_road_distance(self, coord1, coord2):
-        """Получение реального расстояния через OSRM с повторными попытками"""
+    def get_road_distance(self, coord1, coord2, deadline=None):
+        """Получение реального расстояния через OSRM с повторными попытками
+
+        Если передан deadline, попытки ограничены оставшимся бюджетом запроса.
+        """
         if None in coord1 or None in coord2:
             return None
+        
+        # Расстояния, полученные ранее (в том числе пакетно через /table), берем из кэша
+        cached = distance_cache.get(coord1, coord2)
+        cache_lookup('distance', cached is not None)
+        if cached is not None:
+            return cached
             
         max_retries = 3
         retry_delay = 2  # секунды
         
         for attempt in range(max_retries):
+            timeout = deadline.timeout(ROUTING_TIMEOUT) if deadline else ROUTING_TIMEOUT
+            if timeout < MIN_ATTEMPT_TIMEOUT:
+                print("Бюджет запроса исчерпан, маршрут не запрошен")
+                return None
+            
             try:
                 # Формат: lon1,lat1;lon2,lat2
-                url = f"http://router.project-osrm.org/route/v1/car/" \
+                url = f"{OSRM_URL}/route/v1/car/" \
                       f"{coord1[1]},{coord1[0]};{coord2[1]},{coord2[0]}?overview=full"
                 
-                response = requests.get(url, timeout=15)  # Увеличенный таймаут
+                response = requests.get(url, timeout=timeout)
                 
                 if response.status_code != 200:
+                    UPSTREAM_ERRORS.inc('osrm')
                     print(f"OSRM Error: HTTP {response.status_code} (попытка {attempt+1}/{max_retries})")
                     if attempt == max_retries - 1:
                         return None
@@ -161,26 +242,45 @@ class FreightCalculator:
                         if attempt == max_retries - 1:
                             return None
                     else:
-                        return data['routes'][0]['distance'] / 1000  # в км
+                        distance = data['routes'][0]['distance'] / 1000  # в км
+                        distance_cache.put(coord1, coord2, distance)
+                        distance_cache.save()
+                        return distance
                 
             except Exception as e:
+                UPSTREAM_ERRORS.inc('osrm')
                 print(f"OSRM Error (попытка {attempt+1}/{max_retries}): {str(e)}")
                 if attempt == max_retries - 1:
                     return None
             
+            if deadline and not deadline.can_wait(retry_delay + MIN_ATTEMPT_TIMEOUT):
+                return None
+            
             # Ждем перед следующей попыткой
+            UPSTREAM_RETRIES.inc('osrm')
             time.sleep(retry_delay)
             retry_delay *= 2  # Экспоненциальная задержка
         
         return None
     
-    def get_region_by_postal(self, postal_code, country_code):
-        """Определение региона по почтовому индексу и коду страны"""
+    def get_region_by_postal(self, postal_code, country_code, deadline=None):
+        """Определение региона по почтовому индексу и коду страны
+        
+        Порядок: точное совпадение, ближайшая точка к координатам индекса из GeoNames,
+        совпадение по первым цифрам и, наконец, геокодирование индекса с поиском
+        ближайшей точки в пространственном индексе.
+        """
         key = f"{country_code}_{postal_code}"
         region_info = self.regions_dict.get(key)
         if region_info:
             return region_info['region'], region_info['place_name']
         
+        # Координаты индекса известны без геокодирования
+        if key in self.postal_coords:
+            region, place = self.get_region_by_coordinates(*self.postal_coords[key], country_code)
+            if region:
+                return region, place
+        
         # Если точное совпадение не найдено, ищем по первым цифрам
         for i in range(len(postal_code) - 1, 0, -1):
             prefix = postal_code[:i]
@@ -188,62 +288,192 @@ class FreightCalculator:
                 if k.startswith(f"{country_code}_{prefix}"):
                     return v['region'], v['place_name']
         
-        return None, None
+        return self.locate_postal(postal_code, country_code, deadline)
+    
+    def build_spatial_index(self):
+        """Построение KD-деревьев по почтовым точкам GeoNames и центрам регионов (по странам)"""
+        if os.path.exists(POSTAL_POINTS_FILE):
+            points = pd.read_csv(POSTAL_POINTS_FILE, sep='\t', header=None,
+                                 usecols=[0, 1, 9, 10],
+                                 names=['country_code', 'postal_code', 'latitude', 'longitude'],
+                                 dtype={'postal_code': 'str'})
+            points = points.dropna(subset=['latitude', 'longitude'])
+            points['key'] = points['country_code'] + '_' + points['postal_code']
+            self.postal_coords = dict(zip(points['key'], zip(points['latitude'], points['longitude'])))
+        
+            # В дерево попадают только точки с известным регионом
+            points = points[points['key'].isin(self.regions_dict)]
+            for country_code, group in points.groupby('country_code'):
+                tree = KDTree(group['latitude'].to_numpy(), group['longitude'].to_numpy())
+                self.postal_indexes[country_code] = (tree, group['key'].tolist())
+        
+        centers = {}
+        for code in self.region_details:
+            center = self.get_region_center(code)
+            if center:
+                centers.setdefault(self.region_details[code].get('country_code'), []).append((code, center))
+        for country_code, items in centers.items():
+            tree = KDTree([c[0] for _, c in items], [c[1] for _, c in items])
+            self.region_center_indexes[country_code] = (tree, [code for code, _ in items])
+        
+        print(f"Пространственный индекс: {len(self.postal_coords)} почтовых точек, "
+              f"{sum(len(t) for t, _ in self.region_center_indexes.values())} центров регионов")
+    
+    def get_region_by_coordinates(self, lat, lon, country_code=None):
+        """Регион и название места ближайшего известного почтового индекса (или центра региона)
+        
+        Если страна не указана, поиск идет по всем странам.
+        """
+        countries = [country_code] if country_code else set(self.postal_indexes) | set(self.region_center_indexes)
+        
+        best = (float('inf'), None, None)
+        for country in countries:
+            if country in self.postal_indexes:
+                tree, keys = self.postal_indexes[country]
+                distances, indices = tree.query(lat, lon)
+                if len(indices) and distances[0] < best[0]:
+                    info = self.regions_dict[keys[indices[0]]]
+                    best = (distances[0], info['region'], info['place_name'])
+            elif country in self.region_center_indexes:
+                tree, codes = self.region_center_indexes[country]
+                distances, indices = tree.query(lat, lon)
+                if len(indices) and distances[0] < best[0]:
+                    region = codes[indices[0]]
+                    place = self.region_details[region].get('admin_name', '').split(',')[0] or region
+                    best = (distances[0], region, place)
+        return best[1], best[2]
+    
+    def get_postal_coordinates(self, postal_code, country_code):
+        """Координаты индекса только из памяти (GeoNames, кэш геокодов, центр региона) или None"""
+        key = f"{country_code}_{postal_code}"
+        if key in self.postal_coords:
+            return self.postal_coords[key]
+
+        region_info = self.regions_dict.get(key)
+        if not region_info:
+            return None
+        address = f"{postal_code}, {region_info['place_name']}, {country_code}"
+        return self.geocode_cache.get(address) or self.get_region_center(region_info['region'])
+
+    def locate_postal(self, postal_code, country_code, deadline=None):
+        """Регион для неизвестного индекса: геокодирование и поиск ближайшей точки
+        
+        Результат (в том числе отрицательный) кэшируется, чтобы ошибочные индексы
+        не геокодировались повторно.
+        """
+        key = f"{country_code}_{postal_code}"
+        with self.postal_fallback_lock:
+            cached = self.postal_fallback_cache.get(key, MISSING)
+        if cached is not MISSING:
+            return cached
+        
+        # Страну без данных нет смысла геокодировать
+        if country_code not in self.postal_indexes and country_code not in self.region_center_indexes:
+            return None, None
+        
+        coords = self.get_coordinates(f"{postal_code}, {country_code}", deadline)
+        if None in coords:
+            if deadline is None or not deadline.expired():
+                with self.postal_fallback_lock:
+                    self.postal_fallback_cache[key] = (None, None)
+            return None, None
+        
+        region, place = self.get_region_by_coordinates(coords[0], coords[1], country_code)
+        with self.postal_fallback_lock:
+            self.postal_fallback_cache[key] = (region, place)
+        # Расчет геокодирует адрес "индекс, место, страна" - координаты уже известны
+        self.store_coordinates(f"{postal_code}, {place}, {country_code}", coords)
+        return region, place
+    
+    def build_distance_matrix(self):
+        """Предрасчет полной матрицы расстояний N×N между регионами
+
+        Расстояния берутся из матрицы ставок (при отсутствии прямой ставки - из обратной),
+        остальные пары оцениваются откалиброванной моделью по центрам регионов.
+        """
+        n = len(self.region_codes)
+        matrix = np.full((n, n), np.nan)
+        for (i, j), rate_info in self.rates_dict.items():
+            matrix[i, j] = rate_info['distance_km']
+        
+        # Для расстояния асимметрия не критична, поэтому дополняем обратными ставками
+        matrix = np.where(np.isnan(matrix), matrix.T, matrix)
+        
+        centers = np.array([self.get_region_center(code) or (np.nan, np.nan) for code in self.region_codes])
+        countries = [self.region_details.get(code, {}).get('country_code') for code in self.region_codes]
+        missing_i, missing_j = np.nonzero(np.isnan(matrix))
+        if len(missing_i):
+            estimates = self.distance_estimator.estimate(
+                centers[missing_i, 0], centers[missing_i, 1], centers[missing_j, 0], centers[missing_j, 1],
+                [(countries[i], countries[j]) for i, j in zip(missing_i, missing_j)]
+            )
+            matrix[missing_i, missing_j] = np.round(estimates, 1)
+        
+        # Регионы без координат центра: значение по умолчанию
+        matrix[np.isnan(matrix)] = DEFAULT_DISTANCE_KM
+        self.distance_matrix = matrix
+    
+    def get_rate_info(self, from_region, to_region):
+        """Ставка для пары регионов по их целочисленным id"""
+        from_id = self.region_ids.get(from_region)
+        to_id = self.region_ids.get(to_region)
+        if from_id is None or to_id is None:
+            return None
+        return self.rates_dict.get((from_id, to_id))
     
     def get_distance_from_matrix(self, from_region, to_region):
-        """Получение расстояния из матрицы ставок"""
-        # Ищем прямую ставку
-        rate_info = self.rates_dict.get((from_region, to_region))
-        if rate_info:
-            return rate_info['distance_km']
-        
-        # Если прямой ставки нет, ищем обратную (может быть асимметрия, но для расстояния это не критично)
-        rate_info = self.rates_dict.get((to_region, from_region))
-        if rate_info:
-            return rate_info['distance_km']
-        
-        # Если ставки нет в обоих направлениях, используем приблизительное расстояние
-        # на основе координат центров регионов
-        from_details = self.region_details.get(from_region, {})
-        to_details = self.region_details.get(to_region, {})
-        
-        if from_details and to_details:
-            from_lat = from_details.get('center_lat')
-            from_lon = from_details.get('center_lon')
-            to_lat = to_details.get('center_lat')
-            to_lon = to_details.get('center_lon')
-            
-            if from_lat and from_lon and to_lat and to_lon:
-                # Рассчитываем расстояние по формуле гаверсинуса
-                
-                # Переводим в радианы
-                from_lat_rad = math.radians(from_lat)
-                from_lon_rad = math.radians(from_lon)
-                to_lat_rad = math.radians(to_lat)
-                to_lon_rad = math.radians(to_lon)
-                
-                # Разница координат
-                delta_lat = to_lat_rad - from_lat_rad
-                delta_lon = to_lon_rad - from_lon_rad
-                
-                # Формула гаверсинуса
-                a = math.sin(delta_lat/2)**2 + math.cos(from_lat_rad) * math.cos(to_lat_rad) * math.sin(delta_lon/2)**2
-                c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-                
-                # Радиус Земли в км
-                R = 6371
-                
-                # Расстояние по прямой
-                distance = R * c
-                
-                # Учитываем дорожный фактор (дороги обычно на 20-40% длиннее прямой)
-                road_factor = 1.3
-                road_distance = distance * road_factor
-                
-                return round(road_distance, 1)
+        """Получение расстояния из предрасчитанной матрицы регионов"""
+        from_id = self.region_ids.get(from_region)
+        to_id = self.region_ids.get(to_region)
+        if from_id is None or to_id is None or self.distance_matrix is None:
+            return DEFAULT_DISTANCE_KM
+        return float(self.distance_matrix[from_id, to_id])
+    
+    def nearest_region_countries(self, lats, lons):
+        """Страна ближайшего центра региона для массива точек (векторно)"""
+        codes = list(self.region_details)
+        center_lats = np.array([self.region_details[c]['center_lat'] for c in codes])
+        center_lons = np.array([self.region_details[c]['center_lon'] for c in codes])
+        distances = haversine_km(
+            np.asarray(lats)[:, None], np.asarray(lons)[:, None], center_lats[None, :], center_lons[None, :]
+        )
+        countries = np.array([self.region_details[c]['country_code'] for c in codes])
+        return countries[distances.argmin(axis=1)]
+    
+    def fit_distance_estimator(self):
+        """Калибровка оценщика дорожных расстояний по результатам OSRM из кэша
+
+        Расстояния в матрице ставок рассчитаны из прямой × 1.3, поэтому для обучения
+        используются только реальные маршруты.
+        """
+        samples = list(distance_cache.distances.items())
+        if not samples or not self.region_details:
+            return
+        
+        points = np.array([(o[0], o[1], d[0], d[1]) for (o, d), _ in samples])
+        road_km = np.array([km for _, km in samples])
+        from_countries = self.nearest_region_countries(points[:, 0], points[:, 1])
+        to_countries = self.nearest_region_countries(points[:, 2], points[:, 3])
         
-        # Если не удалось рассчитать расстояние, возвращаем значение по умолчанию
-        return 1000
+        self.distance_estimator.fit(
+            points[:, 0], points[:, 1], points[:, 2], points[:, 3], road_km,
+            list(zip(from_countries, to_countries))
+        )
+        print(f"Оценщик расстояний откалиброван по {self.distance_estimator.samples} маршрутам, "
+              f"погрешность P90: {self.distance_estimator.error_bound}")
+    
+    def get_region_center(self, region):
+        """Координаты центра региона или None"""
+        details = self.region_details.get(region, {})
+        if details.get('center_lat') is None or details.get('center_lon') is None:
+            return None
+        return (details['center_lat'], details['center_lon'])
+    
+    def estimate_road_distance(self, from_coords, to_coords, from_country, to_country):
+        """Оценка дорожного расстояния между точками без обращения к OSRM"""
+        return self.distance_estimator.estimate_one(
+            from_coords[0], from_coords[1], to_coords[0], to_coords[1], (from_country, to_country)
+        )
     
     def get_distance_correction_factor(self, distance_km):
         """Получение коэффициента корректировки по расстоянию"""
@@ -286,22 +516,19 @@ class FreightCalculator:
         chargeable_ldm = max(ldm, weight_kg / DENSITY_FACTOR)
         
         # Проверяем, есть ли прямая ставка между регионами
-        rate_info = self.rates_dict.get((from_region, to_region))
+        rate_info = self.get_rate_info(from_region, to_region)
         
         # Если нет прямой ставки, используем базовую модель
         if not rate_info:
             # Базовые параметры для расчета с корректировкой
-            base_rate_per_ldm = 350 * self.correction_factors['base_rate_ldm_correction']  # Базовая ставка за 1 LDM в евро
-            base_rate_per_km = 0.45 * self.correction_factors['base_rate_km_correction']  # Базовая ставка за 1 км за 1 LDM в евро
+            base_rate_per_ldm = DEFAULT_RATE_PER_LDM * self.correction_factors['base_rate_ldm_correction']
+            base_rate_per_km = DEFAULT_RATE_PER_KM * self.correction_factors['base_rate_km_correction']
             
             # Коэффициенты для разных расстояний (с корректировкой)
             distance_factor = self.get_distance_correction_factor(distance_km)
             
             # Сезонные коэффициенты
-            seasonal_factors = {
-                "1": 0.9, "2": 0.9, "3": 0.95, "4": 1.0, "5": 1.0, "6": 1.05,
-                "7": 0.9, "8": 0.85, "9": 1.1, "10": 1.15, "11": 1.1, "12": 1.0
-            }
+            seasonal_factors = DEFAULT_SEASONAL_FACTORS
         else:
             # Используем данные из матрицы ставок с корректировкой
             base_rate_per_ldm = rate_info['base_rate_per_ldm'] * self.correction_factors['base_rate_ldm_correction']
@@ -323,13 +550,9 @@ class FreightCalculator:
         
         # Рассчитываем базовую стоимость с нелинейной формулой
         # Используем степенную функцию для учета эффекта масштаба
-        ldm_power = 0.9  # Показатель степени для LDM (меньше 1 для эффекта масштаба)
-        distance_power = 0.95  # Показатель степени для расстояния (меньше 1 для эффекта масштаба)
-        
-        # Нелинейная формула с эффектом масштаба
         base_cost = max(
-            base_rate_per_ldm * (chargeable_ldm ** ldm_power),
-            base_rate_per_km * (distance_km ** distance_power) * (chargeable_ldm ** ldm_power)
+            base_rate_per_ldm * (chargeable_ldm ** LDM_POWER),
+            base_rate_per_km * (distance_km ** DISTANCE_POWER) * (chargeable_ldm ** LDM_POWER)
         ) * distance_factor * volume_correction
         
         # Применяем общий коэффициент корректировки
@@ -349,12 +572,92 @@ class FreightCalculator:
         
         return round(final_cost, 2)
     
-    def get_rate_of_transportation(self, from_country_code, from_postal_code, to_country_code, to_postal_code, ldm, weight):
-        """Запуск калькулятора"""
+    def rate_tables(self):
+        """Параметры calculate_rate в виде массивов по id регионов для rate_grid
+
+        Словарь из массивов NumPy и чисел: его можно передать в другой процесс
+        без самого калькулятора. Пары без прямой ставки получают базовую модель,
+        индекс месяца 0 означает расчет без сезонного коэффициента.
+        """
+        n = len(self.region_codes)
+        base_rate_per_ldm = np.full((n, n), DEFAULT_RATE_PER_LDM * self.correction_factors['base_rate_ldm_correction'])
+        base_rate_per_km = np.full((n, n), DEFAULT_RATE_PER_KM * self.correction_factors['base_rate_km_correction'])
+        default_seasonal = [1.0] + [DEFAULT_SEASONAL_FACTORS.get(str(m), 1.0) for m in range(1, 13)]
+        seasonal = np.tile(np.array(default_seasonal), (n, n, 1))
+        for (i, j), rate_info in self.rates_dict.items():
+            base_rate_per_ldm[i, j] = rate_info['base_rate_per_ldm'] * self.correction_factors['base_rate_ldm_correction']
+            base_rate_per_km[i, j] = rate_info['base_rate_per_km'] * self.correction_factors['base_rate_km_correction']
+            seasonal[i, j, 1:] = [rate_info['seasonal_factors'].get(str(m), 1.0) for m in range(1, 13)]
+        
+        factors = self.correction_factors
+        return {
+            'region_codes': list(self.region_codes),
+            'distance': self.distance_matrix,
+            'base_rate_per_ldm': base_rate_per_ldm,
+            'base_rate_per_km': base_rate_per_km,
+            'seasonal': seasonal,
+            'distance_factors': [factors['distance_factors'][k] for k in ('0-500', '500-1000', '1000-1500', '1500-2000', '2000+')],
+            'ldm_factors': [factors['ldm_factors'][k] for k in ('0-1', '1-5', '5-10', '10+')],
+            'weight_factors': [factors['weight_factors'][k] for k in ('0-1000', '1000-3000', '3000-6000', '6000+')],
+            'general_correction': factors['general_correction'],
+        }
+    
+    @staticmethod
+    def rate_grid(tables, ldm, weight_kg, from_ids, to_ids, month, distance_km=None):
+        """Векторный calculate_rate по сетке, заданной совместимыми по форме (broadcast) массивами
+
+        Те же операции в том же порядке, что и в calculate_rate, поэтому ставки совпадают
+        до цента. month = 0 - без сезонного коэффициента; если distance_km не задан,
+        расстояние берется из матрицы регионов.
+        """
+        if distance_km is None:
+            distance_km = tables['distance'][from_ids, to_ids]
+        chargeable_ldm = np.maximum(ldm, weight_kg / DENSITY_FACTOR)
+        
+        distance_factor = np.select(
+            [distance_km < 500, distance_km < 1000, distance_km < 1500, distance_km < 2000],
+            tables['distance_factors'][:4], tables['distance_factors'][4]
+        )
+        ldm_correction = np.select([ldm <= 1, ldm <= 5, ldm <= 10], tables['ldm_factors'][:3], tables['ldm_factors'][3])
+        weight_correction = np.select(
+            [weight_kg <= 1000, weight_kg <= 3000, weight_kg <= 6000], tables['weight_factors'][:3], tables['weight_factors'][3]
+        )
+        volume_correction = np.minimum(ldm_correction, weight_correction)
+        
+        scaled_ldm = chargeable_ldm ** LDM_POWER
+        base_cost = np.maximum(
+            tables['base_rate_per_ldm'][from_ids, to_ids] * scaled_ldm,
+            tables['base_rate_per_km'][from_ids, to_ids] * (distance_km ** DISTANCE_POWER) * scaled_ldm
+        ) * distance_factor * volume_correction
+        base_cost = base_cost * tables['general_correction']
+        base_cost = base_cost * tables['seasonal'][from_ids, to_ids, month]
+        
+        insurance = base_cost * 0.035
+        co2_surcharge = weight_kg * 0.02 / 1000
+        return np.round(base_cost + insurance + co2_surcharge, 2)
+    
+    def get_rate_of_transportation(self, from_country_code, from_postal_code, to_country_code, to_postal_code, ldm, weight, deadline=None, fast=False):
+        """Запуск калькулятора (синхронная обертка для маршрутов Flask)"""
+        return asyncio.run(self.get_rate_of_transportation_async(
+            from_country_code, from_postal_code, to_country_code, to_postal_code, ldm, weight, deadline, fast
+        ))
+    
+    async def get_rate_of_transportation_async(self, from_country_code, from_postal_code, to_country_code, to_postal_code, ldm, weight, deadline=None, fast=False):
+        """Асинхронный расчет: геокодирование отправителя и получателя выполняется параллельно
+
+        deadline ограничивает суммарное время геокодирования и маршрутизации;
+        если бюджет исчерпан, расстояние берется из матрицы регионов.
+        В режиме fast сеть не используется: расстояние оценивается откалиброванной моделью
+        по кэшированным координатам или центрам регионов.
+        """
+        if deadline is None:
+            deadline = Deadline(float('inf'))
+        
         try:
             current_month = datetime.datetime.now().month
             
-            from_region, from_place = self.get_region_by_postal(from_postal_code, from_country_code)
+            with timed('europe', 'region_lookup'):
+                from_region, from_place = self.get_region_by_postal(from_postal_code, from_country_code, deadline)
 
             if from_country_code == to_country_code and from_postal_code == to_postal_code:
                 return {'error': 'Origin and destination cannot be the same.'}
@@ -362,7 +665,8 @@ class FreightCalculator:
             if not from_region:
                 return {'error': 'Country code or postal code not found: {from_country_code}, {from_postal_code}'}
             
-            to_region, to_place = self.get_region_by_postal(to_postal_code, to_country_code)
+            with timed('europe', 'region_lookup'):
+                to_region, to_place = self.get_region_by_postal(to_postal_code, to_country_code, deadline)
             
             if not to_region:
                 return {'error': 'Country code or postal code not found: {from_country_code}, {from_postal_code}'}
@@ -370,31 +674,80 @@ class FreightCalculator:
             from_address = f"{from_postal_code}, {from_place}, {from_country_code}"
             to_address = f"{to_postal_code}, {to_place}, {to_country_code}"
             
-            from_coords = self.get_coordinates(from_address)
-            to_coords = self.get_coordinates(to_address)
+            distance_source = 'osrm'
+            if fast:
+                from_coords = self.geocode_cache.get(from_address) or self.get_region_center(from_region)
+                to_coords = self.geocode_cache.get(to_address) or self.get_region_center(to_region)
+                distance_source = 'estimate'
+            else:
+                # Адреса независимы, поэтому геокодируем их одновременно
+                with timed('europe', 'geocode'):
+                    from_coords, to_coords = await asyncio.gather(
+                        asyncio.to_thread(self.get_coordinates, from_address, deadline),
+                        asyncio.to_thread(self.get_coordinates, to_address, deadline),
+                    )
             
             if not from_coords or None in from_coords or not to_coords or None in to_coords:
                 distance = self.get_distance_from_matrix(from_region, to_region)
+                distance_source = 'matrix'
+            elif fast:
+                distance = self.estimate_road_distance(from_coords, to_coords, from_country_code, to_country_code)
             else:
-                distance = self.get_road_distance(from_coords, to_coords)
+                with timed('europe', 'routing'):
+                    distance = await asyncio.to_thread(self.get_road_distance, from_coords, to_coords, deadline)
                 
                 if not distance:
-                    distance = self.get_distance_from_matrix(from_region, to_region)
+                    # OSRM недоступен или бюджет исчерпан: оцениваем по известным координатам
+                    distance = self.estimate_road_distance(from_coords, to_coords, from_country_code, to_country_code)
+                    distance_source = 'estimate'
             
-            # Расчёт
-            rate = self.calculate_rate(distance, ldm, weight, from_region, to_region, current_month)
-            
-            # Расчет тарифицируемого объема
-            chargeable_ldm = max(ldm, weight / DENSITY_FACTOR)
+            return self.build_quote(distance, ldm, weight, from_region, to_region, current_month, distance_source)
+        
+        except Exception as e:
+            return {'error': 'Something went wrong, please try again later.'}
+    
+    def build_quote(self, distance, ldm, weight, from_region, to_region, month, distance_source):
+        """Расчет ставки и формирование ответа по уже известному расстоянию"""
+        with timed('europe', 'rate'):
+            rate = self.calculate_rate(distance, ldm, weight, from_region, to_region, month)
+        
+        # Расчет тарифицируемого объема
+        chargeable_ldm = max(ldm, weight / DENSITY_FACTOR)
+        
+        return {
+            'distance': round(distance, 2),
+            'ldm': ldm,
+            'weight': weight,
+            'chargeable_ldm': round(chargeable_ldm, 2),
+            'month': month,
+            'rate': rate,
+            'distance_source': distance_source,
+            'distance_error_bound': self.distance_estimator.error_bound if distance_source == 'estimate' else None
+        }
+    
+    def estimate_rate_of_transportation(self, from_country_code, from_postal_code, to_country_code, to_postal_code, ldm, weight):
+        """Мгновенная оценка по матрице расстояний регионов, без ожидания сети
 
-            return {
-                'distance': round(distance, 2),
-                'ldm': ldm,
-                'weight': weight,
-                'chargeable_ldm': round(chargeable_ldm, 2),
-                'month': current_month,
-                'rate': rate
-            }
+        Первая фаза потокового расчета. Неизвестные индексы не геокодируются в ожидании:
+        запрос лишь ставится в очередь, и уточненный расчет найдет его готовым.
+        """
+        try:
+            current_month = datetime.datetime.now().month
+            no_wait = Deadline(0)
+            
+            if from_country_code == to_country_code and from_postal_code == to_postal_code:
+                return {'error': 'Origin and destination cannot be the same.'}
+            
+            from_region, _ = self.get_region_by_postal(from_postal_code, from_country_code, no_wait)
+            if not from_region:
+                return {'error': f'Country code or postal code not found: {from_country_code}, {from_postal_code}'}
+            
+            to_region, _ = self.get_region_by_postal(to_postal_code, to_country_code, no_wait)
+            if not to_region:
+                return {'error': f'Country code or postal code not found: {to_country_code}, {to_postal_code}'}
+            
+            distance = self.get_distance_from_matrix(from_region, to_region)
+            return self.build_quote(distance, ldm, weight, from_region, to_region, current_month, 'matrix')
         
         except Exception as e:
             return {'error': 'Something went wrong, please try again later.'}
@@ -12,13 +12,36 @@ import sys
 import math
 import random
 import argparse
+import threading
+import numpy as np
 from datetime import datetime
 
+from cachetools import LRUCache
+
+from core.spatial import KDTree
+from core.metrics import timed, cache_lookup
+
 # Константы
 DATA_DIR = 'data'
 DEFAULT_CONTAINER_TYPE = '40hc'
 DEFAULT_WEIGHT = 20000
 VOLATILITY_ALPHA = 1.2  # Коэффициент волатильности для нелинейной формулы
+QUOTE_CACHE_SIZE = 10000  # Количество кэшируемых расчетов (пара портов × контейнер × вес)
+NEAREST_PORTS_DEFAULT = 5  # Количество ближайших портов по умолчанию
+SCENARIO_TOP_CHANGES = 100  # Маршрутов с наибольшим изменением в ответе сценария
+MONTE_CARLO_SAMPLES = 10000  # Выборок на маршрут для диапазона ставки
+MONTE_CARLO_BLOCK_CELLS = 2000000  # Выборок × маршрутов в одном блоке пакетного расчета (~16 МБ на массив)
+RANGE_PERCENTILES = (10, 50, 90)
+INDEX_VOLATILITY = 0.10  # Стандартное отклонение значения индекса за срок действия ставки, доля текущего
+SEASONAL_SPREAD = 0.05  # Стандартное отклонение сезонного фактора, доля
+CRISIS_SPREAD = 0.5  # Надбавка активного кризиса (коэффициент - 1) равномерно в пределах ±50%
+# Параметры сценария -> таблица freight_rate_tables, которую они заменяют
+SCENARIO_OVERRIDES = {
+    'indices': 'volatility_factor',
+    'crises': 'crisis_multiplier',
+    'fuel_surcharges': 'fuel_surcharge_percent',
+    'seasonal_factors': 'seasonal_factor',
+}
 
 class MultimodalFreightCalculator:
     """Калькулятор ставок фрахта с нелинейной моделью расчета"""
@@ -40,9 +63,17 @@ class MultimodalFreightCalculator:
         self.crisis_coefficients = {}
         self.freight_indices = {}
         self.route_index_weights = {}
+        self.port_ids = []
+        self.port_index = None
+        
+        # Кэш расчетов: ключ включает дату, так как квартал и кризисы зависят от текущего дня
+        self.quote_cache = LRUCache(maxsize=QUOTE_CACHE_SIZE)
+        self.quote_cache_lock = threading.Lock()
+        self.network_grid = None  # (дата, базовые ставки всей сети) для сценариев
         
         # Загрузка данных из CSV-файлов
         self.load_ports()
+        self.build_port_index()
         self.load_basic_rates()
         self.load_fuel_surcharges()
         self.load_ecological_charges()
@@ -72,6 +103,40 @@ class MultimodalFreightCalculator:
             print(f"Ошибка при загрузке портов: {e}")
             sys.exit(1)
     
+    def build_port_index(self):
+        """Построение пространственного индекса (KD-дерево) по координатам портов"""
+        self.port_ids = list(self.ports)
+        self.port_index = KDTree(
+            [self.ports[p]['latitude'] for p in self.port_ids],
+            [self.ports[p]['longitude'] for p in self.port_ids]
+        )
+    
+    def nearest_ports(self, lat, lon, k=NEAREST_PORTS_DEFAULT):
+        """
+        Поиск ближайших портов к точке
+        
+        Args:
+            lat (float): Широта точки
+            lon (float): Долгота точки
+            k (int): Количество портов
+            
+        Returns:
+            list: Порты, отсортированные по расстоянию по дуге большого круга (distance_km)
+        """
+        distances, indices = self.port_index.query(lat, lon, k)
+        result = []
+        for distance, index in zip(distances, indices):
+            port_id = self.port_ids[index]
+            port = self.ports[port_id]
+            result.append({
+                'id': port_id,
+                'name': port['name'],
+                'country': port['country'],
+                'region': port['region'],
+                'distance_km': round(float(distance), 1)
+            })
+        return result
+    
     def load_basic_rates(self):
         """Загрузка базовых ставок между регионами из CSV"""
         try:
@@ -598,17 +663,20 @@ class MultimodalFreightCalculator:
         quarter = (month - 1) // 3 + 1
         return f"Q{quarter}"
     
-    def calculate_weighted_index_change(self, origin_region, destination_region):
+    def calculate_weighted_index_change(self, origin_region, destination_region, freight_indices=None):
         """
         Расчет взвешенного изменения индексов с учетом маршрута
         
         Args:
             origin_region (str): Регион отправления
             destination_region (str): Регион назначения
+            freight_indices (dict): Значения индексов вместо загруженных (для сценариев)
             
         Returns:
             float: Взвешенное изменение индексов в процентах
         """
+        if freight_indices is None:
+            freight_indices = self.freight_indices
         weighted_change = 0.0
         total_weight = 0.0
         
@@ -617,7 +685,7 @@ class MultimodalFreightCalculator:
         
         # Если нашли веса для маршрута, используем их
         if route_weights:
-            for index_name, index_data in self.freight_indices.items():
+            for index_name, index_data in freight_indices.items():
                 if index_name in route_weights:
                     current_value = index_data['current_value']
                     base_value = index_data['base_value']
@@ -631,7 +699,7 @@ class MultimodalFreightCalculator:
                     total_weight += weight
         else:
             # Если не нашли веса для маршрута, используем общие веса из freight_indices
-            for index_name, index_data in self.freight_indices.items():
+            for index_name, index_data in freight_indices.items():
                 current_value = index_data['current_value']
                 base_value = index_data['base_value']
                 weight = index_data['weight']
@@ -692,7 +760,36 @@ class MultimodalFreightCalculator:
     
     def calculate_freight_rate(self, origin, destination, container_type, weight=DEFAULT_WEIGHT):
         """
-        Расчет ставки фрахта с использованием нелинейной модели
+        Расчет ставки фрахта с использованием нелинейной модели (с кэшированием результата)
+        
+        Args:
+            origin (str): ID порта отправления
+            destination (str): ID порта назначения
+            container_type (str): Тип контейнера
+            weight (float): Вес груза в кг
+            
+        Returns:
+            dict: Результат расчета
+        """
+        key = (origin, destination, container_type, weight, datetime.now().strftime('%Y-%m-%d'))
+        with self.quote_cache_lock:
+            cached = self.quote_cache.get(key)
+        cache_lookup('multimodal_quote', cached is not None)
+        if cached is not None:
+            return dict(cached)
+        
+        with timed('multimodal', 'rate'):
+            result = self.compute_freight_rate(origin, destination, container_type, weight)
+        
+        # Ошибки не кэшируем
+        if 'error' not in result:
+            with self.quote_cache_lock:
+                self.quote_cache[key] = result
+        return dict(result)
+    
+    def compute_freight_rate(self, origin, destination, container_type, weight=DEFAULT_WEIGHT):
+        """
+        Расчет ставки фрахта без обращения к кэшу
         
         Args:
             origin (str): ID порта отправления
@@ -861,6 +958,513 @@ class MultimodalFreightCalculator:
         
         return result
     
+    def freight_rate_tables(self, container_types=None):
+        """
+        Параметры compute_freight_rate в виде массивов для векторного расчета
+        
+        Все, что зависит только от пары регионов, считается здесь один раз
+        скалярными методами калькулятора (поэтому кризисы и квартал берутся на
+        текущую дату), а зависящее от порта - один раз на порт. Результат состоит
+        из массивов NumPy и списков и передается в другие процессы без калькулятора.
+        
+        Args:
+            container_types (list): Типы контейнеров (по умолчанию list_container_types())
+        
+        Returns:
+            dict: Массивы по регионам (R), портам (P) и типам контейнеров (C)
+        """
+        container_types = list(container_types or self.list_container_types())
+        port_ids = list(self.ports)
+        regions = sorted({port['region'] for port in self.ports.values()})
+        region_ids = {region: i for i, region in enumerate(regions)}
+        quarter = self.get_current_quarter()
+        
+        n, c = len(regions), len(container_types)
+        basic_rate = np.full((n, n, c), np.nan)
+        volatility_factor = np.ones((n, n))
+        crisis_multiplier = np.ones((n, n))
+        fuel_surcharge_percent = np.zeros((n, n))
+        fuel_surcharge_range = np.full((n, n, 2), np.nan)
+        seasonal_factor = np.ones((n, n))
+        index_names = list(self.freight_indices)
+        index_weights = np.zeros((n, n, len(index_names)))
+        for i, origin_region in enumerate(regions):
+            for j, destination_region in enumerate(regions):
+                for k, container_type in enumerate(container_types):
+                    basic_rate_data = self.get_basic_rate(origin_region, destination_region, container_type)
+                    if basic_rate_data is not None:
+                        basic_rate[i, j, k] = basic_rate_data['avg_rate']
+                
+                weighted_index_change = self.calculate_weighted_index_change(origin_region, destination_region)
+                volatility_factor[i, j] = (1 + weighted_index_change / 100) ** VOLATILITY_ALPHA
+                crisis_multiplier[i, j] = self.get_crisis_multiplier(origin_region, destination_region)
+                fuel_surcharge_data = self.get_fuel_surcharge(origin_region, destination_region)
+                if fuel_surcharge_data:
+                    fuel_surcharge_percent[i, j] = (fuel_surcharge_data['min_percent'] + fuel_surcharge_data['max_percent']) / 2 / 100
+                    fuel_surcharge_range[i, j] = (fuel_surcharge_data['min_percent'], fuel_surcharge_data['max_percent'])
+                index_weights[i, j] = self.index_weight_vector(origin_region, destination_region, index_names)
+                seasonal_data = self.get_seasonal_factor(origin_region, destination_region, quarter)
+                if seasonal_data:
+                    seasonal_factor[i, j] = seasonal_data['factor']
+        
+        # Экологические сборы: сумма ECA и CLS в том же порядке, что и в compute_freight_rate
+        eco_charge = np.zeros((n, c))
+        for i, region in enumerate(regions):
+            for k, container_type in enumerate(container_types):
+                total = 0
+                for charge_type in ['ECA', 'CLS']:
+                    eco = self.get_ecological_charge(region, charge_type, container_type)
+                    if eco:
+                        total += eco['amount']
+                eco_charge[i, k] = total
+        
+        # Надбавка за перегрузку: первый уровень порта, для которого задан тип контейнера
+        congestion_charge = np.zeros((len(port_ids), c))
+        for p, port_id in enumerate(port_ids):
+            for k, container_type in enumerate(container_types):
+                for level in self.port_congestion.get(port_id, {}):
+                    if container_type in self.port_congestion[port_id][level]:
+                        congestion_charge[p, k] = self.port_congestion[port_id][level][container_type]['amount']
+                        break
+        
+        fallback_multiplier = {'20dv': 1.0, '40dv': 1.4, '40hc': 1.5}
+        return {
+            'port_ids': port_ids,
+            'regions': regions,
+            'container_types': container_types,
+            'port_regions': np.array([region_ids[self.ports[p]['region']] for p in port_ids]),
+            'latitude': np.array([self.ports[p]['latitude'] for p in port_ids]),
+            'longitude': np.array([self.ports[p]['longitude'] for p in port_ids]),
+            'basic_rate': basic_rate,
+            'fallback_multiplier': np.array([fallback_multiplier.get(t, 1.0) for t in container_types]),
+            'volatility_factor': volatility_factor,
+            'crisis_multiplier': crisis_multiplier,
+            'fuel_surcharge_percent': fuel_surcharge_percent,
+            'seasonal_factor': seasonal_factor,
+            'eco_charge': eco_charge,
+            'congestion_charge': congestion_charge,
+            'current_quarter': quarter,
+            'index_names': index_names,
+            'index_current': np.array([self.freight_indices[name]['current_value'] for name in index_names]),
+            'index_base': np.array([self.freight_indices[name]['base_value'] for name in index_names]),
+            'index_weights': index_weights,
+            'fuel_surcharge_range': fuel_surcharge_range,
+        }
+    
+    def index_weight_vector(self, origin_region, destination_region, index_names):
+        """
+        Нормированные веса индексов маршрута, как их применяет calculate_weighted_index_change
+        
+        Args:
+            origin_region (str): Регион отправления
+            destination_region (str): Регион назначения
+            index_names (list): Порядок индексов в результате
+            
+        Returns:
+            list: Веса, в сумме 1 (или нули, если весов нет)
+        """
+        route_weights = self.get_index_weights_for_route(origin_region, destination_region)
+        if route_weights:
+            weights = [route_weights[name]['weight'] if name in route_weights else 0.0 for name in index_names]
+        else:
+            weights = [self.freight_indices[name]['weight'] for name in index_names]
+        total = sum(weights)
+        return [weight / total for weight in weights] if total > 0 else [0.0] * len(index_names)
+    
+    @staticmethod
+    def freight_rate_components(tables, origins, destinations):
+        """
+        Составляющие ставки для сетки портов отправления × портов назначения × типов контейнеров
+        
+        Args:
+            tables (dict): Результат freight_rate_tables
+            origins (array): Индексы портов отправления в tables['port_ids']
+            destinations (array): Индексы портов назначения
+        
+        Returns:
+            dict: Массивы формы (len(origins), len(destinations), C)
+        """
+        origins = np.asarray(origins)[:, None, None]
+        destinations = np.asarray(destinations)[None, :, None]
+        origin_regions = tables['port_regions'][origins]
+        destination_regions = tables['port_regions'][destinations]
+        
+        # Формула гаверсинуса, как в calculate_distance, в морских милях
+        lat1 = np.radians(tables['latitude'][origins])
+        lon1 = np.radians(tables['longitude'][origins])
+        lat2 = np.radians(tables['latitude'][destinations])
+        lon2 = np.radians(tables['longitude'][destinations])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        distance = 3440.07 * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+        
+        # Нет базовой ставки между регионами - расчет на основе расстояния (calculate_fallback_rate)
+        k = np.arange(len(tables['container_types']))[None, None, :]
+        basic_rate = tables['basic_rate'][origin_regions, destination_regions, k]
+        fallback_rate = np.maximum(distance * 0.5 * tables['fallback_multiplier'][k], 1000)
+        
+        shape = np.broadcast_shapes(basic_rate.shape, distance.shape)
+        return {
+            'distance': np.broadcast_to(distance, shape),
+            'base_rate': np.where(np.isnan(basic_rate), fallback_rate, basic_rate),
+            'volatility_factor': np.broadcast_to(tables['volatility_factor'][origin_regions, destination_regions], shape),
+            'crisis_multiplier': np.broadcast_to(tables['crisis_multiplier'][origin_regions, destination_regions], shape),
+            'fuel_surcharge_percent': np.broadcast_to(tables['fuel_surcharge_percent'][origin_regions, destination_regions], shape),
+            'seasonal_factor': np.broadcast_to(tables['seasonal_factor'][origin_regions, destination_regions], shape),
+            'eco_charge_origin': np.broadcast_to(tables['eco_charge'][origin_regions, k], shape),
+            'eco_charge_destination': np.broadcast_to(tables['eco_charge'][destination_regions, k], shape),
+            'congestion_charge_origin': np.broadcast_to(tables['congestion_charge'][origins, k], shape),
+            'congestion_charge_destination': np.broadcast_to(tables['congestion_charge'][destinations, k], shape),
+        }
+    
+    @staticmethod
+    def price_freight_rate_components(components):
+        """
+        Шаги 3-9 compute_freight_rate над массивами составляющих
+        
+        Операции выполняются в том же порядке, что и в скалярном расчете,
+        поэтому округленные ставки совпадают с compute_freight_rate.
+        
+        Args:
+            components (dict): Результат freight_rate_components
+        
+        Returns:
+            dict: Округленные base_rate, adjusted_rate, fuel_surcharge и total_rate
+        """
+        adjusted_rate = components['base_rate'] * components['volatility_factor']
+        adjusted_rate = adjusted_rate * components['crisis_multiplier']
+        fuel_surcharge = adjusted_rate * components['fuel_surcharge_percent']
+        adjusted_rate = adjusted_rate * components['seasonal_factor']
+        total_rate = (adjusted_rate + fuel_surcharge + components['eco_charge_origin'] + components['eco_charge_destination']
+                      + components['congestion_charge_origin'] + components['congestion_charge_destination'])
+        return {
+            'base_rate': np.rint(components['base_rate']),
+            'adjusted_rate': np.rint(adjusted_rate),
+            'fuel_surcharge': np.rint(fuel_surcharge),
+            'total_rate': np.rint(total_rate),
+        }
+    
+    def network_rate_grid(self):
+        """
+        Базовые ставки всей сети: все пары портов × типы контейнеров
+        
+        Считается один раз в день (кризисы и квартал зависят от даты) и служит
+        точкой отсчета для сценариев.
+        
+        Returns:
+            tuple: (tables, components, prices) - см. freight_rate_tables,
+                freight_rate_components и price_freight_rate_components
+        """
+        day = datetime.now().strftime('%Y-%m-%d')
+        with self.quote_cache_lock:
+            if self.network_grid is not None and self.network_grid[0] == day:
+                return self.network_grid[1]
+        
+        tables = self.freight_rate_tables()
+        ports = np.arange(len(tables['port_ids']))
+        components = self.freight_rate_components(tables, ports, ports)
+        grid = (tables, components, self.price_freight_rate_components(components))
+        with self.quote_cache_lock:
+            self.network_grid = (day, grid)
+        return grid
+    
+    def scenario_region_pair(self, pair, region_ids):
+        """
+        Индексы пары регионов из ключа вида "Asia-Europe" (как region_pair в crisis_coefficients.csv)
+        
+        Args:
+            pair (str): Регион отправления и регион назначения через дефис
+            region_ids (dict): Регион -> индекс в таблицах
+            
+        Returns:
+            tuple: (индекс отправления, индекс назначения)
+        """
+        regions = pair.split('-')
+        if len(regions) != 2 or regions[0] not in region_ids or regions[1] not in region_ids:
+            raise ValueError(f'Неизвестная пара регионов: {pair}')
+        return region_ids[regions[0]], region_ids[regions[1]]
+    
+    def scenario_tables(self, tables, overrides):
+        """
+        Таблицы freight_rate_tables с подставленными значениями сценария
+        
+        Загруженные данные и переданные таблицы не изменяются: измененные
+        массивы копируются.
+        
+        Args:
+            tables (dict): Результат freight_rate_tables
+            overrides (dict): Изменения сценария:
+                indices: {"SCFI": 20} - изменение текущего значения в процентах,
+                    {"SCFI": {"current_value": 3500}} - новое значение
+                crises: {"Asia-Europe": 1.4} - кризисный коэффициент пары регионов
+                fuel_surcharges: {"Asia-Europe": 18} - надбавка в процентах,
+                    или {"Asia-Europe": {"min_percent": 15, "max_percent": 25}}
+                seasonal_factors: {"Asia-Europe": 1.1} - сезонный фактор текущего квартала
+                
+        Returns:
+            dict: Таблицы сценария
+        """
+        unknown = set(overrides) - set(SCENARIO_OVERRIDES)
+        if unknown:
+            raise ValueError(f'Неизвестные параметры сценария: {", ".join(sorted(unknown))}')
+        
+        tables = dict(tables)
+        regions = tables['regions']
+        region_ids = {region: i for i, region in enumerate(regions)}
+        
+        if overrides.get('indices'):
+            freight_indices = {name: dict(data) for name, data in self.freight_indices.items()}
+            for name, change in overrides['indices'].items():
+                if name not in freight_indices:
+                    raise ValueError(f'Неизвестный индекс: {name}')
+                if isinstance(change, dict):
+                    freight_indices[name]['current_value'] = float(change['current_value'])
+                else:
+                    freight_indices[name]['current_value'] *= 1 + float(change) / 100
+            tables['index_current'] = np.array([freight_indices[name]['current_value'] for name in tables['index_names']])
+            
+            volatility_factor = np.ones((len(regions), len(regions)))
+            for i, origin_region in enumerate(regions):
+                for j, destination_region in enumerate(regions):
+                    weighted_index_change = self.calculate_weighted_index_change(origin_region, destination_region, freight_indices)
+                    volatility_factor[i, j] = (1 + weighted_index_change / 100) ** VOLATILITY_ALPHA
+            tables['volatility_factor'] = volatility_factor
+        
+        for key, table in SCENARIO_OVERRIDES.items():
+            if key == 'indices' or not overrides.get(key):
+                continue
+            values = tables[table].copy()
+            if key == 'fuel_surcharges':
+                tables['fuel_surcharge_range'] = tables['fuel_surcharge_range'].copy()
+            for pair, value in overrides[key].items():
+                i, j = self.scenario_region_pair(pair, region_ids)
+                if key == 'fuel_surcharges':
+                    fuel_range = (value['min_percent'], value['max_percent']) if isinstance(value, dict) else (value, value)
+                    fuel_range = tuple(float(percent) for percent in fuel_range)
+                    tables['fuel_surcharge_range'][i, j] = fuel_range
+                    values[i, j] = (fuel_range[0] + fuel_range[1]) / 2 / 100
+                else:
+                    values[i, j] = float(value)
+            tables[table] = values
+        
+        return tables
+    
+    def price_scenario(self, overrides, limit=SCENARIO_TOP_CHANGES):
+        """
+        Пересчет всех пар портов × типов контейнеров по сценарию и сравнение с базовыми ставками
+        
+        Args:
+            overrides (dict): Изменения сценария (см. scenario_tables)
+            limit (int): Количество маршрутов с наибольшим изменением в ответе
+            
+        Returns:
+            dict: Итоги по сети, по парам регионов и маршруты с наибольшим изменением
+        """
+        tables, components, baseline = self.network_rate_grid()
+        ports = np.arange(len(tables['port_ids']))
+        scenario = self.price_freight_rate_components(
+            self.freight_rate_components(self.scenario_tables(tables, overrides), ports, ports)
+        )
+        
+        before = baseline['total_rate']
+        after = scenario['total_rate']
+        lanes = np.broadcast_to((ports[:, None] != ports[None, :])[:, :, None], before.shape)
+        change = np.where(lanes, after - before, 0)
+        changed = change != 0
+        
+        def percent(new, old):
+            return round(float(new / old - 1) * 100, 2) if old else None
+        
+        # Итоги по парам регионов: суммы по маршрутам через bincount по индексу пары
+        n = len(tables['regions'])
+        pair = (tables['port_regions'][:, None] * n + tables['port_regions'][None, :])[:, :, None]
+        pair = np.broadcast_to(pair, before.shape)[lanes]
+        pair_lanes = np.bincount(pair, minlength=n * n)
+        pair_changed = np.bincount(pair, weights=changed[lanes], minlength=n * n)
+        pair_before = np.bincount(pair, weights=before[lanes], minlength=n * n)
+        pair_after = np.bincount(pair, weights=after[lanes], minlength=n * n)
+        by_region_pair = [
+            {
+                'origin_region': tables['regions'][p // n],
+                'destination_region': tables['regions'][p % n],
+                'lanes': int(pair_lanes[p]),
+                'changed_lanes': int(pair_changed[p]),
+                'baseline_total': float(pair_before[p]),
+                'scenario_total': float(pair_after[p]),
+                'change_percent': percent(pair_after[p], pair_before[p]),
+            }
+            for p in np.nonzero(pair_changed)[0]
+        ]
+        by_region_pair.sort(key=lambda row: abs(row['change_percent'] or 0), reverse=True)
+        
+        # Маршруты с наибольшим относительным изменением
+        relative = np.abs(change) / np.where(before > 0, before, np.inf)
+        top = np.argsort(relative, axis=None)[::-1][:min(limit, int(changed.sum()))]
+        top_changes = []
+        for o, d, k in zip(*np.unravel_index(top, before.shape)):
+            top_changes.append({
+                'origin': tables['port_ids'][o],
+                'destination': tables['port_ids'][d],
+                'container_type': tables['container_types'][k],
+                'baseline': float(before[o, d, k]),
+                'scenario': float(after[o, d, k]),
+                'change': float(change[o, d, k]),
+                'change_percent': percent(after[o, d, k], before[o, d, k]),
+            })
+        
+        baseline_total = float(before[lanes].sum())
+        scenario_total = float(after[lanes].sum())
+        return {
+            'scenario': overrides,
+            'calculation_date': datetime.now().strftime('%Y-%m-%d'),
+            'current_quarter': tables['current_quarter'],
+            'lanes': int(lanes.sum()),
+            'changed_lanes': int(changed.sum()),
+            'baseline_total': baseline_total,
+            'scenario_total': scenario_total,
+            'change_percent': percent(scenario_total, baseline_total),
+            'by_region_pair': by_region_pair,
+            'top_changes': top_changes,
+        }
+    
+    @staticmethod
+    def sample_freight_rate_totals(tables, components, origins, destinations, container, samples, rng):
+        """
+        Итоговые ставки маршрутов при случайных значениях неопределенных параметров (Монте-Карло)
+        
+        Неопределенными считаются: значения индексов фрахта (нормальное распределение
+        вокруг текущего значения), топливная надбавка (равномерно между min_percent
+        и max_percent), сезонный фактор и надбавка активного кризиса. Индексы, топливо,
+        сезон и кризис в одной выборке общие для всех маршрутов: рынок движется
+        согласованно. Остальные шаги совпадают с price_freight_rate_components.
+        
+        Args:
+            tables (dict): Результат freight_rate_tables
+            components (dict): Результат freight_rate_components для всей сети
+            origins (array): Индексы портов отправления маршрутов
+            destinations (array): Индексы портов назначения маршрутов
+            container (int): Индекс типа контейнера
+            samples (int): Количество выборок
+            rng (numpy.random.Generator): Генератор случайных чисел
+            
+        Returns:
+            numpy.ndarray: Итоговые ставки формы (samples, количество маршрутов)
+        """
+        origins = np.asarray(origins)
+        destinations = np.asarray(destinations)
+        origin_regions = tables['port_regions'][origins]
+        destination_regions = tables['port_regions'][destinations]
+        
+        index_values = tables['index_current'] * (1 + INDEX_VOLATILITY * rng.standard_normal((samples, len(tables['index_names']))))
+        index_change = (index_values - tables['index_base']) / tables['index_base'] * 100
+        weighted_index_change = index_change @ tables['index_weights'][origin_regions, destination_regions].T
+        volatility_factor = (1 + weighted_index_change / 100) ** VOLATILITY_ALPHA
+        
+        crisis_multiplier = tables['crisis_multiplier'][origin_regions, destination_regions]
+        crisis_multiplier = 1 + (crisis_multiplier - 1) * rng.uniform(1 - CRISIS_SPREAD, 1 + CRISIS_SPREAD, (samples, 1))
+        
+        fuel_range = tables['fuel_surcharge_range'][origin_regions, destination_regions]
+        fuel_percent = fuel_range[:, 0] + rng.random((samples, 1)) * (fuel_range[:, 1] - fuel_range[:, 0])
+        fuel_surcharge_percent = np.nan_to_num(fuel_percent) / 100  # нет надбавки для пары регионов - 0
+        
+        seasonal_factor = tables['seasonal_factor'][origin_regions, destination_regions]
+        seasonal_factor = seasonal_factor * (1 + SEASONAL_SPREAD * rng.standard_normal((samples, 1)))
+        
+        lane = (origins, destinations, container)
+        adjusted_rate = components['base_rate'][lane] * volatility_factor * crisis_multiplier
+        fuel_surcharge = adjusted_rate * fuel_surcharge_percent
+        adjusted_rate = adjusted_rate * seasonal_factor
+        fixed_charges = (components['eco_charge_origin'][lane] + components['eco_charge_destination'][lane]
+                         + components['congestion_charge_origin'][lane] + components['congestion_charge_destination'][lane])
+        return adjusted_rate + fuel_surcharge + fixed_charges
+    
+    def range_lanes(self, tables, origin, destination, container_type):
+        """
+        Индексы порта отправления, порта назначения и типа контейнера в таблицах
+        
+        Args:
+            tables (dict): Результат freight_rate_tables
+            origin (str): ID порта отправления
+            destination (str): ID порта назначения или None
+            container_type (str): Тип контейнера
+            
+        Returns:
+            tuple: ((origin, destination, container), None) или (None, текст ошибки)
+        """
+        port_positions = {port_id: i for i, port_id in enumerate(tables['port_ids'])}
+        if origin not in port_positions:
+            return None, f'Порт отправления {origin} не найден'
+        if destination is not None and destination not in port_positions:
+            return None, f'Порт назначения {destination} не найден'
+        if container_type not in tables['container_types']:
+            return None, f'Тип контейнера {container_type} не поддерживается'
+        return (port_positions[origin], port_positions.get(destination), tables['container_types'].index(container_type)), None
+    
+    def freight_rate_range(self, origin, destination, container_type, samples=MONTE_CARLO_SAMPLES, seed=None):
+        """
+        Диапазон ставки маршрута: P10/P50/P90 итоговой ставки по Монте-Карло
+        
+        Args:
+            origin (str): ID порта отправления
+            destination (str): ID порта назначения
+            container_type (str): Тип контейнера
+            samples (int): Количество выборок
+            seed (int): Зерно генератора для воспроизводимого результата
+            
+        Returns:
+            dict: p10, p50, p90 и количество выборок
+        """
+        tables, components, _ = self.network_rate_grid()
+        lane, error = self.range_lanes(tables, origin, destination, container_type)
+        if error:
+            return {'error': error}
+        
+        o, d, k = lane
+        totals = self.sample_freight_rate_totals(tables, components, [o], [d], k, samples, np.random.default_rng(seed))
+        p10, p50, p90 = np.percentile(totals[:, 0], RANGE_PERCENTILES)
+        return {'p10': round(float(p10)), 'p50': round(float(p50)), 'p90': round(float(p90)), 'samples': samples}
+    
+    def freight_rate_ranges(self, origin, container_type, samples=MONTE_CARLO_SAMPLES, seed=None):
+        """
+        Диапазоны ставок из порта отправления во все остальные порты (пакетный Монте-Карло)
+        
+        Маршруты считаются блоками, чтобы память не росла с количеством портов.
+        
+        Args:
+            origin (str): ID порта отправления
+            container_type (str): Тип контейнера
+            samples (int): Количество выборок на маршрут
+            seed (int): Зерно генератора для воспроизводимого результата
+            
+        Returns:
+            list: Для каждого порта назначения - базовая ставка total_rate и p10, p50, p90
+        """
+        tables, components, prices = self.network_rate_grid()
+        lane, error = self.range_lanes(tables, origin, None, container_type)
+        if error:
+            return {'error': error}
+        
+        o, _, k = lane
+        rng = np.random.default_rng(seed)
+        destinations = np.array([d for d in range(len(tables['port_ids'])) if d != o])
+        block = max(1, MONTE_CARLO_BLOCK_CELLS // samples)
+        result = []
+        for start in range(0, len(destinations), block):
+            chunk = destinations[start:start + block]
+            totals = self.sample_freight_rate_totals(tables, components, np.full(len(chunk), o), chunk, k, samples, rng)
+            percentiles = np.percentile(totals, RANGE_PERCENTILES, axis=0)
+            for i, d in enumerate(chunk):
+                port_id = tables['port_ids'][d]
+                result.append({
+                    'destination': port_id,
+                    'destination_name': self.ports[port_id]['name'],
+                    'destination_region': self.ports[port_id]['region'],
+                    'total_rate': float(prices['total_rate'][o, d, k]),
+                    'p10': round(float(percentiles[0, i])),
+                    'p50': round(float(percentiles[1, i])),
+                    'p90': round(float(percentiles[2, i])),
+                })
+        return result
+    
     def list_ports(self):
         """
         Вывод списка доступных портов
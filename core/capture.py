@@ -0,0 +1,72 @@
+"""
+Opt-in capture of production traffic for offline replay (CAPTURE=1).
+
+Two kinds of records are written, as gzip-compressed JSONL:
+
+  * every /api request body, recorded by a before_request hook on api_bp;
+  * what the upstreams answered, at the point where each answer enters a cache:
+        nominatim  address -> [lat, lon] or null        (GeocodingDispatcher.finish)
+        osrm       [origin key, destination key] -> km  (DistanceCache.put / update)
+        dns        domain -> [has_mx, ttl]               (email_verifiers.cache_mx_result)
+
+`python -m core.replay` feeds the requests back through the app and answers the
+upstream calls from the captured values, so it runs without any network.
+Records use the background writer of the quote log. The request thread only
+appends to a deque. Mail endpoints are not captured: their bodies carry personal
+data, and replaying them would send mail.
+"""
+
+import gzip
+import os
+import time
+
+from flask import request
+
+from core.quote_log import QuoteLog
+
+CAPTURE_ENABLED = os.environ.get('CAPTURE') == '1'
+CAPTURE_DIR = os.environ.get('CAPTURE_DIR', os.path.join("data", "capture"))
+CAPTURE_SKIP_VIEWS = {'send_email', 'send_contact_form', 'memory_diagnostics'}
+
+
+class CaptureLog(QuoteLog):
+    prefix = 'capture'
+    suffix = '.jsonl.gz'
+
+    def __init__(self, directory=CAPTURE_DIR, enabled=CAPTURE_ENABLED, **kwargs):
+        super().__init__(directory=directory, enabled=enabled, **kwargs)
+
+    def format(self, record):
+        return self.encode(record)
+
+    def open_path(self, path):
+        return gzip.open(path, 'at', encoding='utf-8')
+
+
+capture_log = CaptureLog()
+
+
+def capture_upstream(service, key, value):
+    """Record an upstream answer; a no-op unless capture is enabled."""
+    if capture_log.enabled:
+        capture_log.enqueue({'kind': 'upstream', 'service': service, 'key': key, 'value': value})
+
+
+def capture_request():
+    """before_request hook for api_bp."""
+    view = (request.endpoint or '').split('.')[-1]
+    if view in CAPTURE_SKIP_VIEWS:
+        return
+    capture_log.enqueue({
+        'kind': 'request',
+        'ts': time.time(),
+        'method': request.method,
+        'path': request.path,
+        'args': request.args.to_dict(flat=False),
+        'body': request.get_json(silent=True),
+    })
+
+
+def init_capture(blueprint):
+    if capture_log.enabled:
+        blueprint.before_request(capture_request)
@@ -0,0 +1,24 @@
+import time
+
+
+class Deadline:
+    """Time budget shared by every stage of a single request."""
+
+    def __init__(self, budget_seconds):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self):
+        """Seconds left before the deadline (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap):
+        """Timeout for the next upstream call: `cap`, trimmed to the remaining budget."""
+        return min(cap, self.remaining())
+
+    def can_wait(self, seconds):
+        """Whether sleeping `seconds` still leaves time for another attempt."""
+        return self.remaining() > seconds
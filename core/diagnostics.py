@@ -0,0 +1,197 @@
+"""
+Memory accounting for the data the calculators keep loaded.
+
+Every data attribute of the calculators (postal_db, regions_dict, rates_dict,
+region_details, the multimodal tariff dicts, geocode and quote caches, ...) and
+the shared caches is walked and reported with its deep size and object count.
+Structures are measured independently, so an object shared by two of them is
+counted in both.
+
+tracemalloc shows what loading allocated:
+
+    python -m core.diagnostics            # loads the calculators between two snapshots
+    python -m core.diagnostics --json
+
+In a running worker, MEMORY_TRACE=1 starts tracemalloc before the calculators are
+loaded; GET /api/diagnostics/memory then compares against that baseline, which
+also exposes cache growth since boot.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import tracemalloc
+import types
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+MEMORY_TRACE = os.environ.get('MEMORY_TRACE') == '1'
+TRACEMALLOC_FRAMES = 1
+DEFAULT_TOP = 15
+
+SCALAR_TYPES = (str, bytes, int, float, bool, complex, type(None))
+# Not data: walking into these would reach modules, threads and the calculators themselves
+OPAQUE_TYPES = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                threading.Thread, type(threading.Lock()), type(threading.RLock()), threading.Condition)
+
+baseline = None
+
+
+def start_tracing():
+    """Take the baseline snapshot if MEMORY_TRACE is set; call before the data is loaded."""
+    global baseline
+    if MEMORY_TRACE and baseline is None:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        baseline = tracemalloc.take_snapshot()
+
+
+def pandas_size(obj):
+    usage = obj.memory_usage(deep=True)
+    return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+
+
+def deep_size(obj):
+    """(bytes, objects) reachable from `obj`; pandas objects are measured by memory_usage(deep=True)."""
+    seen = set()
+    stack = [obj]
+    size = objects = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, OPAQUE_TYPES):
+            continue
+        seen.add(id(item))
+        objects += 1
+
+        if isinstance(item, (pd.DataFrame, pd.Series, pd.Index)):
+            size += pandas_size(item)
+            continue
+        size += sys.getsizeof(item)
+        if isinstance(item, SCALAR_TYPES):
+            continue
+        if isinstance(item, np.ndarray):
+            if not item.flags.owndata:
+                size += item.nbytes  # views are not counted by getsizeof
+            if item.dtype == object:
+                stack.extend(item.ravel().tolist())
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        else:
+            attributes = getattr(item, '__dict__', None)
+            if attributes is not None:
+                stack.append(attributes)
+            for cls in type(item).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    if hasattr(item, slot):
+                        stack.append(getattr(item, slot))
+    return size, objects
+
+
+def data_attributes(prefix, owner):
+    """{'<prefix>.<attr>': value} for the non-scalar data held by `owner`."""
+    return {f'{prefix}.{name}': value for name, value in vars(owner).items()
+            if not isinstance(value, SCALAR_TYPES + OPAQUE_TYPES)}
+
+
+def structure_report(structures):
+    """[{'name', 'bytes', 'objects'}] sorted by size, largest first."""
+    report = []
+    for name, value in structures.items():
+        size, objects = deep_size(value)
+        report.append({'name': name, 'bytes': size, 'objects': objects})
+    return sorted(report, key=lambda row: row['bytes'], reverse=True)
+
+
+def tracemalloc_diff(before, after, top=DEFAULT_TOP, key_type='filename'):
+    """Largest allocation changes between two snapshots, grouped by file (or 'lineno')."""
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>')]
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), key_type)
+    return {
+        'total_bytes': sum(stat.size for stat in stats),
+        'total_diff_bytes': sum(stat.size_diff for stat in stats),
+        'top': [{'location': str(stat.traceback), 'diff_bytes': stat.size_diff,
+                 'bytes': stat.size, 'count_diff': stat.count_diff} for stat in stats[:top]],
+    }
+
+
+def current_rss():
+    """Resident set size in bytes (Linux), or None."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def memory_report(structures, top=DEFAULT_TOP, before=None):
+    """Deep sizes of `structures`, plus a tracemalloc comparison against `before` when tracing."""
+    report = {'rss_bytes': current_rss(), 'structures': structure_report(structures), 'tracemalloc': None}
+    before = before or baseline
+    if before is not None and tracemalloc.is_tracing():
+        report['tracemalloc'] = tracemalloc_diff(before, tracemalloc.take_snapshot(), top)
+    return report
+
+
+def format_bytes(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+def print_report(report):
+    if report['rss_bytes'] is not None:
+        print(f"RSS: {format_bytes(report['rss_bytes'])}")
+    print(f"\n{'Structure':<45} {'Size':>12} {'Objects':>10}")
+    for row in report['structures']:
+        print(f"{row['name']:<45} {format_bytes(row['bytes']):>12} {row['objects']:>10}")
+
+    trace = report['tracemalloc']
+    if trace:
+        print(f"\ntracemalloc: {format_bytes(trace['total_diff_bytes'])} allocated by loading")
+        for stat in trace['top']:
+            print(f"{format_bytes(stat['diff_bytes']):>12} {stat['count_diff']:>9}  {stat['location']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory used by the loaded tariff structures')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='tracemalloc entries to show')
+    parser.add_argument('--by-line', action='store_true', help='group tracemalloc by line instead of file')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    from calculators.europe_calculator import FreightCalculator
+    from calculators.asian_calculator import AsianFreightCalculator
+    from calculators.multimodal_calculator import MultimodalFreightCalculator
+
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    before = tracemalloc.take_snapshot()
+    europe = FreightCalculator()
+    asian = AsianFreightCalculator()
+    multimodal = MultimodalFreightCalculator()
+    after = tracemalloc.take_snapshot()
+
+    structures = {**data_attributes('europe', europe), **data_attributes('asia', asian),
+                  **data_attributes('multimodal', multimodal)}
+    report = memory_report(structures, args.top)
+    report['tracemalloc'] = tracemalloc_diff(before, after, args.top, 'lineno' if args.by_line else 'filename')
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+DEFAULT_ROAD_FACTOR = 1.3  # used until enough OSRM results are available
+MIN_FIT_SAMPLES = 20
+MIN_PAIR_SAMPLES = 5
+CV_FOLDS = 5
+ERROR_QUANTILE = 0.9
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; works on scalars and NumPy arrays alike."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def pair_key(country_a, country_b):
+    """Detour factors are treated as symmetric, so pairs are stored sorted."""
+    return tuple(sorted((country_a or '', country_b or '')))
+
+
+class RoadDistanceEstimator:
+    """
+    Offline road-distance estimate calibrated on cached OSRM results.
+
+    road_km = factor[country pair] * haversine   if the pair has enough samples,
+              slope * haversine + intercept       otherwise.
+
+    `error_bound` is the cross-validated 90th percentile of the relative error,
+    or None while the estimator still runs on the default factor.
+    """
+
+    def __init__(self):
+        self.slope = DEFAULT_ROAD_FACTOR
+        self.intercept = 0.0
+        self.pair_factors = {}
+        self.error_bound = None
+        self.samples = 0
+
+    @staticmethod
+    def fit_params(straight, road, pairs):
+        slope, intercept = np.polyfit(straight, road, 1)
+        pair_factors = {}
+        if pairs:
+            keys = sorted(set(pairs))
+            index = {key: i for i, key in enumerate(keys)}
+            codes = np.fromiter((index[p] for p in pairs), dtype=int, count=len(pairs))
+            ratios = road / straight
+            order = np.argsort(codes, kind='stable')
+            groups = np.split(ratios[order], np.flatnonzero(np.diff(codes[order])) + 1)
+            for key, group in zip(keys, groups):
+                if len(group) >= MIN_PAIR_SAMPLES:
+                    pair_factors[key] = float(np.median(group))
+        return float(slope), float(intercept), pair_factors
+
+    @staticmethod
+    def predict(straight, pairs, slope, intercept, pair_factors):
+        estimate = slope * straight + intercept
+        if pairs is not None and pair_factors:
+            factors = np.array([pair_factors.get(p, np.nan) for p in pairs])
+            known = ~np.isnan(factors)
+            estimate = np.where(known, factors * straight, estimate)
+        # A road is never shorter than the straight line
+        return np.maximum(estimate, straight)
+
+    def fit(self, lat1, lon1, lat2, lon2, road_km, country_pairs=None):
+        """
+        Calibrate on observed road distances.
+
+        Args:
+            lat1, lon1, lat2, lon2, road_km: array-likes of equal length
+            country_pairs (list, optional): (country_a, country_b) per sample
+        Returns:
+            RoadDistanceEstimator: self
+        """
+        straight = haversine_km(lat1, lon1, lat2, lon2)
+        road = np.asarray(road_km, dtype=float)
+        valid = (straight > 1) & (road > 0) & np.isfinite(road)
+        straight, road = straight[valid], road[valid]
+        pairs = None
+        if country_pairs is not None:
+            pairs = [pair_key(*p) for p, ok in zip(country_pairs, valid) if ok]
+
+        self.samples = len(road)
+        if self.samples < MIN_FIT_SAMPLES:
+            return self
+
+        # Cross-validated relative error gives the bound quoted to "fast" mode users
+        folds = np.arange(self.samples) % CV_FOLDS
+        errors = np.empty(self.samples)
+        for fold in range(CV_FOLDS):
+            test = folds == fold
+            train_pairs = [p for p, t in zip(pairs, test) if not t] if pairs is not None else None
+            test_pairs = [p for p, t in zip(pairs, test) if t] if pairs is not None else None
+            params = self.fit_params(straight[~test], road[~test], train_pairs)
+            predicted = self.predict(straight[test], test_pairs, *params)
+            errors[test] = np.abs(predicted - road[test]) / road[test]
+
+        self.slope, self.intercept, self.pair_factors = self.fit_params(straight, road, pairs)
+        self.error_bound = float(np.quantile(errors, ERROR_QUANTILE))
+        return self
+
+    def estimate(self, lat1, lon1, lat2, lon2, country_pairs=None):
+        """Vectorized road-distance estimate in km."""
+        straight = np.atleast_1d(haversine_km(lat1, lon1, lat2, lon2))
+        pairs = [pair_key(*p) for p in country_pairs] if country_pairs is not None else None
+        return self.predict(straight, pairs, self.slope, self.intercept, self.pair_factors)
+
+    def estimate_one(self, lat1, lon1, lat2, lon2, country_pair=None):
+        pairs = [country_pair] if country_pair else None
+        return float(self.estimate(lat1, lon1, lat2, lon2, pairs)[0])
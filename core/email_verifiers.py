@@ -1,23 +1,119 @@
+import os
 import re
+import time
+import queue
+import asyncio
+import threading
+import dns.asyncresolver
+import dns.exception
+import dns.rdatatype
 import dns.resolver
 import smtplib
+import pandas as pd
+from cachetools import TLRUCache
 from validate_email_address import validate_email
 from disposable_email_domains import blocklist
 
+from core.capture import capture_upstream
+from core.metrics import timed, cache_lookup, register_stats, CACHE_REQUESTS, UPSTREAM_ERRORS
+
 DISPOSABLE_DOMAINS = blocklist
 
+# One shared resolver with short timeouts: a slow DNS server must not stall the request
+DNS_TIMEOUT = float(os.environ.get('DNS_TIMEOUT', '1.0'))  # seconds per nameserver
+DNS_LIFETIME = float(os.environ.get('DNS_LIFETIME', '2.0'))  # seconds per lookup in total
+DNS_NAMESERVERS = os.environ.get('DNS_NAMESERVERS')  # comma-separated, system resolvers if unset
+DNS_PORT = int(os.environ.get('DNS_PORT', '53'))
+
+MX_CACHE_SIZE = 10000
+MIN_MX_TTL = 60  # seconds; very short TTLs would defeat the cache
+MAX_MX_TTL = 24 * 3600
+NEGATIVE_MX_TTL = 300  # NXDOMAIN/NoAnswer when the response carries no SOA
+BULK_DNS_CONCURRENCY = int(os.environ.get('BULK_DNS_CONCURRENCY', '50'))  # MX lookups in flight per bulk job
+BULK_RESULT_WAIT = 2 * DNS_LIFETIME + 1  # seconds without any MX result before a bulk job gives up
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[a-zA-Z0-9]+$"
+
+def make_resolver(resolver_class=dns.resolver.Resolver):
+    resolver = resolver_class()
+    resolver.timeout = DNS_TIMEOUT
+    resolver.lifetime = DNS_LIFETIME
+    if DNS_NAMESERVERS:
+        resolver.nameservers = [ns.strip() for ns in DNS_NAMESERVERS.split(',')]
+        resolver.port = DNS_PORT
+    return resolver
+
+
+resolver = make_resolver()
+
+# domain -> (has_mx, ttl); each entry expires after its own DNS TTL
+mx_cache = TLRUCache(maxsize=MX_CACHE_SIZE, ttu=lambda domain, value, now: now + value[1], timer=time.monotonic)
+mx_cache_lock = threading.Lock()
+
+def clamp_ttl(ttl):
+    return max(MIN_MX_TTL, min(MAX_MX_TTL, ttl))
+
+def negative_ttl(response):
+    """TTL for a negative answer (RFC 2308): min(SOA TTL, SOA minimum) from the authority section."""
+    if response is not None:
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return clamp_ttl(min(rrset.ttl, rrset[0].minimum))
+    return NEGATIVE_MX_TTL
+
+def mx_result(answers):
+    return len(answers) > 0, clamp_ttl(answers.rrset.ttl)
+
+def mx_error_result(error):
+    """(False, ttl) for a definitive negative answer, None for a transient failure that must not be cached."""
+    if isinstance(error, dns.resolver.NXDOMAIN):
+        return False, negative_ttl(next(iter(error.responses().values()), None))
+    if isinstance(error, dns.resolver.NoAnswer):
+        return False, negative_ttl(error.response())
+    return None
+
+def cached_mx_result(domain):
+    """Cached has_mx for `domain`, or None on a miss."""
+    with mx_cache_lock:
+        cached = mx_cache.get(domain)
+    cache_lookup('mx', cached is not None)
+    return cached[0] if cached is not None else None
+
+def cache_mx_result(domain, has_mx, ttl):
+    with mx_cache_lock:
+        mx_cache[domain] = (has_mx, ttl)
+    capture_upstream('dns', domain, [has_mx, ttl])
+
+def mx_cache_info():
+    """Counters for the metrics exporter."""
+    with mx_cache_lock:
+        size = len(mx_cache)
+    return {'hits': CACHE_REQUESTS.value('mx', 'hit'), 'misses': CACHE_REQUESTS.value('mx', 'miss'), 'size': size}
+
+register_stats('freight_mx_cache', mx_cache_info, 'MX lookup cache counter')
+
 def is_valid_syntax(email):
     """Check basic email syntax using regex."""
-    pattern = r"^[^@\s]+@[^@\s]+\.[a-zA-Z0-9]+$"
-    return re.match(pattern, email) is not None
+    return re.match(EMAIL_PATTERN, email) is not None
 
 def has_mx_record(domain):
-    """Check if domain has MX records."""
+    """Check if domain has MX records (cached for the record's TTL)."""
+    domain = domain.lower().rstrip('.')
+    cached = cached_mx_result(domain)
+    if cached is not None:
+        return cached
+
     try:
-        answers = dns.resolver.resolve(domain, "MX")
-        return len(answers) > 0
-    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.Timeout):
-        return False
+        has_mx, ttl = mx_result(resolver.resolve(domain, "MX"))
+    except dns.exception.DNSException as e:
+        result = mx_error_result(e)
+        if result is None:
+            # Transient failure (timeout, no nameservers): not cached, the next request tries again
+            UPSTREAM_ERRORS.inc('dns')
+            return False
+        has_mx, ttl = result
+
+    cache_mx_result(domain, has_mx, ttl)
+    return has_mx
 
 def is_disposable(email):
     """Check if email belongs to a disposable domain."""
@@ -29,7 +125,9 @@ def verify_email(email):
         return "❌ Invalid syntax"
 
     domain = email.split("@")[1]
-    if not has_mx_record(domain):
+    with timed('email', 'verification'):
+        has_mx = has_mx_record(domain)
+    if not has_mx:
         print("❌ No MX record")
         return False
 
@@ -39,6 +137,94 @@ def verify_email(email):
 
     return True
 
+async def resolve_mx_many(domains, on_result, concurrency=BULK_DNS_CONCURRENCY):
+    """Resolve MX records of `domains` concurrently; calls on_result(domain, has_mx) as each completes."""
+    async_resolver = make_resolver(dns.asyncresolver.Resolver)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(domain):
+        async with semaphore:
+            try:
+                has_mx, ttl = mx_result(await async_resolver.resolve(domain, "MX"))
+            except dns.exception.DNSException as e:
+                result = mx_error_result(e)
+                if result is None:
+                    UPSTREAM_ERRORS.inc('dns')
+                    on_result(domain, False)
+                    return
+                has_mx, ttl = result
+            except Exception:
+                # Every domain must report back, or the bulk job would wait forever
+                UPSTREAM_ERRORS.inc('dns')
+                on_result(domain, False)
+                return
+        cache_mx_result(domain, has_mx, ttl)
+        on_result(domain, has_mx)
+
+    await asyncio.gather(*(resolve(domain) for domain in domains))
+
+def verify_emails_bulk(emails, concurrency=BULK_DNS_CONCURRENCY):
+    """
+    Validate many addresses; yields {'index', 'email', 'valid', 'reason'} as results become known.
+
+    Syntax and disposable checks run as one vectorized pass, each distinct domain is
+    resolved once, and uncached domains are looked up concurrently. Results that need
+    no DNS come first, the rest follow in order of MX resolution.
+    """
+    frame = pd.DataFrame({'email': pd.Series(emails, dtype='object').fillna('').astype(str).str.strip()})
+    frame['syntax_ok'] = frame['email'].str.match(EMAIL_PATTERN)
+    frame['domain'] = frame['email'].str.rsplit('@', n=1).str[-1].str.lower().str.rstrip('.')
+    frame['disposable'] = frame['domain'].isin(DISPOSABLE_DOMAINS)
+
+    def results(positions, valid, reason):
+        for i in positions:
+            yield {'index': int(i), 'email': frame['email'].iat[i], 'valid': valid, 'reason': reason}
+
+    yield from results(frame.index[~frame['syntax_ok']], False, 'invalid_syntax')
+    yield from results(frame.index[frame['syntax_ok'] & frame['disposable']], False, 'disposable')
+
+    to_check = frame[frame['syntax_ok'] & ~frame['disposable']]
+    positions_by_domain = to_check.groupby('domain').indices
+    pending = []
+    for domain, positions in positions_by_domain.items():
+        has_mx = cached_mx_result(domain)
+        if has_mx is None:
+            pending.append(domain)
+        else:
+            yield from results(to_check.index[positions], has_mx, None if has_mx else 'no_mx')
+
+    if not pending:
+        return
+
+    # The lookups run on their own event loop; results are handed over as they arrive
+    resolved = queue.Queue()
+
+    def lookup():
+        try:
+            asyncio.run(resolve_mx_many(pending, lambda d, ok: resolved.put((d, ok)), concurrency))
+        except Exception as e:
+            print(f"Bulk MX lookup failed: {str(e)}")
+        finally:
+            resolved.put(None)  # the stream ends even if the lookups did not
+
+    threading.Thread(target=lookup, name='bulk-mx', daemon=True).start()
+    unresolved = set(pending)
+    while unresolved:
+        try:
+            item = resolved.get(timeout=BULK_RESULT_WAIT)
+        except queue.Empty:
+            break
+        if item is None:
+            break
+        domain, has_mx = item
+        unresolved.discard(domain)
+        yield from results(to_check.index[positions_by_domain[domain]], has_mx, None if has_mx else 'no_mx')
+
+    # Domains the lookup never reported back on
+    for domain in sorted(unresolved):
+        UPSTREAM_ERRORS.inc('dns')
+        yield from results(to_check.index[positions_by_domain[domain]], False, 'dns_error')
+
 # Test
 if __name__ == "__main__":
     test_email = "kkadenovich@gmail.com"
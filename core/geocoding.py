@@ -0,0 +1,213 @@
+"""
+Central geocoding dispatcher for Nominatim.
+
+Every geocode in the process goes through one queue so the global request
+rate stays within the Nominatim usage policy (1 request per second by default):
+
+  * a token bucket limits requests per second across all threads;
+  * a priority queue serves interactive quotes before prefetch and batch jobs;
+  * identical addresses that are already queued share one Future;
+  * resolved addresses are kept in a TTL cache.
+
+Callers get a concurrent.futures.Future resolving to (lat, lon), or None when
+the address cannot be found.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from cachetools import TTLCache
+from geopy.exc import GeocoderRateLimited, GeocoderServiceError, GeocoderTimedOut
+from geopy.geocoders import Nominatim
+
+from core.capture import capture_upstream
+from core.metrics import register_stats, UPSTREAM_ERRORS, UPSTREAM_RETRIES
+from core.ratelimit import TokenBucket
+from core.upstreams import NOMINATIM_DOMAIN, NOMINATIM_SCHEME
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BATCH = 2
+
+NOMINATIM_RPS = float(os.environ.get('NOMINATIM_RPS', '1.0'))
+NOMINATIM_USER_AGENT = "europe_freight_calculator_v3"
+GEOCODE_TIMEOUT = 10  # seconds per upstream request
+MAX_ATTEMPTS = 3
+THROTTLE_BACKOFF = 5  # seconds to pause everything after a 429 without Retry-After
+RESULT_CACHE_SIZE = 10000
+RESULT_CACHE_TTL = 24 * 3600
+
+
+class GeocodeJob:
+    def __init__(self, address, priority):
+        self.address = address
+        self.priority = priority
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class GeocodingDispatcher:
+    def __init__(self, rate=NOMINATIM_RPS, workers=1, user_agent=NOMINATIM_USER_AGENT):
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.geolocator = Nominatim(user_agent=user_agent, domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME)
+        self.results = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+        self.heap = []
+        self.jobs = {}  # address -> queued or running GeocodeJob
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.paused_until = 0.0
+        self.threads = []
+        self.counters = {
+            'requests': 0,
+            'throttled': 0,
+            'errors': 0,
+            'not_found': 0,
+            'cache_hits': 0,
+            'deduplicated': 0,
+            'queue_wait_seconds_sum': 0.0,
+            'queue_wait_seconds_count': 0,
+            'queue_wait_seconds_max': 0.0,
+        }
+
+    def count(self, name):
+        with self.condition:
+            self.counters[name] += 1
+
+    def start(self):
+        with self.condition:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.run, name=f'geocoder-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, address, priority=PRIORITY_INTERACTIVE):
+        """Queue `address` for geocoding; returns a Future of (lat, lon) or None."""
+        with self.condition:
+            if address in self.results:
+                self.counters['cache_hits'] += 1
+                future = Future()
+                future.set_result(self.results[address])
+                return future
+
+            job = self.jobs.get(address)
+            if job is not None:
+                self.counters['deduplicated'] += 1
+                if priority < job.priority:
+                    # Promote: the stale heap entry is skipped when popped
+                    job.priority = priority
+                    heapq.heappush(self.heap, (priority, next(self.sequence), job))
+                return job.future
+
+            job = GeocodeJob(address, priority)
+            self.jobs[address] = job
+            heapq.heappush(self.heap, (priority, next(self.sequence), job))
+            self.condition.notify()
+
+        self.start()
+        return job.future
+
+    def geocode(self, address, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """Blocking helper: (lat, lon), or None if not found or not resolved within `timeout`."""
+        try:
+            return self.submit(address, priority).result(timeout=timeout)
+        except Exception:
+            return None
+
+    def next_job(self):
+        with self.condition:
+            while True:
+                while not self.heap:
+                    self.condition.wait()
+                priority, _, job = heapq.heappop(self.heap)
+                if priority == job.priority and self.jobs.get(job.address) is job and not job.future.done():
+                    if job.attempts == 0:
+                        wait = time.monotonic() - job.enqueued_at
+                        self.counters['queue_wait_seconds_sum'] += wait
+                        self.counters['queue_wait_seconds_count'] += 1
+                        self.counters['queue_wait_seconds_max'] = max(self.counters['queue_wait_seconds_max'], wait)
+                    return job
+
+    def finish(self, job, coords):
+        with self.condition:
+            if coords is not None:
+                self.results[job.address] = coords
+            self.jobs.pop(job.address, None)
+        capture_upstream('nominatim', job.address, coords)
+        job.future.set_result(coords)
+
+    def requeue(self, job):
+        UPSTREAM_RETRIES.inc('nominatim')
+        with self.condition:
+            heapq.heappush(self.heap, (job.priority, next(self.sequence), job))
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            job = self.next_job()
+
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            self.bucket.acquire()
+
+            job.attempts += 1
+            self.count('requests')
+            try:
+                location = self.geolocator.geocode(job.address, timeout=GEOCODE_TIMEOUT)
+            except GeocoderRateLimited as e:
+                # Throttling is global: pause every worker, then retry the same job
+                self.count('throttled')
+                UPSTREAM_ERRORS.inc('nominatim')
+                self.paused_until = time.monotonic() + (e.retry_after or THROTTLE_BACKOFF)
+                print(f"Nominatim throttled the dispatcher, pausing for {e.retry_after or THROTTLE_BACKOFF}s")
+                self.requeue(job)
+                continue
+            except (GeocoderTimedOut, GeocoderServiceError, OSError) as e:
+                self.count('errors')
+                UPSTREAM_ERRORS.inc('nominatim')
+                print(f"Ошибка геокодирования (попытка {job.attempts}/{MAX_ATTEMPTS}): {str(e)}")
+                if job.attempts < MAX_ATTEMPTS:
+                    self.requeue(job)
+                else:
+                    self.finish(job, None)
+                continue
+            except Exception as e:
+                self.count('errors')
+                UPSTREAM_ERRORS.inc('nominatim')
+                print(f"Ошибка геокодирования: {str(e)}")
+                self.finish(job, None)
+                continue
+
+            if location is None:
+                self.count('not_found')
+                self.finish(job, None)
+            else:
+                self.finish(job, (location.latitude, location.longitude))
+
+    def cached(self, address):
+        """(lat, lon) if `address` was resolved recently, without queueing a request."""
+        with self.condition:
+            return self.results.get(address)
+
+    def queue_depth(self):
+        with self.condition:
+            return len(self.jobs)
+
+    def stats(self):
+        """Snapshot of counters for the metrics exporter."""
+        with self.condition:
+            stats = dict(self.counters)
+            stats['queue_depth'] = len(self.jobs)
+        return stats
+
+
+geocoding_dispatcher = GeocodingDispatcher()
+register_stats('freight_geocoder', geocoding_dispatcher.stats, 'Geocoding dispatcher counter')
@@ -0,0 +1,172 @@
+"""
+Background outbound mail queue.
+
+HTTP handlers enqueue an EmailMessage and return at once; one worker thread
+keeps an authenticated SMTP connection open between messages, sends whatever
+has queued up over that connection, reconnects when the server drops it and
+retries transient failures with exponential back-off.
+
+The server is configurable so the queue can be exercised against a local
+stand-in, e.g.:
+
+    python -m aiosmtpd -n -l 127.0.0.1:8025
+    SMTP_HOST=127.0.0.1 SMTP_PORT=8025 SMTP_SSL=0 SMTP_USER= python app.py
+"""
+
+import atexit
+import os
+import queue
+import smtplib
+import threading
+import time
+
+from core.metrics import timed, UPSTREAM_ERRORS, UPSTREAM_RETRIES
+
+SMTP_HOST = os.environ.get('SMTP_HOST', 'mail.tspgrupp.ee')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '465'))
+SMTP_SSL = os.environ.get('SMTP_SSL', '1') == '1'
+SMTP_TIMEOUT = 30
+MAIL_QUEUE_SIZE = 1000
+MAIL_BATCH_SIZE = 20  # messages sent per wake-up over one connection
+MAX_SEND_ATTEMPTS = 5
+RETRY_BACKOFF = 1.0  # seconds, doubled after every failed attempt
+MAX_RETRY_BACKOFF = 60.0
+IDLE_DISCONNECT = 60.0  # close the connection after this many idle seconds
+SHUTDOWN_FLUSH_TIMEOUT = 10.0
+
+
+class MailDispatcher:
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, use_ssl=SMTP_SSL, username=None, password=None,
+                 queue_size=MAIL_QUEUE_SIZE, batch_size=MAIL_BATCH_SIZE):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.connection = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.counters = {'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'connections': 0, 'rejected': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='mail-dispatcher', daemon=True)
+                self.thread.start()
+
+    def send(self, message):
+        """Queue an EmailMessage; returns False when the queue is full."""
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.count('rejected')
+            return False
+        self.count('queued')
+        self.start()
+        return True
+
+    def flush(self, timeout=None):
+        """Wait until every queued message has been sent or given up on; returns True if drained."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def connect(self):
+        if self.use_ssl:
+            connection = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.username:
+            connection.login(self.username, self.password)
+        self.count('connections')
+        return connection
+
+    def disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                self.connection.close()
+            self.connection = None
+
+    def deliver(self, message):
+        """Send one message over the shared connection, reconnecting and backing off on failure."""
+        backoff = RETRY_BACKOFF
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            try:
+                if self.connection is None:
+                    self.connection = self.connect()
+                with timed('smtp', 'send'):
+                    self.connection.send_message(message)
+                self.count('sent')
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                # Permanent for this message; the connection itself is fine
+                print(f"Mail to {message['To']} refused: {e.recipients}")
+                break
+            except smtplib.SMTPResponseException as e:
+                if 500 <= e.smtp_code < 600:
+                    print(f"Mail to {message['To']} rejected: {e.smtp_code} {e.smtp_error}")
+                    break
+                error = e
+            except (smtplib.SMTPException, OSError) as e:
+                error = e
+
+            UPSTREAM_ERRORS.inc('smtp')
+            self.disconnect()
+            if attempt < MAX_SEND_ATTEMPTS:
+                self.count('retries')
+                UPSTREAM_RETRIES.inc('smtp')
+                print(f"Mail send failed ({attempt}/{MAX_SEND_ATTEMPTS}), retrying in {backoff:.1f}s: {error}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RETRY_BACKOFF)
+
+        self.count('failed')
+        return False
+
+    def run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=IDLE_DISCONNECT)]
+            except queue.Empty:
+                self.disconnect()
+                continue
+
+            # Whatever queued up meanwhile goes out over the same connection
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for message in batch:
+                try:
+                    self.deliver(message)
+                except Exception as e:
+                    self.count('failed')
+                    print(f"Mail dispatcher error: {str(e)}")
+                finally:
+                    self.queue.task_done()
+
+    def stats(self):
+        """Snapshot of counters for the metrics exporter."""
+        with self.lock:
+            stats = dict(self.counters)
+        stats['queue_depth'] = self.queue.qsize()
+        return stats
+
+
+def flush_on_exit(dispatcher):
+    """Give queued messages a chance to go out when the process shuts down."""
+    atexit.register(lambda: dispatcher.flush(SHUTDOWN_FLUSH_TIMEOUT))
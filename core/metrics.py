@@ -0,0 +1,197 @@
+"""
+Minimal Prometheus-style metrics.
+
+Every metric holds its own lock, taken only for the few dictionary updates of
+one observation, so instrumenting a stage costs about a microsecond. Values that
+already live elsewhere (dispatcher counters, cache sizes) are read at scrape time
+through collectors instead of being mirrored on the hot path.
+
+    with timed('europe', 'geocode'):
+        ...
+
+`render()` returns the text exposition format served at /metrics.
+"""
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+COLLECTORS = []
+
+# List of (stage, seconds) while a request has asked for a timing breakdown, else None
+request_timings = ContextVar('request_timings', default=None)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{n}="{escape_label(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}  # tuple of label values -> value
+        REGISTRY.append(self)
+
+    def value(self, *labels):
+        with self.lock:
+            return self.values.get(labels, 0)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            yield self.name, format_labels(self.labelnames, labels), value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                # per-bucket (non-cumulative) counts, sum, count
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self.lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{format_value(bound)}"'
+                yield self.name + '_bucket', format_labels(self.labelnames, labels, [le]), cumulative
+            yield self.name + '_sum', format_labels(self.labelnames, labels), total
+            yield self.name + '_count', format_labels(self.labelnames, labels), count
+
+
+STAGE_SECONDS = Histogram('freight_stage_seconds', 'Latency of quote pipeline stages', ['calculator', 'stage'])
+UPSTREAM_ERRORS = Counter('freight_upstream_errors_total', 'Failed calls to upstream services', ['upstream'])
+UPSTREAM_RETRIES = Counter('freight_upstream_retries_total', 'Retried calls to upstream services', ['upstream'])
+CACHE_REQUESTS = Counter('freight_cache_requests_total', 'Cache lookups by result', ['cache', 'result'])
+
+
+class timed:
+    """Context manager recording the duration of a pipeline stage in STAGE_SECONDS.
+
+    The duration is also appended to `request_timings` when the current request collects them.
+    """
+
+    __slots__ = ('calculator', 'stage', 'start')
+
+    def __init__(self, calculator, stage):
+        self.calculator = calculator
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, self.calculator, self.stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((f'{self.calculator}-{self.stage}', elapsed))
+        return False
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+def register_collector(collector):
+    """collector() -> iterable of (name, type, help, value) read at scrape time."""
+    COLLECTORS.append(collector)
+
+
+def register_stats(prefix, stats, documentation):
+    """Expose every numeric field of a stats() snapshot as an untyped `<prefix>_<field>` sample."""
+    def collect():
+        return [(f'{prefix}_{key}', 'untyped', documentation, value)
+                for key, value in stats().items() if isinstance(value, (int, float))]
+    register_collector(collect)
+
+
+def cache_hit_ratios():
+    hits, totals = {}, {}
+    with CACHE_REQUESTS.lock:
+        for (cache, result), count in CACHE_REQUESTS.values.items():
+            totals[cache] = totals.get(cache, 0) + count
+            if result == 'hit':
+                hits[cache] = hits.get(cache, 0) + count
+    return {cache: hits.get(cache, 0) / total for cache, total in totals.items() if total}
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {format_value(value)}')
+
+    lines.append('# HELP freight_cache_hit_ratio Share of cache lookups that were hits')
+    lines.append('# TYPE freight_cache_hit_ratio gauge')
+    for cache, ratio in sorted(cache_hit_ratios().items()):
+        lines.append(f'freight_cache_hit_ratio{format_labels(["cache"], [cache])} {format_value(ratio)}')
+
+    for collector in COLLECTORS:
+        try:
+            samples = list(collector())
+        except Exception as e:
+            print(f"Metrics collector error: {str(e)}")
+            continue
+        for name, metric_type, documentation, value in samples:
+            labels = ''
+            if isinstance(value, tuple):
+                labels, value = value
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name}{labels} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
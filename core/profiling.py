@@ -0,0 +1,176 @@
+"""
+Opt-in diagnostics for slow quotes.
+
+* `?debug=timing` (or an `X-Debug: timing` header) on /api/calculate_rate_* adds a
+  Server-Timing header with the time spent in every pipeline stage measured by
+  core.metrics.timed, e.g. `europe-geocode;dur=412.3, europe-routing;dur=88.0, total;dur=503.9`.
+  Streamed quotes carry the same breakdown in the `server_timing` field of the final event.
+* PROFILE_SAMPLE_EVERY=N profiles one quote request in N. PROFILE_MODE=stack (default)
+  samples the request thread and the asyncio worker threads it offloads to every
+  PROFILE_INTERVAL seconds and writes collapsed stacks (`.folded`, for flamegraph.pl or
+  speedscope); PROFILE_MODE=cprofile writes a cProfile dump (`.pstats`) of the request thread.
+  Worker threads are shared, so concurrent requests can show up in each other's samples,
+  and a streamed quote is profiled up to its first event only.
+
+With both disabled a request pays for an endpoint check and one integer test.
+"""
+
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from time import perf_counter
+
+from flask import g, request
+
+from core.metrics import request_timings
+
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', '0'))  # 0 disables the profiler
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'stack')  # 'stack' or 'cprofile'
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.001'))  # seconds between stack samples
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join("data", "profiles"))
+PROFILED_VIEW_PREFIX = 'calculate_rate_'
+
+request_sequence = itertools.count()
+
+
+def collapse_stack(thread_name, frame):
+    """`thread;outer (file:line);...;inner (file:line)` as used by flamegraph.pl."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    names.append(thread_name)
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    suffix = '.folded'
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def sampled_threads(self):
+        # asyncio.to_thread runs on the default executor, whose threads are named asyncio_N
+        return {t.ident: t.name for t in threading.enumerate()
+                if t.ident == self.thread_id or t.name.startswith('asyncio_')}
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            threads = self.sampled_threads()
+            for ident, frame in sys._current_frames().items():
+                name = threads.get(ident)
+                if name is not None:
+                    self.counts[collapse_stack(name, frame)] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class CProfileSampler:
+    suffix = '.pstats'
+
+    def __init__(self, thread_id=None):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+
+def make_profiler(mode=PROFILE_MODE):
+    if mode == 'cprofile':
+        return CProfileSampler()
+    return StackSampler(threading.get_ident())
+
+
+def profile_path(profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint.split('.')[-1]}-{os.getpid()}"
+    return os.path.join(PROFILE_DIR, name + profiler.suffix)
+
+
+def timing_requested():
+    return request.args.get('debug') == 'timing' or request.headers.get('X-Debug') == 'timing'
+
+
+def server_timing():
+    """Server-Timing value for the current request, or None if it did not ask for one."""
+    timings = request_timings.get()
+    if timings is None or 'timing_started' not in g:
+        # Timings may also be collected for the quote log, which does not ask for the header
+        return None
+
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    entries = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in totals.items()]
+    entries.append(f'total;dur={(perf_counter() - g.timing_started) * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def start_request_diagnostics():
+    if not (request.endpoint or '').split('.')[-1].startswith(PROFILED_VIEW_PREFIX):
+        return
+
+    if timing_requested():
+        g.timing_started = perf_counter()
+        request_timings.set([])
+
+    if PROFILE_SAMPLE_EVERY and next(request_sequence) % PROFILE_SAMPLE_EVERY == 0:
+        profiler = make_profiler()
+        try:
+            profiler.start()
+        except ValueError as e:
+            # cProfile refuses to run while another profiler is active in the process
+            print(f"Profiler not started: {str(e)}")
+            return
+        g.profiler = profiler
+
+
+def finish_request_diagnostics(response):
+    timing = server_timing()
+    if timing is not None:
+        response.headers['Server-Timing'] = timing
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        try:
+            profiler.write(profile_path(profiler))
+        except OSError as e:
+            print(f"Profile not saved: {str(e)}")
+    return response
+
+
+def clear_request_diagnostics(exc=None):
+    # Worker threads are reused between requests
+    request_timings.set(None)
+
+
+def init_request_diagnostics(blueprint):
+    blueprint.before_request(start_request_diagnostics)
+    blueprint.after_request(finish_request_diagnostics)
+    blueprint.teardown_request(clear_request_diagnostics)
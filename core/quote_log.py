@@ -0,0 +1,176 @@
+"""
+Append-only audit log of issued quotes.
+
+Request threads only append a tuple to a deque, an atomic operation that
+takes no lock. A background writer wakes up every QUOTE_LOG_FLUSH_INTERVAL
+seconds, or sooner when a batch has piled up. It serializes everything
+pending, appends it to the current JSONL file and fsyncs once per batch.
+Files rotate by size and day and are named per process, so workers never
+share a file:
+
+    data/quote_log/quotes-20250101-120000-4242.jsonl
+
+One record per line:
+
+    {"ts": 1735732800.0, "endpoint": "calculate_rate_europe", "request": {...},
+     "response": {...}, "tariff_version": "5b83ea471d38", "timings": {"europe-geocode": 41.2, ...}}
+
+core.warmup reads these files to find the most requested lanes. Enable with QUOTE_LOG=1.
+"""
+
+import atexit
+import datetime
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from core.metrics import request_timings
+from core.tariffs import data_version
+
+QUOTE_LOG_ENABLED = os.environ.get('QUOTE_LOG') == '1'
+QUOTE_LOG_DIR = os.environ.get('QUOTE_LOG_DIR', os.path.join("data", "quote_log"))
+QUOTE_LOG_FLUSH_INTERVAL = float(os.environ.get('QUOTE_LOG_FLUSH_INTERVAL', '1.0'))  # seconds between fsyncs
+QUOTE_LOG_BATCH = 500  # pending records that wake the writer before the interval
+QUOTE_LOG_MAX_PENDING = 100000  # beyond this, records are dropped rather than growing memory
+QUOTE_LOG_MAX_BYTES = 64 * 1024 * 1024  # rotate after this size
+FORMAT_CHUNK = 32  # records serialized before the writer yields the GIL to request threads
+
+
+def stage_milliseconds(timings):
+    """[(stage, seconds), ...] -> {stage: total ms}"""
+    totals = {}
+    for stage, seconds in timings or ():
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return {stage: round(seconds * 1000, 3) for stage, seconds in totals.items()}
+
+
+class QuoteLog:
+    prefix = 'quotes'
+    suffix = '.jsonl'
+
+    def __init__(self, directory=QUOTE_LOG_DIR, enabled=QUOTE_LOG_ENABLED, flush_interval=QUOTE_LOG_FLUSH_INTERVAL,
+                 batch=QUOTE_LOG_BATCH, max_pending=QUOTE_LOG_MAX_PENDING, max_bytes=QUOTE_LOG_MAX_BYTES):
+        self.directory = directory
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.batch = batch
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.pending = deque()
+        self.wakeup = threading.Event()
+        self.write_lock = threading.Lock()  # the writer thread and flush() both write
+        self.start_lock = threading.Lock()
+        self.thread = None
+        self.file = None
+        self.file_day = None
+        self.dropped = 0  # updated without a lock, so approximate under contention
+        self.counters = {'written': 0, 'batches': 0, 'files': 0, 'errors': 0}
+
+    def record(self, endpoint, request, response, timings=None):
+        """Queue one quote; returns False if logging is off or the queue is full."""
+        return self.enqueue((time.time(), endpoint, request, response, timings))
+
+    def enqueue(self, item):
+        """Queue `item` for format(); serialization happens on the writer thread."""
+        if not self.enabled:
+            return False
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self.pending.append(item)
+        if self.thread is None:
+            self.start()
+        elif len(self.pending) >= self.batch:
+            self.wakeup.set()
+        return True
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None:
+                atexit.register(self.close)
+                self.thread = threading.Thread(target=self.run, name='quote-log', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.write_pending()
+            except Exception as e:
+                self.counters['errors'] += 1
+                print(f"Quote log error: {str(e)}")
+
+    def format(self, item):
+        ts, endpoint, request, response, timings = item
+        return self.encode({
+            'ts': ts,
+            'endpoint': endpoint,
+            'request': request,
+            'response': response,
+            'tariff_version': data_version()['version'],
+            'timings': stage_milliseconds(timings),
+        })
+
+    def encode(self, record):
+        return json.dumps(record, default=str, ensure_ascii=False) + '\n'
+
+    def open_file(self):
+        now = datetime.datetime.now()
+        if self.file is not None:
+            if self.file.tell() < self.max_bytes and now.date() == self.file_day:
+                return self.file
+            self.file.close()
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.prefix}-{now.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}{self.suffix}"
+        self.file = self.open_path(os.path.join(self.directory, name))
+        self.file_day = now.date()
+        self.counters['files'] += 1
+        return self.file
+
+    def open_path(self, path):
+        return open(path, 'a', encoding='utf-8')
+
+    def write_pending(self):
+        with self.write_lock:
+            # Only what is pending now: under constant load the batch must still end and fsync
+            lines = []
+            for i in range(len(self.pending)):
+                lines.append(self.format(self.pending.popleft()))
+                if i % FORMAT_CHUNK == FORMAT_CHUNK - 1:
+                    time.sleep(0)
+            if not lines:
+                return
+
+            f = self.open_file()
+            f.write(''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+            self.counters['written'] += len(lines)
+            self.counters['batches'] += 1
+
+    def flush(self):
+        """Write everything queued so far, e.g. at shutdown."""
+        if self.pending:
+            self.write_pending()
+
+    def close(self):
+        """Flush and close the current file; registered to run at exit."""
+        self.flush()
+        with self.write_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self):
+        """Snapshot of counters for the metrics exporter."""
+        return dict(self.counters, dropped=self.dropped, pending=len(self.pending))
+
+
+def collect_request_timings():
+    """before_request hook: record stage timings for the quote log even without ?debug=timing."""
+    if request_timings.get() is None:
+        request_timings.set([])
@@ -0,0 +1,292 @@
+"""Full rate cards for customer tariff sheets, priced over NumPy grids.
+
+    python -m core.ratecard europe --output europe.csv.gz
+    python -m core.ratecard europe --ldm 1,2,4,6,13.6 --months 1,7 --output europe.parquet
+    python -m core.ratecard multimodal --output multimodal.csv --workers 1
+
+Europe cards cover every region pair x LDM step x weight x month, using the
+region distance matrix. Multimodal cards cover every port pair x container type.
+Prices come from FreightCalculator.rate_grid and
+MultimodalFreightCalculator.price_freight_rate_components. Both replicate the
+scalar formulas operation for operation, so a card cell equals what
+calculate_rate or compute_freight_rate returns for the same inputs.
+
+The grid is cut into chunks of about --chunk-rows rows. A process pool prices,
+formats and compresses the chunks, and they are written in order. Only a few chunks are in
+flight at a time, so memory stays bounded however large the card is. Parquet
+output needs pyarrow.
+"""
+
+import argparse
+import gzip
+import importlib.util
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_LDM_STEPS = [float(x) for x in np.arange(1.0, 14.0, 0.5)] + [13.6]  # 13.6 m: a full trailer
+DEFAULT_WEIGHTS = [500, 1000, 2000, 3000, 4500, 6000, 8000, 12000, 18000, 24000]
+DEFAULT_MONTHS = list(range(1, 13))
+CHUNK_ROWS = 500000
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+GZIP_LEVEL = 6  # level 9 takes four times longer for 10% smaller files
+
+worker_tables = None  # set in each pool process by init_worker
+
+
+def init_worker(tables):
+    global worker_tables
+    worker_tables = tables
+
+
+def region_column(codes, categories):
+    """Categorical column: the codes are ints, the strings are stored once."""
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def europe_chunk(tables, task):
+    """Rows for origin regions x destination regions of `task`, every LDM, weight and month."""
+    origins, destinations, ldm, weights, months = task
+    from calculators.europe_calculator import DENSITY_FACTOR, FreightCalculator
+
+    from_ids = np.asarray(origins)[:, None, None, None, None]
+    to_ids = np.asarray(destinations)[None, :, None, None, None]
+    ldm = np.asarray(ldm, dtype=float)[None, None, :, None, None]
+    weight = np.asarray(weights, dtype=float)[None, None, None, :, None]
+    month = np.asarray(months)[None, None, None, None, :]
+
+    distance = tables['distance'][from_ids, to_ids]
+    rate = FreightCalculator.rate_grid(tables, ldm, weight, from_ids, to_ids, month, distance_km=distance)
+    shape = rate.shape
+
+    def column(values):
+        return np.broadcast_to(values, shape).ravel()
+
+    return pd.DataFrame({
+        'from_region': region_column(column(from_ids), tables['region_codes']),
+        'to_region': region_column(column(to_ids), tables['region_codes']),
+        'distance': column(np.round(distance, 2)),
+        'ldm': column(ldm),
+        'weight': column(weight),
+        'chargeable_ldm': column(np.round(np.maximum(ldm, weight / DENSITY_FACTOR), 2)),
+        'month': column(month),
+        'rate': rate.ravel(),
+    })
+
+
+def multimodal_chunk(tables, task):
+    """Rows for origin ports of `task` x every other port x every container type."""
+    origins = task
+    from calculators.multimodal_calculator import MultimodalFreightCalculator
+
+    destinations = np.arange(len(tables['port_ids']))
+    components = MultimodalFreightCalculator.freight_rate_components(tables, origins, destinations)
+    prices = MultimodalFreightCalculator.price_freight_rate_components(components)
+    shape = prices['total_rate'].shape
+
+    origin_ids = np.broadcast_to(np.asarray(origins)[:, None, None], shape).ravel()
+    destination_ids = np.broadcast_to(destinations[None, :, None], shape).ravel()
+    keep = origin_ids != destination_ids
+    container_ids = np.broadcast_to(np.arange(shape[2])[None, None, :], shape).ravel()[keep]
+    port_regions = tables['port_regions']
+
+    def column(values, decimals=0):
+        return np.round(values, decimals).ravel()[keep]
+
+    return pd.DataFrame({
+        'origin': region_column(origin_ids[keep], tables['port_ids']),
+        'destination': region_column(destination_ids[keep], tables['port_ids']),
+        'origin_region': region_column(port_regions[origin_ids[keep]], tables['regions']),
+        'destination_region': region_column(port_regions[destination_ids[keep]], tables['regions']),
+        'container_type': region_column(container_ids, tables['container_types']),
+        'distance': column(components['distance'], 2),
+        'base_rate': column(prices['base_rate']),
+        'adjusted_rate': column(prices['adjusted_rate']),
+        'fuel_surcharge': column(prices['fuel_surcharge']),
+        'eco_charge_origin': column(components['eco_charge_origin']),
+        'eco_charge_destination': column(components['eco_charge_destination']),
+        'congestion_charge_origin': column(components['congestion_charge_origin']),
+        'congestion_charge_destination': column(components['congestion_charge_destination']),
+        'total_rate': column(prices['total_rate']),
+    })
+
+
+CHUNK_BUILDERS = {'europe': europe_chunk, 'multimodal': multimodal_chunk}
+
+
+def csv_text(frame):
+    """The text of frame.to_csv(index=False, header=False), about 7x faster.
+
+    A card repeats few distinct values per column, so each one is formatted once and
+    rows are joined from the formatted values.
+    """
+    columns = []
+    for name in frame.columns:
+        column = frame[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values, codes = column.cat.categories, column.cat.codes.to_numpy()
+        else:
+            codes, values = pd.factorize(column.to_numpy())
+        text = np.array([repr(float(v)) if isinstance(v, float) else str(v) for v in values], dtype=object)
+        columns.append(text[codes])
+    if not columns or not len(columns[0]):
+        return ''
+    return '\n'.join(map(','.join, zip(*columns))) + '\n'
+
+
+def run_chunk(job):
+    """Pool entry point: (rows, encoded chunk) - CSV bytes, gzip-compressed for .gz, or a DataFrame for Parquet.
+
+    Formatting and compression happen here so they run in parallel; concatenated
+    gzip members are a valid gzip file.
+    """
+    kind, output_format, task = job
+    frame = CHUNK_BUILDERS[kind](worker_tables, task)
+    if output_format == 'parquet':
+        return len(frame), frame
+    data = csv_text(frame).encode('utf-8')
+    return len(frame), gzip.compress(data, GZIP_LEVEL) if output_format == 'csv.gz' else data
+
+
+def europe_tasks(tables, ldm, weights, months, chunk_rows):
+    """Blocks of origin x destination regions with about chunk_rows rows each."""
+    n = len(tables['region_codes'])
+    per_pair = len(ldm) * len(weights) * len(months)
+    destinations_per_block = max(1, min(n, chunk_rows // per_pair))
+    origins_per_block = max(1, chunk_rows // (per_pair * destinations_per_block))
+    for i in range(0, n, origins_per_block):
+        for j in range(0, n, destinations_per_block):
+            yield (np.arange(i, min(n, i + origins_per_block)), np.arange(j, min(n, j + destinations_per_block)),
+                   ldm, weights, months)
+
+
+def multimodal_tasks(tables, chunk_rows):
+    n = len(tables['port_ids'])
+    per_origin = n * len(tables['container_types'])
+    origins_per_block = max(1, chunk_rows // per_origin)
+    for i in range(0, n, origins_per_block):
+        yield np.arange(i, min(n, i + origins_per_block))
+
+
+def map_ordered(executor, fn, jobs, in_flight):
+    """executor.map that keeps at most `in_flight` results pending, so a slow writer bounds memory."""
+    pending = deque()
+    for job in jobs:
+        pending.append(executor.submit(fn, job))
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class CSVWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, 'wb')
+        header = (','.join(columns) + '\n').encode('utf-8')
+        self.file.write(gzip.compress(header, GZIP_LEVEL) if path.endswith('.gz') else header)
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, columns):
+        self.path = path
+        self.writer = None
+
+    def write(self, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def load_tables(kind):
+    if kind == 'europe':
+        from calculators.europe_calculator import FreightCalculator
+        return FreightCalculator().rate_tables()
+    from calculators.multimodal_calculator import MultimodalFreightCalculator
+    return MultimodalFreightCalculator().freight_rate_tables()
+
+
+def export(kind, output, workers=None, chunk_rows=CHUNK_ROWS, ldm=DEFAULT_LDM_STEPS, weights=DEFAULT_WEIGHTS,
+           months=DEFAULT_MONTHS):
+    """Writes the card to `output` (.csv, .csv.gz or .parquet); returns the number of rows."""
+    output_format = 'parquet' if output.endswith('.parquet') else 'csv.gz' if output.endswith('.gz') else 'csv'
+    tables = load_tables(kind)
+    if kind == 'europe':
+        tasks = europe_tasks(tables, ldm, weights, months, chunk_rows)
+    else:
+        tasks = multimodal_tasks(tables, chunk_rows)
+    jobs = ((kind, output_format, task) for task in tasks)
+
+    # Column names from an empty chunk, so the CSV header is written before any worker returns
+    empty = (np.arange(0), np.arange(0), ldm, weights, months) if kind == 'europe' else np.arange(0)
+    columns = list(CHUNK_BUILDERS[kind](tables, empty).columns)
+    writer = (ParquetWriter if output_format == 'parquet' else CSVWriter)(output, columns)
+
+    workers = workers or os.cpu_count() or 1
+    rows = 0
+    start = time.perf_counter()
+
+    def write(results):
+        nonlocal rows
+        for count, chunk in results:
+            writer.write(chunk)
+            rows += count
+
+    try:
+        if workers == 1:
+            init_worker(tables)
+            write(map(run_chunk, jobs))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(tables,)) as executor:
+                write(map_ordered(executor, run_chunk, jobs, workers * CHUNKS_IN_FLIGHT_PER_WORKER))
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{rows} rows written to {output} in {elapsed:.1f} s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+    return rows
+
+
+def number_list(text, cast=float):
+    return [cast(x) for x in text.split(',') if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('kind', choices=sorted(CHUNK_BUILDERS))
+    parser.add_argument('--output', required=True, help='.csv, .csv.gz or .parquet')
+    parser.add_argument('--workers', type=int, default=None, help='pricing processes (default: all CPUs)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='rows priced and written per chunk')
+    parser.add_argument('--ldm', type=number_list, default=DEFAULT_LDM_STEPS, help='Europe: comma-separated LDM steps')
+    parser.add_argument('--weights', type=number_list, default=DEFAULT_WEIGHTS, help='Europe: comma-separated weights, kg')
+    parser.add_argument('--months', type=lambda text: number_list(text, int), default=DEFAULT_MONTHS,
+                        help='Europe: comma-separated months 1-12')
+    args = parser.parse_args()
+
+    if args.output.endswith('.parquet') and importlib.util.find_spec('pyarrow') is None:
+        parser.error('Parquet output needs pyarrow (pip install pyarrow); use .csv or .csv.gz')
+    if any(not 1 <= month <= 12 for month in args.months):
+        parser.error('months must be between 1 and 12')
+
+    export(args.kind, args.output, args.workers, args.chunk_rows, args.ldm, args.weights, args.months)
+
+
+if __name__ == '__main__':
+    main()
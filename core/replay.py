@@ -0,0 +1,270 @@
+"""Replay captured /api traffic offline, answering Nominatim, OSRM and DNS from the capture.
+
+    CAPTURE=1 gunicorn app:app ...                      # record, see core.capture
+    python -m core.replay data/capture/*.jsonl.gz --cold --concurrency 4
+
+Requests are sent through the Flask test client in captured order, back to back,
+so the run measures the app itself rather than the network or the original pacing.
+An upstream call the capture has no answer for counts as a miss and is answered
+"not found"; a capture started on warm caches shows misses under --cold.
+The on-disk caches are read but never written.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Before the app is imported: nothing recorded while replaying, no Nominatim usage policy to honour
+os.environ['CAPTURE'] = '0'
+os.environ['QUOTE_LOG'] = '0'
+os.environ.setdefault('NOMINATIM_RPS', '100000')
+
+import dns.exception
+import dns.name
+import dns.resolver
+
+OSRM_ROUTE_MARKER = '/route/v1/'
+
+
+def read_records(opener, path):
+    """Records of one capture file; a file whose writer was killed ends early instead of failing."""
+    with opener(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # a line cut short mid-write
+        except EOFError:
+            print(f"{path}: truncated, read up to the last complete batch")
+
+
+def read_capture(paths):
+    """(requests in captured order, {service: {key: value}})"""
+    requests_, upstreams = [], {'nominatim': {}, 'osrm': {}, 'dns': {}}
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        for record in read_records(opener, path):
+            if record.get('kind') == 'request':
+                requests_.append(record)
+            elif record.get('kind') == 'upstream':
+                key = record['key']
+                if record['service'] == 'osrm':
+                    key = tuple(tuple(coord) for coord in key)
+                upstreams[record['service']][key] = record['value']
+    requests_.sort(key=lambda r: r['ts'])  # several worker files interleave
+    return requests_, upstreams
+
+
+class Misses:
+    def __init__(self):
+        self.counts = {'nominatim': 0, 'osrm': 0, 'dns': 0}
+
+    def add(self, service):
+        self.counts[service] += 1
+
+
+class Location:
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class ReplayGeocoder:
+    """Stands in for geopy's Nominatim in the geocoding dispatcher."""
+
+    def __init__(self, answers, misses):
+        self.answers = answers
+        self.misses = misses
+
+    def geocode(self, address, timeout=None):
+        if address not in self.answers:
+            self.misses.add('nominatim')
+            return None
+        coords = self.answers[address]
+        return Location(*coords) if coords is not None else None
+
+
+class ReplayResponse:
+    def __init__(self, data):
+        self.status_code = 200
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class ReplayHTTP:
+    """Stands in for the `requests` module of the calculators; answers OSRM /route calls."""
+
+    RequestException = OSError  # asian_calculator catches requests.RequestException
+
+    def __init__(self, answers, misses):
+        self.answers = answers
+        self.misses = misses
+
+    def get(self, url, timeout=None):
+        from core.routing import coordinate_key
+
+        path = url.split(OSRM_ROUTE_MARKER, 1)[1].split('/', 1)[1].split('?', 1)[0]
+        (lon1, lat1), (lon2, lat2) = (point.split(',') for point in path.split(';'))
+        key = (coordinate_key((lat1, lon1)), coordinate_key((lat2, lon2)))
+        distance_km = self.answers.get(key)
+        if distance_km is None:
+            self.misses.add('osrm')
+            return ReplayResponse({'code': 'NoRoute', 'routes': []})
+        return ReplayResponse({'code': 'Ok', 'routes': [{'distance': distance_km * 1000}]})
+
+
+class ReplayAnswer:
+    class RRset:
+        def __init__(self, ttl):
+            self.ttl = ttl
+
+    def __init__(self, has_mx, ttl):
+        self.has_mx = has_mx
+        self.rrset = self.RRset(ttl)
+
+    def __len__(self):
+        return 1 if self.has_mx else 0
+
+
+class ReplayResolver:
+    """Stands in for the dnspython resolvers of core.email_verifiers."""
+
+    def __init__(self, answers, misses):
+        self.answers = answers
+        self.misses = misses
+
+    def answer(self, domain):
+        domain = str(domain).lower().rstrip('.')
+        if domain not in self.answers:
+            self.misses.add('dns')
+            raise dns.exception.Timeout()
+        has_mx, ttl = self.answers[domain]
+        if not has_mx:
+            raise dns.resolver.NXDOMAIN(qnames=[dns.name.from_text(domain)], responses={})
+        return ReplayAnswer(has_mx, ttl)
+
+    def resolve(self, domain, rdtype='MX'):
+        return self.answer(domain)
+
+
+class AsyncReplayResolver(ReplayResolver):
+    async def resolve(self, domain, rdtype='MX'):
+        return self.answer(domain)
+
+
+def install(upstreams, misses):
+    """Swap the network clients of the loaded app for replay fakes."""
+    import api
+    import calculators.asian_calculator
+    import calculators.europe_calculator
+    from core import email_verifiers
+    from core.geocoding import geocoding_dispatcher
+    from core.routing import distance_cache
+
+    distance_cache.save = lambda: None
+    api.europe_freight_calculator.save_geocode_cache = lambda: None
+
+    geocoding_dispatcher.geolocator = ReplayGeocoder(upstreams['nominatim'], misses)
+    http = ReplayHTTP(upstreams['osrm'], misses)
+    calculators.europe_calculator.requests = http
+    calculators.asian_calculator.requests = http
+    email_verifiers.resolver = ReplayResolver(upstreams['dns'], misses)
+    email_verifiers.make_resolver = lambda resolver_class=None: AsyncReplayResolver(upstreams['dns'], misses)
+
+
+def forget_network_results():
+    """Empty every cache that stands in front of an upstream, as after a restart with no cache files."""
+    import api
+    from core import email_verifiers
+    from core.geocoding import geocoding_dispatcher
+    from core.routing import distance_cache
+
+    api.europe_freight_calculator.geocode_cache.clear()
+    with geocoding_dispatcher.condition:
+        geocoding_dispatcher.results.clear()
+    with distance_cache.lock:
+        distance_cache.distances.clear()
+    with email_verifiers.mx_cache_lock:
+        email_verifiers.mx_cache.clear()
+    with api.multimodal_freight_calculator.quote_cache_lock:
+        api.multimodal_freight_calculator.quote_cache.clear()
+
+
+def send(client, record):
+    """(status, seconds) of one captured request, including the streamed body."""
+    start = time.perf_counter()
+    response = client.open(record['path'], method=record['method'], query_string=record['args'],
+                           json=record['body'])
+    response.get_data()
+    return response.status_code, time.perf_counter() - start
+
+
+def replay(requests_, concurrency=1):
+    from app import app
+
+    def run(record):
+        return send(app.test_client(), record)
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(run, requests_))
+    else:
+        client = app.test_client()
+        results = [send(client, record) for record in requests_]
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed, misses):
+    latencies = sorted(seconds for _, seconds in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    count = len(latencies)
+    return {
+        'requests': count,
+        'elapsed': elapsed,
+        'throughput': count / elapsed if elapsed else 0.0,
+        'p50': statistics.median(latencies) if latencies else None,
+        'p99': latencies[min(count - 1, int(count * 0.99))] if latencies else None,
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+        'upstream_misses': dict(misses.counts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='capture files written with CAPTURE=1')
+    parser.add_argument('--cold', action='store_true', help='start with empty geocode, distance, MX and quote caches')
+    parser.add_argument('--concurrency', type=int, default=1, help='parallel test clients (default: sequential)')
+    parser.add_argument('--output', help='write the summary as JSON')
+    args = parser.parse_args()
+
+    requests_, upstreams = read_capture(args.files)
+    print(f"{len(requests_)} requests, " + ', '.join(f"{len(v)} {k} answers" for k, v in upstreams.items()))
+
+    misses = Misses()
+    install(upstreams, misses)
+    if args.cold:
+        forget_network_results()
+
+    results, elapsed = replay(requests_, args.concurrency)
+    summary = summarize(results, elapsed, misses)
+    if summary['requests']:
+        print(f"{summary['requests']} requests in {elapsed:.2f} s, {summary['throughput']:.1f} req/s, "
+              f"p50 {summary['p50'] * 1000:.2f} ms, p99 {summary['p99'] * 1000:.2f} ms")
+    print(f"statuses {summary['statuses']}, upstream misses {summary['upstream_misses']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import atexit
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+import requests
+
+from core.capture import capture_upstream
+from core.metrics import register_collector
+from core.upstreams import OSRM_URL
+
+DISTANCE_CACHE_FILE = os.path.join("data", "distance_cache.pkl")
+# Public OSRM servers reject /table requests with more than 100 coordinates
+TABLE_MAX_COORDINATES = int(os.environ.get('OSRM_TABLE_MAX_COORDINATES', '100'))
+TABLE_TIMEOUT = 30
+SAVE_DELAY = 30  # seconds; misses within this window are written to disk together
+
+
+def coordinate_key(coord):
+    """Cache key for a (lat, lon) pair; 5 decimals is ~1 m, well below routing precision."""
+    return (round(float(coord[0]), 5), round(float(coord[1]), 5))
+
+
+class DistanceCache:
+    """Road distances in km keyed by (origin, destination) coordinate keys, persisted with pickle.
+
+    save() only marks the cache dirty; the file is written at most every
+    SAVE_DELAY seconds and at exit, atomically, so several workers sharing the
+    file never see it half-written.
+    """
+
+    def __init__(self, path=DISTANCE_CACHE_FILE, save_delay=SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
+        self.distances = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.timer = None
+        self.load()
+        atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self.distances)
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'rb') as f:
+            return pickle.load(f)
+
+    def load(self):
+        try:
+            self.distances = self.read()
+            if self.distances:
+                print(f"Загружено {len(self.distances)} кэшированных расстояний")
+        except Exception as e:
+            print(f"Ошибка загрузки кэша расстояний: {str(e)}")
+            self.distances = {}
+
+    def save(self):
+        """Schedules a write of the cache; cheap enough for the request path."""
+        with self.lock:
+            self.dirty = True
+            if self.timer is not None:
+                return
+            self.timer = threading.Timer(self.save_delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Writes the cache now if save() was called since the last write."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            self.dirty = False
+            snapshot = dict(self.distances)
+        try:
+            # Entries another worker wrote since we loaded are kept; ours win on conflict
+            try:
+                snapshot = {**self.read(), **snapshot}
+            except Exception:
+                pass
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.distance_cache.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(snapshot, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            print(f"Ошибка сохранения кэша расстояний: {str(e)}")
+            with self.lock:
+                self.dirty = True
+
+    def get(self, origin, destination):
+        return self.distances.get((coordinate_key(origin), coordinate_key(destination)))
+
+    def put(self, origin, destination, distance_km):
+        key = (coordinate_key(origin), coordinate_key(destination))
+        with self.lock:
+            self.distances[key] = distance_km
+        capture_upstream('osrm', key, distance_km)
+
+    def update(self, entries):
+        """Bulk insert of {(origin_key, destination_key): km}."""
+        with self.lock:
+            self.distances.update(entries)
+        for key, distance_km in entries.items():
+            capture_upstream('osrm', key, distance_km)
+
+
+distance_cache = DistanceCache()
+register_collector(lambda: [('freight_distance_cache_entries', 'gauge', 'Cached road distances', len(distance_cache))])
+
+
+class OSRMTableClient:
+    """Distance matrices from the OSRM /table service, chunked to the server's coordinate limit."""
+
+    def __init__(self, base_url=OSRM_URL, max_coordinates=TABLE_MAX_COORDINATES, cache=distance_cache,
+                 timeout=TABLE_TIMEOUT, rate_limiter=None):
+        self.base_url = base_url
+        self.max_coordinates = max_coordinates
+        self.cache = cache
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter  # e.g. core.ratelimit.TokenBucket for background jobs
+        self.session = requests.Session()
+
+    def fetch_block(self, sources, destinations):
+        """One /table request; returns a len(sources) x len(destinations) km array (NaN = no route)."""
+        coords = list(sources) + list(destinations)
+        path = ';'.join(f"{lon},{lat}" for lat, lon in coords)
+        source_ids = ';'.join(str(i) for i in range(len(sources)))
+        destination_ids = ';'.join(str(i) for i in range(len(sources), len(coords)))
+        url = (f"{self.base_url}/table/v1/driving/{path}"
+               f"?sources={source_ids}&destinations={destination_ids}&annotations=distance")
+
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('code') != 'Ok':
+            raise ValueError(f"OSRM table error: {data.get('code')} {data.get('message', '')}")
+
+        # null -> NaN: OSRM returns null for unreachable pairs
+        return np.array(data['distances'], dtype=float) / 1000
+
+    def block_sizes(self, n_sources, n_destinations):
+        """Split the coordinate budget of one request between sources and destinations."""
+        half = self.max_coordinates // 2
+        if n_sources <= half:
+            return n_sources, min(n_destinations, self.max_coordinates - n_sources)
+        if n_destinations <= half:
+            return min(n_sources, self.max_coordinates - n_destinations), n_destinations
+        return half, self.max_coordinates - half
+
+    def table(self, sources, destinations):
+        """Full N x M km matrix for arbitrary sizes, fetched block by block."""
+        sources = [tuple(c) for c in sources]
+        destinations = [tuple(c) for c in destinations]
+        matrix = np.full((len(sources), len(destinations)), np.nan)
+        if not sources or not destinations:
+            return matrix
+
+        rows, cols = self.block_sizes(len(sources), len(destinations))
+        for i in range(0, len(sources), rows):
+            for j in range(0, len(destinations), cols):
+                matrix[i:i + rows, j:j + cols] = self.fetch_block(sources[i:i + rows], destinations[j:j + cols])
+        return matrix
+
+    def warm_lanes(self, lanes, save=True):
+        """
+        Fill the distance cache for (origin, destination) coordinate lanes.
+
+        Only lanes missing from the cache are requested, and only blocks of the
+        origin x destination grid that contain at least one such lane are fetched.
+        Returns the number of distances added to the cache.
+        """
+        missing = {
+            (coordinate_key(o), coordinate_key(d))
+            for o, d in lanes
+            if self.cache.get(o, d) is None
+        }
+        if not missing:
+            return 0
+
+        sources = sorted({o for o, _ in missing})
+        destinations = sorted({d for _, d in missing})
+        source_pos = {c: i for i, c in enumerate(sources)}
+        destination_pos = {c: j for j, c in enumerate(destinations)}
+        wanted = np.zeros((len(sources), len(destinations)), dtype=bool)
+        for o, d in missing:
+            wanted[source_pos[o], destination_pos[d]] = True
+
+        rows, cols = self.block_sizes(len(sources), len(destinations))
+        added = {}
+        for i in range(0, len(sources), rows):
+            for j in range(0, len(destinations), cols):
+                block_wanted = wanted[i:i + rows, j:j + cols]
+                if not block_wanted.any():
+                    continue
+                block_sources = sources[i:i + rows]
+                block_destinations = destinations[j:j + cols]
+                try:
+                    block = self.fetch_block(block_sources, block_destinations)
+                except Exception as e:
+                    print(f"OSRM table error: {str(e)}")
+                    continue
+                # Neighbouring pairs in the block come for free, so they are cached too
+                for r, c in zip(*np.nonzero(~np.isnan(block))):
+                    added[(block_sources[r], block_destinations[c])] = float(block[r, c])
+
+        self.cache.update(added)
+        if save and added:
+            self.cache.save()
+        return len(added)
@@ -0,0 +1,123 @@
+"""
+Nearest-neighbour search over latitude/longitude points.
+
+Points are mapped to 3D unit vectors, where straight-line (chord) distance is
+monotonic in great-circle distance. A plain Euclidean KD-tree over those vectors
+therefore answers haversine nearest-neighbour queries exactly, in O(log n) per
+query, without pulling in scipy or scikit-learn.
+"""
+
+import heapq
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+LEAF_SIZE = 16
+
+
+def to_unit_vectors(lats, lons):
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+class KDTree:
+    """Static KD-tree over (lat, lon) points; `query` returns great-circle distances in km."""
+
+    def __init__(self, lats, lons, leaf_size=LEAF_SIZE):
+        self.points = to_unit_vectors(lats, lons).reshape(-1, 3)
+        self.order = np.arange(len(self.points))
+        self.leaf_size = leaf_size
+        # Node arrays: [start, end) slice of self.order, split dimension (-1 = leaf), split value, children
+        self.starts, self.ends, self.dims, self.splits, self.lefts, self.rights = [], [], [], [], [], []
+        if len(self.points):
+            self.build()
+        # Points in tree order: every leaf is a contiguous slice
+        self.leaf_points = self.points[self.order]
+
+    def __len__(self):
+        return len(self.points)
+
+    def add_node(self, start, end):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.dims.append(-1)
+        self.splits.append(0.0)
+        self.lefts.append(-1)
+        self.rights.append(-1)
+        return len(self.starts) - 1
+
+    def build(self):
+        stack = [self.add_node(0, len(self.points))]
+        while stack:
+            node = stack.pop()
+            start, end = self.starts[node], self.ends[node]
+            if end - start <= self.leaf_size:
+                continue
+
+            idx = self.order[start:end]
+            coords = self.points[idx]
+            dim = int(np.argmax(coords.max(axis=0) - coords.min(axis=0)))
+            mid = (end - start) // 2
+            part = np.argpartition(coords[:, dim], mid)
+            self.order[start:end] = idx[part]
+
+            self.dims[node] = dim
+            self.splits[node] = float(self.points[self.order[start + mid], dim])
+            self.lefts[node] = self.add_node(start, start + mid)
+            self.rights[node] = self.add_node(start + mid, end)
+            stack.extend((self.lefts[node], self.rights[node]))
+
+    def query(self, lat, lon, k=1):
+        """
+        k nearest points to (lat, lon).
+
+        Returns:
+            tuple: (distances in km, indices into the original arrays), both sorted by distance
+        """
+        if not len(self.points):
+            return np.array([]), np.array([], dtype=int)
+
+        lat, lon = math.radians(lat), math.radians(lon)
+        coords = (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+        target = np.array(coords)
+        best = []  # max-heap of (-squared chord, index)
+        worst = math.inf  # squared chord of the k-th best so far
+        stack = [(0, 0.0)]  # (node, lower bound of the squared chord to the node)
+        while stack:
+            node, bound = stack.pop()
+            if bound >= worst:
+                continue
+
+            dim = self.dims[node]
+            if dim < 0:
+                start = self.starts[node]
+                squared = ((self.leaf_points[start:self.ends[node]] - target) ** 2).sum(axis=1)
+                candidates = np.flatnonzero(squared < worst)
+                if len(candidates) > k:
+                    # Only the k closest points of a leaf can enter the result
+                    candidates = candidates[np.argpartition(squared[candidates], k - 1)[:k]]
+                for i in candidates.tolist():
+                    if len(best) < k:
+                        heapq.heappush(best, (-squared[i], int(self.order[start + i])))
+                    elif squared[i] < -best[0][0]:
+                        heapq.heapreplace(best, (-squared[i], int(self.order[start + i])))
+                    if len(best) == k:
+                        worst = -best[0][0]
+                continue
+
+            diff = coords[dim] - self.splits[node]
+            near, far = (self.lefts[node], self.rights[node]) if diff < 0 else (self.rights[node], self.lefts[node])
+            # Far side first on the stack so the near side is explored first
+            plane = diff * diff
+            stack.append((far, plane if plane > bound else bound))
+            stack.append((near, bound))
+
+        best.sort(reverse=True)
+        chords = np.sqrt([-d for d, _ in best])
+        return chord_to_km(chords), np.array([i for _, i in best], dtype=int)
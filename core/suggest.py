@@ -0,0 +1,114 @@
+"""
+In-memory prefix indexes for form autocomplete.
+
+Keys are normalized (NFKD, diacritics stripped, casefolded) so "gdansk" finds
+"Gdańsk". Each index is a sorted list of keys searched with bisect; every word
+of a name is indexed too, so "peters" finds "St. Petersburg".
+"""
+
+import unicodedata
+from bisect import bisect_left
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Letters that NFKD does not decompose into a base letter + diacritic
+LETTER_FOLDS = str.maketrans({'ł': 'l', 'ø': 'o', 'đ': 'd', 'ħ': 'h', 'ı': 'i', 'æ': 'ae', 'œ': 'oe', 'þ': 'th'})
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().translate(LETTER_FOLDS).split())
+
+
+class PrefixIndex:
+    """Sorted (key, item id) pairs; `search` returns items whose key starts with the query."""
+
+    def __init__(self):
+        self.items = []
+        self.keys = []
+        self.item_ids = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def build(self, entries):
+        """
+        entries: iterable of (item, [text, ...]); items are returned as-is by `search`.
+        """
+        pairs = set()
+        self.items = []
+        for item, texts in entries:
+            item_id = len(self.items)
+            self.items.append(item)
+            for text in texts:
+                if not isinstance(text, str):
+                    continue
+                key = normalize(text)
+                if not key:
+                    continue
+                pairs.add((key, item_id))
+                words = key.split(' ')
+                for i in range(1, len(words)):
+                    pairs.add((' '.join(words[i:]), item_id))
+
+        pairs = sorted(pairs)
+        self.keys = [key for key, _ in pairs]
+        self.item_ids = [item_id for _, item_id in pairs]
+        return self
+
+    def search(self, query, limit=DEFAULT_LIMIT, predicate=None):
+        """Up to `limit` distinct items in key order; `predicate(item)` filters them."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        results = []
+        seen = set()
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and len(results) < limit and self.keys[i].startswith(prefix):
+            item_id = self.item_ids[i]
+            i += 1
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            item = self.items[item_id]
+            if predicate is None or predicate(item):
+                results.append(item)
+        return results
+
+
+def build_port_index(ports):
+    """Ports by name, UN/LOCODE and country; `ports` is MultimodalFreightCalculator.ports."""
+    return PrefixIndex().build(
+        ({'id': port_id, 'name': port['name'], 'country': port['country']},
+         [port['name'], port_id, port['country']])
+        for port_id, port in sorted(ports.items())
+    )
+
+
+def build_city_index(cities):
+    """Asian destination cities by name; `cities` is a DataFrame with city and country_code."""
+    return PrefixIndex().build(
+        ({'city': row.city, 'country_code': row.country_code}, [row.city])
+        for row in cities[['city', 'country_code']].drop_duplicates().itertuples(index=False)
+    )
+
+
+def build_postal_indexes(postal_points):
+    """
+    Per-country indexes of postal codes and place names.
+
+    postal_points: DataFrame with country_code, postal_code and place_name (GeoNames)
+    Returns:
+        dict: {country_code: PrefixIndex}
+    """
+    points = postal_points[['country_code', 'postal_code', 'place_name']].dropna(subset=['postal_code'])
+    points = points.fillna({'place_name': ''}).drop_duplicates().sort_values(['country_code', 'postal_code'])
+    indexes = {}
+    for country_code, group in points.groupby('country_code'):
+        indexes[country_code] = PrefixIndex().build(
+            ({'postal_code': row.postal_code, 'place_name': row.place_name}, [row.postal_code, row.place_name])
+            for row in group.itertuples(index=False)
+        )
+    return indexes
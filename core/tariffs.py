@@ -0,0 +1,46 @@
+"""
+Version of the tariff data the calculators were loaded from.
+
+The version is a short content hash of every rate/parameter file, so two workers
+report the same version exactly when they price with the same data. It is
+computed once per process, when the data is loaded.
+"""
+
+import hashlib
+import os
+
+TARIFF_FILES = [
+    os.path.join("data", name) for name in (
+        "europe_regions.csv", "europe_regional_rates.csv", "region_details.json", "correction_factors.json",
+        "eu_tr_base_rates_v2.csv", "backhaul_params.csv", "central_asia_cities.csv",
+        "ports.csv", "basic_rates.csv", "fuel_surcharges.csv", "ecological_charges.csv", "seasonal_factors.csv",
+        "port_congestion.csv", "crisis_coefficients.csv", "freight_indices.csv", "route_index_weights.csv",
+    )
+]
+
+_version = None
+
+
+def compute_data_version(paths=TARIFF_FILES):
+    """
+    Returns:
+        dict: {'version': 12-char sha256 prefix, 'updated_at': newest file mtime (unix seconds)}
+    """
+    digest = hashlib.sha256()
+    updated_at = 0.0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        updated_at = max(updated_at, os.path.getmtime(path))
+    return {'version': digest.hexdigest()[:12], 'updated_at': updated_at}
+
+
+def data_version():
+    global _version
+    if _version is None:
+        _version = compute_data_version()
+    return _version
@@ -0,0 +1,6 @@
+import os
+
+# Public upstream services; override to point at a self-hosted instance or a local stub
+OSRM_URL = os.environ.get('OSRM_URL', 'http://router.project-osrm.org').rstrip('/')
+NOMINATIM_DOMAIN = os.environ.get('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')
+NOMINATIM_SCHEME = os.environ.get('NOMINATIM_SCHEME', 'https')
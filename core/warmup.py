@@ -0,0 +1,219 @@
+"""
+Cache warm-up for the most likely lanes.
+
+Signals, in order of weight:
+  * the quote log (lanes customers actually asked for), when one exists;
+  * `postal_codes_count` of Europe regions from region_details.json;
+  * `popularity` of ports from expanded_ports.json.
+
+Geocodes and road distances are persisted (geocode_cache.pkl, distance_cache.pkl),
+so the command-line run warms every worker that starts afterwards:
+
+    NOMINATIM_RPS=1 python -m core.warmup --regions 20
+
+Multimodal quotes live in the calculator's in-memory cache and are only warmed by
+the background task started at boot (WARMUP_ON_BOOT=1).
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from collections import Counter
+from itertools import permutations
+
+from core.geocoding import PRIORITY_BATCH
+from core.quote_log import QUOTE_LOG_DIR
+from core.ratelimit import TokenBucket
+from core.routing import OSRMTableClient
+
+EXPANDED_PORTS_FILE = os.path.join("data", "expanded_ports.json")
+QUOTE_LOG_PATTERN = os.path.join(QUOTE_LOG_DIR, "*.jsonl")
+DEFAULT_ROUTING_RATE = 1.0
+DEFAULT_REGIONS = 20
+DEFAULT_PORTS = 25
+DEFAULT_LOG_LANES = 200
+
+
+def top_ports(available_ports, limit):
+    """Port ids ordered by `popularity`, restricted to ports the calculator knows."""
+    with open(EXPANDED_PORTS_FILE, 'r', encoding='utf-8') as f:
+        ports = json.load(f)['ports']
+    ports = [p for p in ports if p['id'] in available_ports]
+    ports.sort(key=lambda p: p.get('popularity', 0), reverse=True)
+    return [p['id'] for p in ports[:limit]]
+
+
+def top_region_locations(europe_calculator, limit, per_region=1):
+    """
+    Representative (country, postal_code) for the regions with the most postal codes.
+
+    Returns:
+        list: [(country_code, postal_code), ...]
+    """
+    regions = sorted(
+        europe_calculator.region_details.items(),
+        key=lambda item: item[1].get('postal_codes_count', 0),
+        reverse=True,
+    )[:limit]
+    wanted = {code: per_region for code, _ in regions}
+
+    locations = []
+    for info_key, info in europe_calculator.regions_dict.items():
+        region = info['region']
+        if wanted.get(region, 0) > 0:
+            wanted[region] -= 1
+            locations.append((info['country_code'], info_key.split('_', 1)[1]))
+    return locations
+
+
+def read_quote_log(pattern=QUOTE_LOG_PATTERN):
+    """Yield quote log records from every JSONL file matching `pattern`."""
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def quote_log_lanes(pattern=QUOTE_LOG_PATTERN, limit=DEFAULT_LOG_LANES):
+    """
+    Most frequent lanes from the quote log.
+
+    Returns:
+        tuple: (europe lanes [((country, postal), (country, postal)), ...],
+                multimodal lanes [(origin, destination, container_type), ...])
+    """
+    europe = Counter()
+    multimodal = Counter()
+    for record in read_quote_log(pattern):
+        request = record.get('request') or {}
+        try:
+            if record.get('endpoint') == 'calculate_rate_europe':
+                europe[((request['fromCountry'], request['fromZip']), (request['toCountry'], request['toZip']))] += 1
+            elif record.get('endpoint') == 'calculate_rate_multimodal':
+                multimodal[(request['originPort'], request['destinationPort'], request['containerType'])] += 1
+        except KeyError:
+            continue
+    return [lane for lane, _ in europe.most_common(limit)], [lane for lane, _ in multimodal.most_common(limit)]
+
+
+def location_address(europe_calculator, country_code, postal_code):
+    """Address string in the same form get_rate_of_transportation geocodes."""
+    region, place = europe_calculator.get_region_by_postal(postal_code, country_code)
+    if not region:
+        return None
+    return f"{postal_code}, {place}, {country_code}"
+
+
+def warm_geocodes(europe_calculator, addresses, stop_event=None):
+    """
+    Geocode uncached addresses at batch priority. The shared dispatcher enforces
+    the Nominatim rate limit and lets interactive quotes jump the queue.
+
+    Returns:
+        dict: {address: (lat, lon)}
+    """
+    futures = {}
+    coords = {}
+    for address in addresses:
+        if address in europe_calculator.geocode_cache:
+            coords[address] = europe_calculator.geocode_cache[address]
+        else:
+            futures[address] = europe_calculator.request_coordinates(address, PRIORITY_BATCH)
+
+    for address, future in futures.items():
+        while not future.done():
+            if stop_event and stop_event.is_set():
+                return coords
+            time.sleep(0.5)
+        if future.result():
+            coords[address] = future.result()
+    return coords
+
+
+def warm_multimodal_quotes(multimodal_calculator, ports, lanes=()):
+    """Fill the in-memory quote cache for every pair of `ports` plus explicit lanes."""
+    container_types = multimodal_calculator.list_container_types()
+    quotes = set(lanes)
+    for origin, destination in permutations(ports, 2):
+        for container_type in container_types:
+            quotes.add((origin, destination, container_type))
+    for origin, destination, container_type in quotes:
+        multimodal_calculator.calculate_freight_rate(origin, destination, container_type)
+    return len(quotes)
+
+
+def run_warmup(europe_calculator=None, multimodal_calculator=None, regions=DEFAULT_REGIONS, ports=DEFAULT_PORTS,
+               routing_rate=DEFAULT_ROUTING_RATE,
+               quote_log_pattern=QUOTE_LOG_PATTERN, stop_event=None):
+    """Warm geocodes, road distances and multimodal quotes. Returns a summary dict."""
+    summary = {}
+    europe_log_lanes, multimodal_log_lanes = quote_log_lanes(quote_log_pattern)
+
+    if europe_calculator is not None:
+        # Lanes from the log first, then every pair of the biggest regions
+        locations = top_region_locations(europe_calculator, regions)
+        lanes = list(europe_log_lanes) + list(permutations(locations, 2))
+
+        addresses = {}
+        for lane in lanes:
+            for country_code, postal_code in lane:
+                if (country_code, postal_code) not in addresses:
+                    addresses[(country_code, postal_code)] = location_address(
+                        europe_calculator, country_code, postal_code)
+
+        coords = warm_geocodes(europe_calculator, [a for a in addresses.values() if a], stop_event)
+        summary['geocodes'] = len(coords)
+
+        coordinate_lanes = []
+        for origin, destination in lanes:
+            origin_coords = coords.get(addresses.get(origin))
+            destination_coords = coords.get(addresses.get(destination))
+            if origin_coords and destination_coords and origin_coords != destination_coords:
+                coordinate_lanes.append((origin_coords, destination_coords))
+
+        if stop_event is None or not stop_event.is_set():
+            client = OSRMTableClient(rate_limiter=TokenBucket(routing_rate))
+            summary['distances'] = client.warm_lanes(coordinate_lanes)
+
+    if multimodal_calculator is not None:
+        port_ids = top_ports(multimodal_calculator.ports, ports)
+        summary['multimodal_quotes'] = warm_multimodal_quotes(multimodal_calculator, port_ids, multimodal_log_lanes)
+
+    print(f"Прогрев кэшей завершен: {summary}")
+    return summary
+
+
+def start_background_warmup(europe_calculator, multimodal_calculator, **kwargs):
+    """Run the warm-up in a daemon thread so the app can serve requests meanwhile."""
+    def target():
+        try:
+            run_warmup(europe_calculator, multimodal_calculator, **kwargs)
+        except Exception as e:
+            print(f"Ошибка прогрева кэшей: {str(e)}")
+
+    thread = threading.Thread(target=target, name='cache-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch geocodes and road distances for the most likely lanes")
+    parser.add_argument('--regions', type=int, default=DEFAULT_REGIONS, help='number of largest Europe regions')
+    parser.add_argument('--routing-rate', type=float, default=DEFAULT_ROUTING_RATE, help='OSRM /table requests per second')
+    parser.add_argument('--quote-log', default=QUOTE_LOG_PATTERN, help='glob of quote log JSONL files')
+    args = parser.parse_args()
+
+    from calculators.europe_calculator import FreightCalculator
+
+    run_warmup(FreightCalculator(), None, regions=args.regions, routing_rate=args.routing_rate,
+               quote_log_pattern=args.quote_log)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+// Reads a quote streamed as Server-Sent Events from a POST endpoint.
+//
+// onQuote(quote) is called for every event: first the instant estimate
+// (quote.precision === 'estimate'), then the refined quote ('final').
+// Endpoints answer with plain JSON for errors, which is passed through as is.
+// Resolves with the last quote received.
+async function fetchQuoteStream(url, body, onQuote) {
+    const response = await fetch(url, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(body)
+    });
+
+    const contentType = response.headers.get("Content-Type") || "";
+    if (!contentType.startsWith("text/event-stream")) {
+        const quote = await response.json();
+        if (!response.ok && !quote.error) {
+            quote.error = "Request failed";
+        }
+        onQuote(quote);
+        return quote;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let last = null;
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+
+        let end;
+        while ((end = buffer.indexOf("\n\n")) >= 0) {
+            const block = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            const data = block.split("\n")
+                .filter(line => line.startsWith("data: "))
+                .map(line => line.slice(6))
+                .join("\n");
+            if (data) {
+                last = JSON.parse(data);
+                onQuote(last);
+            }
+        }
+    }
+    return last;
+}
@@ -0,0 +1,59 @@
+// Autocomplete for form inputs backed by /api/suggest.
+//
+// options:
+//   type     - 'port', 'city' or 'postal'
+//   list     - <datalist> element bound to the input
+//   label    - item => text shown in the input once picked
+//   text     - item => optional hint shown next to the option
+//   hidden   - optional <input type="hidden"> that receives value(item) for the picked option
+//   value    - item => value written to `hidden`
+//   country  - optional () => country code used to narrow the suggestions
+function attachSuggestions(input, options) {
+    let timer = null;
+    let values = {};
+
+    function pick() {
+        if (options.hidden) {
+            options.hidden.value = values[input.value] || '';
+        }
+    }
+
+    input.addEventListener('input', function () {
+        pick();
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (!query) {
+            return;
+        }
+
+        timer = setTimeout(async function () {
+            const params = new URLSearchParams({ type: options.type, q: query, limit: 10 });
+            if (options.country) {
+                const country = options.country();
+                if (!country) {
+                    return;
+                }
+                params.set('country', country);
+            }
+
+            const response = await fetch('/api/suggest?' + params.toString());
+            if (!response.ok) {
+                return;
+            }
+            const data = await response.json();
+
+            values = {};
+            options.list.innerHTML = '';
+            for (const item of data.results) {
+                const option = document.createElement('option');
+                option.value = options.label(item);
+                if (options.text) {
+                    option.textContent = options.text(item);
+                }
+                values[option.value] = options.value ? options.value(item) : option.value;
+                options.list.appendChild(option);
+            }
+            pick();
+        }, 150);
+    });
+}